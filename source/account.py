@@ -91,11 +91,14 @@ class Account:
     def get_gains_ratio(self):
         return self.get_gains()/self.get_value()
 
+    def get_yearly_change(self):
+        return self.yearly_diff[self.account_age]
+
     def get_yearly_diff(self):
-        if self.yearly_diff[self.account_age] < 0:
-            return f"[red]{self.yearly_diff[self.account_age]:+,.2f}[/red]"
-        if self.yearly_diff[self.account_age] > 0:
-            return f"[green]{self.yearly_diff[self.account_age]:+,.2f}[/green]"
+        if self.get_yearly_change() < 0:
+            return f"[red]{self.get_yearly_change():+,.2f}[/red]"
+        if self.get_yearly_change() > 0:
+            return f"[green]{self.get_yearly_change():+,.2f}[/green]"
         return ""
 
     def withdrawal(self, needed, dry_run=False):
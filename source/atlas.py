@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+
+import numpy as np
+
+from rich.console import Console
+from rich.table import Table
+
+import cache
+import optimize
+import progress
+import sim
+import store
+
+#
+# What we keep for every point of the atlas.
+#
+FIELDS = ["years_to_wait", "roth_conversion_amount", "assets"]
+
+
+def parse_axis(text, args):
+    """
+    Parse an axis like "income=40000:160000:4", which is four incomes evenly
+    spaced from $40k to $160k. The name is any simulation argument.
+
+    Arguments that are integers, like ages, are simulated rounded (see
+    get_args_at()), so their axes are rounded too, and any points that round
+    to the same value are only kept once. That way the grid is what was
+    simulated.
+    """
+    name, _, spec = text.partition("=")
+    name = name.replace("-", "_")
+    start, stop, count = spec.split(":")
+    assert int(count) >= 1, f"{text} needs at least one point"
+    values = list(np.linspace(float(start), float(stop), int(count)))
+    if isinstance(getattr(args, name, None), int):
+        values = sorted(set(int(round(value)) for value in values))
+    return name, values
+
+
+def parse_point(text):
+    """
+    Parse a point like "income=85000,spending=35000".
+    """
+    point = {}
+    for item in text.split(","):
+        name, _, value = item.partition("=")
+        point[name.strip().replace("-", "_")] = float(value)
+    return point
+
+
+def get_args_at(args, point):
+    """
+    The arguments at a point of the atlas. Arguments that are integers, like
+    ages, are rounded.
+    """
+    for name, value in point.items():
+        if isinstance(getattr(args, name), int):
+            value = int(round(value))
+        args = optimize.with_value(args, name, value)
+    return args
+
+
+def get_atlas_key(args, axes, coarse_factor):
+    """
+    An atlas can only be resumed with the same arguments, axes, and code.
+    """
+    return cache.get_scenario_key(
+        sim.get_simulation_params(args),
+        search="atlas",
+        roth_conversion_unit=args.roth_conversion_unit,
+        axes=axes,
+        coarse_factor=coarse_factor
+    )
+
+
+def build_point(arguments):
+    """
+    Find the best years to wait and Roth conversion amount at one point of the
+    atlas, and write them into the store. This runs in a worker process.
+    """
+    args, path, index, point, coarse_factor = arguments
+    best = optimize.find_best_years_to_wait(
+        get_args_at(args, point),
+        coarse_factor=coarse_factor
+    )
+    atlas = store.ResultStore(path, mode="r+")
+    atlas.write(
+        index,
+        years_to_wait=best.get_value(),
+        roth_conversion_amount=best.get_detail().get_value(),
+        assets=best.get_objective()
+    )
+    atlas.close()
+
+
+def build(args, path, axes, coarse_factor=16, workers=None, callback=None):
+    """
+    Precompute the best years to wait, Roth conversion amount, and estate at
+    every point of a grid. The axes are a list of (argument name, values)
+    pairs, and every other argument comes from args. Each point uses the joint
+    search from optimize.find_best_years_to_wait().
+
+    If the atlas already exists, only the points it is missing are built, so an
+    interrupted build can be resumed.
+    """
+    key = get_atlas_key(args, axes, coarse_factor)
+    if store.exists(path):
+        atlas = store.ResultStore(path, mode="r+")
+        assert atlas.get_metadata()["key"] == key, (
+            f"{path} was built with different arguments, axes, or code"
+        )
+    else:
+        atlas = store.create_store(path, axes, FIELDS, metadata={
+            "key": key,
+            "args": vars(args),
+            "coarse_factor": coarse_factor,
+        })
+
+    missing = atlas.get_missing()
+    if workers == 1:
+        executor = optimize.SerialExecutor()
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(workers)
+    try:
+        for _ in executor.map(build_point, [
+            (args, path, index, atlas.get_point(index), coarse_factor)
+            for index in missing
+        ]):
+            if callback:
+                callback()
+    finally:
+        if workers != 1:
+            executor.shutdown()
+        atlas.close()
+    return len(missing)
+
+
+class Atlas:
+    """
+    This answers questions like "roughly how many years should someone like
+    this wait?" from a prebuilt atlas. The whole atlas is read into memory,
+    which is small compared to the simulations it saves, so each query only
+    costs a few lookups.
+    """
+    def __init__(self, path):
+        self.store = store.ResultStore(path)
+        self.names = self.store.get_axis_names()
+        self.axes = [self.store.get_axis(name) for name in self.names]
+        self.values = np.stack(
+            [np.asarray(self.store.read(field)) for field in FIELDS], axis=-1
+        )
+        self.corners = np.array(
+            np.meshgrid(*[[0, 1]] * len(self.axes), indexing="ij")
+        ).reshape(len(self.axes), -1).T
+
+    def get_axis_names(self):
+        return self.names
+
+    def get_metadata(self):
+        return self.store.get_metadata()
+
+    def query(self, **point):
+        """
+        Interpolate every field at a point, and say how far the point is from
+        the nearest grid point (see ResultStore.get_nearest_distance()). The
+        point needs a value for every axis, and nothing else. Points past the
+        edge of the grid are clamped to it, but the distance isn't.
+        """
+        missing = set(self.names) - set(point)
+        assert not missing, f"the point needs a value for {', '.join(sorted(missing))}"
+        unknown = set(point) - set(self.names)
+        assert not unknown, f"the atlas has no axis for {', '.join(sorted(unknown))}"
+
+        lower = np.empty(len(self.axes), dtype=int)
+        weights = np.empty(len(self.axes))
+        for dimension, (name, axis) in enumerate(zip(self.names, self.axes)):
+            value = point[name]
+            if len(axis) == 1:
+                lower[dimension] = 0
+                weights[dimension] = 0
+                continue
+            value = min(max(value, axis[0]), axis[-1])
+            i = min(max(int(np.searchsorted(axis, value)) - 1, 0), len(axis) - 2)
+            lower[dimension] = i
+            weights[dimension] = (value - axis[i]) / (axis[i + 1] - axis[i])
+
+        indexes = np.minimum(lower + self.corners, [len(a) - 1 for a in self.axes])
+        corner_weights = np.prod(
+            np.where(self.corners, weights, 1 - weights), axis=1
+        )
+        values = self.values[tuple(indexes.T)]
+        result = dict(zip(FIELDS, (corner_weights @ values).tolist()))
+        result["distance"] = float(self.store.get_nearest_distance(**point))
+        return result
+
+
+def get_query_table(point, result):
+    """
+    Show the answer to a query.
+    """
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Field")
+    table.add_column("Value", justify="right")
+    for name, value in point.items():
+        table.add_row(name.replace("_", " ").title(), f"{value:,.2f}")
+    table.add_section()
+    table.add_row("Years to Wait", f"{result['years_to_wait']:,.1f}")
+    table.add_row("Roth Conversion", f"{result['roth_conversion_amount']:,.2f}")
+    table.add_row("Assets After Death", f"{result['assets']:,.2f}")
+    table.add_row("Distance to Grid", f"{result['distance']:,.2f}")
+    return table
+
+
+def main():
+    """
+    Build an atlas, or query one.
+    """
+    parser = sim.create_parser()
+    parser.description = "Scenario Atlas"
+    parser.add_argument(
+        "--atlas",
+        help="Where the atlas is stored. Its axes are in ATLAS.json.",
+        required=True
+    )
+    parser.add_argument(
+        "--axis",
+        help=(
+            "Build the atlas over this axis, like income=40000:160000:4 for four"
+            " incomes from $40k to $160k. This option can be used multiple"
+            " times."
+        ),
+        metavar="NAME=START:STOP:COUNT",
+        action="append",
+        default=[]
+    )
+    parser.add_argument(
+        "--query",
+        help="Interpolate the atlas at a point, like income=85000,spending=35000.",
+        metavar="NAME=VALUE,...",
+        default=None
+    )
+    parser.add_argument(
+        "--coarse-factor",
+        help="How many Roth conversion units apart are the first amounts tried?",
+        required=False,
+        type=int,
+        default=16
+    )
+    parser.add_argument(
+        "--workers",
+        help="How many processes to build with. Defaults to one per CPU.",
+        required=False,
+        type=int,
+        default=None
+    )
+    args = parser.parse_args()
+
+    console = Console()
+    if args.query is not None:
+        point = parse_point(args.query)
+        atlas = Atlas(args.atlas)
+        unknown = set(point) - set(atlas.get_axis_names())
+        if unknown:
+            parser.error(f"the atlas has no axis for {', '.join(sorted(unknown))}")
+        missing = set(atlas.get_axis_names()) - set(point)
+        if missing:
+            parser.error(f"the query needs a value for {', '.join(sorted(missing))}")
+        result = atlas.query(**point)
+        console.print(get_query_table(point, result))
+        return
+
+    if not args.axis:
+        parser.error("give at least one --axis to build, or --query")
+    axes = [parse_axis(text, args) for text in args.axis]
+    for name, _ in axes:
+        if not hasattr(args, name):
+            parser.error(f"there is no argument called {name}")
+
+    size = int(np.prod([len(values) for _, values in axes]))
+    completed = 0
+    if store.exists(args.atlas):
+        completed = size - len(store.ResultStore(args.atlas).get_missing())
+    with progress.Reporter("Building:", total=size, completed=completed) as reporter:
+        built = build(
+            args,
+            args.atlas,
+            axes,
+            coarse_factor=args.coarse_factor,
+            workers=args.workers,
+            callback=reporter.advance
+        )
+    console.print(f"Built {built:,} of {size:,} points.")
+
+
+if __name__ == "__main__":
+    main()
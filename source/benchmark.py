@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+
+import argparse
+import copy
+import datetime
+import fnmatch
+import functools
+import json
+import platform
+import statistics
+import sys
+import time
+
+from rich.console import Console
+from rich.table import Table
+
+import cache
+import federal_taxes
+import memory
+import progress
+import sim
+import state_taxes
+
+from account import Account
+
+#
+# These are the scenarios we care about: the ones behind the figures in the
+# README, plus a few that stress different parts of the simulation. Each one is
+# a list of sim.py arguments.
+#
+SCENARIOS = {
+    "sim_01": [],
+    "sim_02": [
+        "--current-age=25",
+        "--income=100000",
+        "--starting-balance-trad-401k=100000",
+        "--max-contribution-percentage-401k=0.50",
+        "--employer-match-401k=0.07",
+        "--employer-contribution-hsa=750",
+        "--do-mega-backdoor-roth",
+    ],
+    "figure_01": [],
+    "figure_02": ["--starting-balance-trad-401k=100000"],
+    "figure_03": ["--current-age=25"],
+    "figure_04": ["--current-age=25", "--income=100000"],
+    "figure_05": ["--current-age=25", "--income=100000", "--spending=60000"],
+    "figure_06": [
+        "--current-age=25",
+        "--income=100000",
+        "--starting-balance-trad-401k=100000",
+    ],
+    "figure_07": ["--current-age=25", "--age-of-retirement=50"],
+    "figure_08": ["--current-age=25", "--age-of-retirement=70"],
+    "figure_09": [
+        "--current-age=25",
+        "--income=300000",
+        "--age-of-retirement=40",
+    ],
+    "figure_10": [
+        "--current-age=25",
+        "--income=300000",
+        "--age-of-retirement=60",
+    ],
+    "figure_11": [
+        "--current-age=25",
+        "--yearly-income-raise=1.20",
+        "--max-income=300000",
+    ],
+    "high_earner": [
+        "--income=400000",
+        "--work-state=CA",
+        "--retirement-state=CA",
+        "--do-mega-backdoor-roth",
+    ],
+    "early_retiree": [
+        "--current-age=30",
+        "--age-of-retirement=40",
+        "--starting-balance-taxable=500000",
+    ],
+    "large_trad": [
+        "--current-age=55",
+        "--age-of-retirement=60",
+        "--starting-balance-trad-401k=2000000",
+        "--starting-balance-trad-ira=500000",
+    ],
+}
+
+#
+# The most memory, in bytes, each memory benchmark may use at its peak. Going
+# over fails the run, even without --compare.
+#
+MEMORY_BUDGETS = {
+    "memory/simulate/*": 256 * 1024,
+    "memory/sweep/*": 1024 * 1024,
+}
+
+#
+# The Roth conversion searches whose memory is measured. Each one creates and
+# throws away a simulation for every amount it tries.
+#
+MEMORY_SWEEPS = ["sim_01"]
+
+#
+# The incomes the tax functions are timed with, from nothing to a lot.
+#
+INCOMES = [0, 12000, 25000, 50000, 85000, 150000, 300000, 750000]
+
+
+def get_scenario_args(name):
+    return sim.create_parser().parse_args(SCENARIOS[name])
+
+
+def get_unique_scenarios():
+    """
+    Scenarios with the same arguments (like sim_01 and figure_01, which are
+    both the defaults) would only time the same simulation twice, so only the
+    first of them is benchmarked. figures.py still uses all of them.
+    """
+    unique = {}
+    for name, arguments in SCENARIOS.items():
+        unique.setdefault(tuple(arguments), name)
+    return list(unique.values())
+
+
+class Benchmark:
+    """
+    This times a function. If every call needs its own state (because the
+    function changes it), prepare() makes that state, and making it isn't
+    timed.
+    """
+    def __init__(self, name, function, prepare=None):
+        self.name = name
+        self.function = function
+        self.prepare = prepare
+
+    def get_name(self):
+        return self.name
+
+    def time(self, loops):
+        """
+        Call the function this many times, and return how long it took.
+        """
+        if self.prepare:
+            states = [self.prepare() for _ in range(loops)]
+            start = time.perf_counter()
+            for state in states:
+                self.function(state)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(loops):
+            self.function()
+        return time.perf_counter() - start
+
+    def run(self, repeat=5, min_time=0.2):
+        """
+        Like timeit, find how many loops take at least min_time, then time that
+        many loops repeat times. The minimum is the best estimate of how fast
+        it can go, and the rest are just noise from the machine.
+        """
+        loops = 1
+        while self.time(loops) < min_time and loops < 1 << 20:
+            loops *= 2
+        times = [self.time(loops) / loops for _ in range(repeat)]
+        return {
+            "seconds": min(times),
+            "median": statistics.median(times),
+            "loops": loops,
+            "repeat": repeat,
+        }
+
+
+def get_simulate_benchmark(name):
+    """
+    Simulate a whole life, with no Roth conversions.
+    """
+    args = get_scenario_args(name)
+
+    def simulate():
+        sim.create_simulation(args).simulate()
+    return Benchmark(f"simulate/{name}", simulate)
+
+
+def get_simulate_year_benchmark(name, age):
+    """
+    Simulate a single year, starting from a copy of the simulation at that age.
+    The simulation up to that age is only made when the benchmark first runs,
+    so filtering it out costs nothing.
+    """
+    @functools.lru_cache(maxsize=None)
+    def get_checkpoint():
+        checkpoint = sim.create_simulation(get_scenario_args("sim_01"))
+        checkpoint.simulate_until(age)
+        return checkpoint
+
+    return Benchmark(
+        f"simulate_year/{name}",
+        lambda simulation: simulation.simulate_year(),
+        prepare=lambda: copy.deepcopy(get_checkpoint())
+    )
+
+
+def get_withdrawal_benchmark(name, dry_run):
+    """
+    Take a little out of an account with gains. The account is big enough that
+    it never runs dry.
+    """
+    account = Account("Taxable", rate_of_return=1.05, starting_balance=1e12,
+                      withdrawal_contributions_first=False)
+    account.contribute(1e12)
+    account.increment()
+    return Benchmark(
+        f"account_withdrawal/{name}",
+        lambda: account.withdrawal(12345.67, dry_run=dry_run)
+    )
+
+
+def get_federal_tax_benchmark():
+    def calculate():
+        for married in (False, True):
+            for agi in INCOMES:
+                federal_taxes.calculate_federal_income_tax(agi, married)
+    return Benchmark("federal_income_tax", calculate)
+
+
+def get_state_tax_benchmark(state):
+    def calculate():
+        for married in (False, True):
+            for agi in INCOMES:
+                state_taxes.calculate_state_tax(agi, married, state)
+    return Benchmark(f"state_tax/{state}", calculate)
+
+
+def get_heir_tax_benchmark():
+    def calculate():
+        for value in (10000, 250000, 2000000):
+            federal_taxes.calculate_minimum_remaining_tax_for_heir(value, 49)
+    return Benchmark("heir_tax", calculate)
+
+
+def get_benchmarks():
+    """
+    Every benchmark, in the order they run.
+    """
+    benchmarks = [get_simulate_benchmark(name) for name in get_unique_scenarios()]
+    benchmarks += [
+        get_simulate_year_benchmark("working", 45),
+        get_simulate_year_benchmark("retired", 65),
+        get_simulate_year_benchmark("rmds", 75),
+        get_withdrawal_benchmark("real", False),
+        get_withdrawal_benchmark("dry_run", True),
+        get_federal_tax_benchmark(),
+        get_heir_tax_benchmark(),
+    ]
+    benchmarks += [get_state_tax_benchmark(state) for state in state_taxes.states]
+    return benchmarks
+
+
+def get_memory_benchmarks():
+    """
+    Every memory benchmark, as (name, function) pairs.
+    """
+    benchmarks = []
+    for name in get_unique_scenarios():
+        args = get_scenario_args(name)
+        benchmarks.append((
+            f"memory/simulate/{name}",
+            lambda args=args: sim.create_simulation(args).simulate()
+        ))
+    for name in MEMORY_SWEEPS:
+        args = get_scenario_args(name)
+        benchmarks.append((
+            f"memory/sweep/{name}",
+            lambda args=args: sim.find_best_roth_conversion_amount(args)
+        ))
+    return benchmarks
+
+
+def measure_memory(name, function):
+    """
+    Measure the peak memory of a function, and how much it retained, with
+    tracemalloc. It is run once first, so that anything it imports or caches
+    the first time isn't counted.
+    """
+    function()
+    memory.start()
+    try:
+        with memory.measure(name):
+            function()
+        values = memory.report.get_kinds()[name]
+    finally:
+        memory.stop()
+    return {"peak": values["peak_max"], "retained": values["retained_max"]}
+
+
+def get_memory_budget(name):
+    for pattern, budget in MEMORY_BUDGETS.items():
+        if fnmatch.fnmatch(name, pattern):
+            return budget
+    return None
+
+
+def check_memory_budgets(results):
+    """
+    Every memory benchmark that went over its budget, as (name, peak, budget).
+    """
+    return [
+        (name, result["peak"], get_memory_budget(name))
+        for name, result in results.get("memory", {}).items()
+        if get_memory_budget(name) is not None
+        and result["peak"] > get_memory_budget(name)
+    ]
+
+
+def run(patterns=None, repeat=5, min_time=0.2, callback=None):
+    """
+    Run every benchmark whose name matches one of the patterns (or all of
+    them), and return the results in a form that can be written as JSON.
+    """
+    results = {}
+    for benchmark in get_benchmarks():
+        if patterns and not any(
+                fnmatch.fnmatch(benchmark.get_name(), p) for p in patterns):
+            continue
+        if callback:
+            callback(benchmark.get_name())
+        results[benchmark.get_name()] = benchmark.run(repeat, min_time)
+
+    #
+    # Memory is measured separately, because tracemalloc makes everything
+    # slower.
+    #
+    memory_results = {}
+    for name, function in get_memory_benchmarks():
+        if patterns and not any(fnmatch.fnmatch(name, p) for p in patterns):
+            continue
+        if callback:
+            callback(name)
+        memory_results[name] = measure_memory(name, function)
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "code_version": cache.get_code_version(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "results": results,
+        "memory": memory_results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Compare two runs. This returns a row for every benchmark in both, with the
+    ratio of the current time to the baseline, and whether it got slower by
+    more than the threshold (e.g. 0.1 is 10%).
+    """
+    rows = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["seconds"]
+        after = result["seconds"]
+        ratio = after / before if before else 1.0
+        rows.append((name, before, after, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def get_results_table(results):
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Benchmark")
+    table.add_column("Time", justify="right")
+    table.add_column("Median", justify="right")
+    table.add_column("Loops", justify="right")
+    for name, result in results["results"].items():
+        table.add_row(
+            name,
+            f"{result['seconds'] * 1e6:,.2f}us",
+            f"{result['median'] * 1e6:,.2f}us",
+            f"{result['loops']:,}"
+        )
+    return table
+
+
+def get_memory_table(results):
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Benchmark")
+    table.add_column("Peak", justify="right")
+    table.add_column("Retained", justify="right")
+    table.add_column("Budget", justify="right")
+    for name, result in results.get("memory", {}).items():
+        budget = get_memory_budget(name)
+        color = "red" if budget is not None and result["peak"] > budget else "white"
+        table.add_row(
+            name,
+            f"[{color}]{memory.format_size(result['peak'])}[/{color}]",
+            memory.format_size(result["retained"]),
+            memory.format_size(budget) if budget is not None else ""
+        )
+    return table
+
+
+def get_comparison_table(rows):
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Benchmark")
+    table.add_column("Baseline", justify="right")
+    table.add_column("Current", justify="right")
+    table.add_column("Ratio", justify="right")
+    for name, before, after, ratio, regressed in rows:
+        color = "red" if regressed else "green" if ratio < 1 else "white"
+        table.add_row(
+            name,
+            f"{before * 1e6:,.2f}us",
+            f"{after * 1e6:,.2f}us",
+            f"[{color}]{ratio:.2f}x[/{color}]"
+        )
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the simulator",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "--output",
+        help="Write the results to this JSON file.",
+        required=False,
+        default=None
+    )
+    parser.add_argument(
+        "--filter",
+        help=(
+            "Only run benchmarks matching this pattern, like 'state_tax/*'."
+            " This option can be used multiple times."
+        ),
+        required=False,
+        action="append",
+        default=[]
+    )
+    parser.add_argument(
+        "--repeat",
+        help="How many times to time each benchmark.",
+        required=False,
+        type=int,
+        default=5
+    )
+    parser.add_argument(
+        "--min-time",
+        help="Each timing runs enough loops to take at least this many seconds.",
+        required=False,
+        type=float,
+        default=0.2
+    )
+    parser.add_argument(
+        "--compare",
+        help=(
+            "Compare against a baseline JSON file. With --input, compare that"
+            " file instead of running the benchmarks."
+        ),
+        required=False,
+        metavar="BASELINE",
+        default=None
+    )
+    parser.add_argument(
+        "--input",
+        help="Use the results in this JSON file instead of running the benchmarks.",
+        required=False,
+        default=None
+    )
+    parser.add_argument(
+        "--threshold",
+        help="With --compare, how much slower (0.1 is 10%%) counts as a regression?",
+        required=False,
+        type=float,
+        default=0.1
+    )
+    args = parser.parse_args()
+
+    console = Console()
+    if args.input:
+        with open(args.input) as f:
+            results = json.load(f)
+    else:
+        with progress.Reporter("Benchmarking", console=console) as reporter:
+            results = run(
+                args.filter,
+                args.repeat,
+                args.min_time,
+                callback=lambda name: reporter.update("Benchmarking {}", name)
+            )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(baseline, results, args.threshold)
+        console.print(get_comparison_table(rows))
+        regressions = [row[0] for row in rows if row[4]]
+    elif results["results"]:
+        console.print(get_results_table(results))
+    if results.get("memory"):
+        console.print(get_memory_table(results))
+
+    over_budget = check_memory_budgets(results)
+    if regressions:
+        console.print(f":fire: {len(regressions)} benchmarks are more than"
+                      f" {args.threshold:.0%} slower: {', '.join(regressions)}")
+    if over_budget:
+        console.print(f":fire: {len(over_budget)} benchmarks are over their memory"
+                      f" budget: {', '.join(row[0] for row in over_budget)}")
+    if regressions or over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
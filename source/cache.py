@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import stats
+
+#
+# Where the cache lives, unless WEALTH_OPTIMIZER_CACHE says otherwise.
+#
+DEFAULT_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "wealth-optimizer", "results.sqlite3"
+)
+
+#
+# When the cache gets bigger than this, the least recently used results are
+# thrown away.
+#
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+#
+# Every row is charged this many bytes on top of its key, for the numbers and
+# SQLite's own bookkeeping.
+#
+ROW_OVERHEAD = 256
+
+#
+# The modules that can change what a simulation or search returns. Tools that
+# only run, time, draw, or report simulations (like benchmark.py or stats.py)
+# aren't here, so changing them doesn't throw away every result.
+#
+SIMULATION_MODULES = [
+    "account",
+    "federal_taxes",
+    "montecarlo",
+    "mortality",
+    "optimize",
+    "policy",
+    "sim",
+    "slet",
+    "state_taxes",
+    "ult",
+]
+
+
+@functools.lru_cache(maxsize=None)
+def get_code_version():
+    """
+    Any change to the simulation or the tax tables can change the results, and
+    the tax tables are code too. So the version is a hash of every module in
+    SIMULATION_MODULES.
+    """
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in SIMULATION_MODULES:
+        path = os.path.join(directory, f"{name}.py")
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def get_file_hash(path):
+    """
+    Inputs like a life table are files, and the name of a file doesn't tell us
+    what is in it.
+    """
+    if path is None:
+        return None
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def get_scenario_key(params, **search):
+    """
+    Hash a scenario into a key. The params are what the simulation is created
+    with (see sim.get_simulation_params()), and the search keywords describe
+    what was done with it, like the Roth conversion unit. The key changes when
+    any of them change, or when the code does.
+
+    Integers and floats that are equal hash the same, so 1000 and 1000.0 are
+    the same scenario.
+    """
+    def normalize(value):
+        if isinstance(value, bool) or value is None or isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, dict):
+            return {str(k): normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        return repr(value)
+
+    scenario = {
+        "params": normalize(params),
+        "search": normalize(search),
+        "version": get_code_version(),
+    }
+    encoded = json.dumps(scenario, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    This is a cache of results on disk, so that the same scenario doesn't need
+    to be simulated again. It is a SQLite database, which is safe to use from
+    many processes at once. With refresh, every lookup misses, so the results
+    are simulated and stored again.
+    """
+    def __init__(self, path=None, max_size=DEFAULT_MAX_SIZE, refresh=False):
+        if path is None:
+            path = os.environ.get("WEALTH_OPTIMIZER_CACHE", DEFAULT_PATH)
+        self.path = path
+        self.max_size = max_size
+        self.refresh = refresh
+        self.connection = None
+
+    def get_connection(self):
+        if self.connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=60)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " accessed REAL NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " estate REAL,"
+                " taxes REAL,"
+                " roth_conversion_amount REAL"
+                ")"
+            )
+            self.connection.commit()
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def get(self, key):
+        """
+        Look up a result. This returns None if it isn't there, otherwise a
+        dictionary with the estate, taxes, and Roth conversion amount.
+        """
+        row = None
+        if not self.refresh:
+            connection = self.get_connection()
+            row = connection.execute(
+                "SELECT estate, taxes, roth_conversion_amount"
+                " FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        if stats.collector is not None:
+            stats.collector.count(
+                "cache/result/misses" if row is None else "cache/result/hits"
+            )
+        if row is None:
+            return None
+        connection.execute(
+            "UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key)
+        )
+        connection.commit()
+        estate, taxes, roth_conversion_amount = row
+        return {
+            "estate": estate,
+            "taxes": taxes,
+            "roth_conversion_amount": roth_conversion_amount,
+        }
+
+    def put(self, key, estate, taxes, roth_conversion_amount):
+        """
+        Store a result, replacing any that was there, then make room.
+        """
+        size = len(key) + ROW_OVERHEAD
+        connection = self.get_connection()
+        #
+        # Caches made before the ledger was dropped still have a column for
+        # it, so name the columns rather than relying on how many there are.
+        #
+        connection.execute(
+            "INSERT OR REPLACE INTO results"
+            " (key, accessed, size, estate, taxes, roth_conversion_amount)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (key, time.time(), size, estate, taxes, roth_conversion_amount)
+        )
+        connection.commit()
+        self.evict()
+
+    def get_size(self):
+        row = self.get_connection().execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        return row[0]
+
+    def evict(self):
+        """
+        Throw away the least recently used results until the cache fits.
+        """
+        connection = self.get_connection()
+        excess = self.get_size() - self.max_size
+        if excess <= 0:
+            return
+        keys = []
+        for key, size in connection.execute(
+                "SELECT key, size FROM results ORDER BY accessed"):
+            keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        connection.executemany("DELETE FROM results WHERE key = ?", keys)
+        connection.commit()
+
+
+def add_arguments(parser):
+    """
+    Both sim.py and graph.py accept these.
+    """
+    parser.add_argument(
+        "--no-cache",
+        help="Don't look up or store results in the on-disk cache.",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--refresh-cache",
+        help="Simulate even if the result is cached, and store it again.",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--cache-size",
+        help="How many megabytes can the on-disk cache use?",
+        required=False,
+        type=float,
+        default=DEFAULT_MAX_SIZE / 1024 / 1024
+    )
+
+
+def from_args(args):
+    """
+    Create the cache the command line asked for, or None for --no-cache.
+    """
+    if args.no_cache:
+        return None
+    return ResultCache(
+        max_size=int(args.cache_size * 1024 * 1024),
+        refresh=args.refresh_cache
+    )
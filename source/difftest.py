@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+
+import argparse
+import concurrent.futures
+import copy
+import functools
+import os
+import pickle
+import random
+import signal
+import sys
+
+from rich.console import Console
+from rich.table import Table
+
+import ledger
+import optimize
+import progress
+import sim
+import state_taxes
+
+#
+# A scenario is a dictionary of sim.py arguments (by their names in args) that
+# differ from the defaults, plus the Roth conversion amount, which sim.py
+# searches for rather than taking as an argument.
+#
+ROTH_CONVERSION_AMOUNT = "roth_conversion_amount"
+
+#
+# How many seconds an engine gets to simulate a scenario. Some scenarios make
+# the withdrawal search loop forever, and they would hold up the whole run.
+#
+DEFAULT_TIMEOUT = 10
+
+
+class EngineTimeout(Exception):
+    pass
+
+
+################################################################################
+# Engines
+################################################################################
+
+def get_ledger(simulation):
+    """
+    The ledger as a list of years, each a dictionary of column to value, with
+    money rounded to the cent.
+    """
+    return [
+        {
+            name: round(value, 2) if isinstance(value, float) else value
+            for name, value in row.items()
+        }
+        for row in simulation.get_ledger().get_rows()
+    ]
+
+
+def get_outcome(simulation):
+    """
+    What an engine returns: the ledger, and what was left at the end.
+    """
+    summary = {
+        "Total Assets After Taxes": round(simulation.get_total_assets_after_death(), 2),
+        "Total Taxes": round(simulation.get_total_taxes(), 2),
+        "Needed to Continue": round(simulation.get_needed_to_continue(), 2),
+    }
+    return get_ledger(simulation), summary
+
+
+def run_reference(args, roth_conversion_amount):
+    """
+    The Simulation, from start to finish. Every other engine must match it.
+    """
+    simulation = sim.create_simulation(
+        args, roth_conversion_amount=roth_conversion_amount
+    )
+    simulation.simulate()
+    return get_outcome(simulation)
+
+
+def run_checkpoint(args, roth_conversion_amount):
+    """
+    How a Roth conversion search simulates: the years before retirement are
+    simulated once without a conversion, and a copy picks up from there with
+    the amount being tried.
+    """
+    checkpoint = sim.create_simulation(args)
+    checkpoint.simulate_until(checkpoint.get_age_of_retirement())
+    simulation = copy.deepcopy(checkpoint)
+    simulation.roth_conversion_amount = roth_conversion_amount
+    simulation.simulate()
+    return get_outcome(simulation)
+
+
+def run_every_age_of_death(args, roth_conversion_amount):
+    """
+    How a life table is simulated (see simulate_every_age_of_death()).
+    """
+    simulation = sim.create_simulation(
+        args, roth_conversion_amount=roth_conversion_amount
+    )
+    simulation.simulate_every_age_of_death()
+    return get_outcome(simulation)
+
+
+def run_pickled(args, roth_conversion_amount):
+    """
+    The simulation is pickled and unpickled after every year, like it is when
+    it is sent to a worker process.
+    """
+    simulation = sim.create_simulation(
+        args, roth_conversion_amount=roth_conversion_amount
+    )
+    for age in range(args.current_age, args.age_of_death + 1):
+        simulation.simulate_until(age)
+        simulation = pickle.loads(pickle.dumps(simulation))
+    simulation.simulate()
+    return get_outcome(simulation)
+
+
+#
+# Every engine takes the arguments and a Roth conversion amount, and returns
+# the ledger and the summary (see get_outcome()). A faster engine only has to
+# be added here to be tested against the reference.
+#
+ENGINES = {
+    "checkpoint": run_checkpoint,
+    "every-age-of-death": run_every_age_of_death,
+    "pickled": run_pickled,
+}
+
+
+################################################################################
+# Scenarios
+################################################################################
+
+@functools.lru_cache(maxsize=None)
+def get_defaults():
+    defaults = vars(sim.create_parser().parse_args([]))
+    defaults[ROTH_CONVERSION_AMOUNT] = 0
+    defaults["add_dependent"] = []
+    return defaults
+
+
+def generate_scenario(rng):
+    """
+    A random scenario. It covers getting married (or not), dependents, moving
+    states, catch-up ages, the mega backdoor Roth, public safety employees, and
+    when RMDs start, with ages in any order that the simulation allows.
+    """
+    current_age = rng.randint(18, 75)
+    age_of_death = rng.randint(current_age, min(current_age + 60, 100))
+    age_of_retirement = rng.randint(current_age, age_of_death + 5)
+    income = rng.choice([0, round(rng.uniform(10000, 500000))])
+    employer_match_401k = rng.choice([0, round(rng.uniform(0, 0.1), 2)])
+    states = sorted(state_taxes.states)
+    scenario = {
+        "current_age": current_age,
+        "age_of_retirement": age_of_retirement,
+        "age_of_death": age_of_death,
+        "age_of_marriage": rng.randint(18, 110),
+        "age_to_start_rmds": rng.choice([70, 72, 73, 75]),
+        "add_dependent": sorted(
+            rng.randint(current_age, current_age + 20)
+            for _ in range(rng.randint(0, 3))
+        ),
+        "work_state": rng.choice(states),
+        "retirement_state": rng.choice(states),
+        "contribution_catch_up_age_hsa": rng.randint(45, 65),
+        "contribution_catch_up_age_401k": rng.randint(45, 60),
+        "contribution_catch_up_age_ira": rng.randint(45, 60),
+        "do_mega_backdoor_roth": rng.random() < 0.5,
+        "public_safety_employee": rng.random() < 0.5,
+        "income": income,
+        "max_income": rng.choice([0, round(income * rng.uniform(1, 3))]),
+        "yearly_income_raise": round(rng.uniform(1, 1.08), 3),
+        "spending": round(rng.uniform(5000, 150000)),
+        "rate_of_return": round(rng.uniform(1, 1.1), 3),
+        "years_to_wait": rng.randint(0, max(age_of_retirement - current_age, 0)),
+        "employer_match_401k": employer_match_401k,
+        "max_contribution_percentage_401k": round(
+            rng.uniform(employer_match_401k, 1), 2
+        ),
+        "employer_contribution_hsa": rng.choice([0, round(rng.uniform(0, 3600))]),
+        ROTH_CONVERSION_AMOUNT: rng.choice([0, round(rng.uniform(0, 100000), -3)]),
+    }
+    for account in ["hsa", "taxable", "trad_401k", "trad_ira", "roth_401k", "roth_ira"]:
+        scenario[f"starting_balance_{account}"] = rng.choice(
+            [0, round(rng.uniform(0, 1000000))]
+        )
+    defaults = get_defaults()
+    return {
+        name: value for name, value in scenario.items()
+        if value != defaults[name]
+    }
+
+
+def get_args(scenario):
+    params = dict(get_defaults())
+    params.update(scenario)
+    del params[ROTH_CONVERSION_AMOUNT]
+    params["add_dependent"] = params["add_dependent"] or None
+    return argparse.Namespace(**params)
+
+
+def get_command_line(scenario):
+    """
+    The sim.py arguments for a scenario, like in benchmark.SCENARIOS.
+    """
+    arguments = []
+    for name, value in sorted(scenario.items()):
+        option = f"--{name.replace('_', '-')}"
+        if name == ROTH_CONVERSION_AMOUNT:
+            continue
+        if isinstance(value, bool):
+            arguments.append(option)
+        elif isinstance(value, list):
+            arguments += [f"{option}={item}" for item in value]
+        else:
+            arguments.append(f"{option}={value}")
+    return arguments
+
+
+################################################################################
+# Comparing
+################################################################################
+
+def run_engine(engine, scenario, timeout=DEFAULT_TIMEOUT):
+    """
+    This returns the outcome, or the error if the engine raised one or ran out
+    of time. The time limit uses a signal, so it only works on Unix, and only
+    in the main thread.
+    """
+    def expire(signum, frame):
+        raise EngineTimeout(f"took more than {timeout} seconds")
+
+    previous_handler = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return engine(get_args(scenario), scenario.get(ROTH_CONVERSION_AMOUNT, 0)), None
+    except Exception as error:
+        return None, f"{type(error).__name__}: {error}"
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def get_diffs(reference, candidate):
+    """
+    Every (age, column, reference value, engine value) that differs. The
+    summary is compared after the last year, as age "death".
+    """
+    (reference_ledger, reference_summary) = reference
+    (ledger, summary) = candidate
+    diffs = []
+    for year in range(max(len(reference_ledger), len(ledger))):
+        expected = reference_ledger[year] if year < len(reference_ledger) else {}
+        actual = ledger[year] if year < len(ledger) else {}
+        age = (expected or actual).get("age")
+        for column in list(expected) + [c for c in actual if c not in expected]:
+            if expected.get(column) != actual.get(column):
+                diffs.append((age, column, expected.get(column), actual.get(column)))
+    for name in reference_summary:
+        if reference_summary[name] != summary.get(name):
+            diffs.append(("death", name, reference_summary[name], summary.get(name)))
+    return diffs
+
+
+def compare(engine_name, scenario, timeout=DEFAULT_TIMEOUT):
+    """
+    Run the reference and an engine on a scenario. This returns "match",
+    "mismatch", "invalid" (when the reference can't simulate it, and the
+    engine fails the same way), or "timeout" (when the reference runs out of
+    time, so there is nothing to compare to), with the differences.
+    """
+    reference, reference_error = run_engine(run_reference, scenario, timeout)
+    if reference_error and reference_error.startswith(EngineTimeout.__name__):
+        return "timeout", []
+    candidate, error = run_engine(ENGINES[engine_name], scenario, timeout)
+    if reference_error:
+        if error and error.split(":")[0] == reference_error.split(":")[0]:
+            return "invalid", []
+        return "mismatch", [(None, "error", reference_error, error)]
+    if error:
+        return "mismatch", [(None, "error", None, error)]
+    diffs = get_diffs(reference, candidate)
+    return ("mismatch" if diffs else "match"), diffs
+
+
+def get_smaller_scenarios(scenario):
+    """
+    Every scenario that is one step simpler: an argument put back to its
+    default, a dependent removed, or a number halfway to its default.
+    """
+    defaults = get_defaults()
+    for name in scenario:
+        yield {key: value for key, value in scenario.items() if key != name}
+    for name, value in scenario.items():
+        if isinstance(value, list):
+            for i in range(len(value)):
+                yield {**scenario, name: value[:i] + value[i + 1:]}
+    for name, value in scenario.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        halfway = defaults[name] + (value - defaults[name]) / 2
+        if isinstance(value, int):
+            halfway = int(halfway)
+        elif abs(halfway) >= 100:
+            halfway = float(round(halfway))
+        else:
+            halfway = round(halfway, 3)
+        if halfway not in (value, defaults[name]):
+            yield {**scenario, name: halfway}
+
+
+def shrink(engine_name, scenario, limit=500, timeout=DEFAULT_TIMEOUT,
+           callback=None):
+    """
+    Make a failing scenario as simple as we can while it still fails, one step
+    at a time (see get_smaller_scenarios()), trying at most limit scenarios.
+    This returns the simplest one and its differences.
+    """
+    status, diffs = compare(engine_name, scenario, timeout)
+    assert status == "mismatch", "only a failing scenario can be shrunk"
+    tries = 0
+    shrunk = True
+    while shrunk and tries < limit:
+        shrunk = False
+        for smaller in get_smaller_scenarios(scenario):
+            tries += 1
+            if callback:
+                callback(tries)
+            status, smaller_diffs = compare(engine_name, smaller, timeout)
+            if status == "mismatch":
+                scenario, diffs = smaller, smaller_diffs
+                shrunk = True
+                break
+            if tries >= limit:
+                break
+    return scenario, diffs
+
+
+def compare_seed(engine_name, timeout, seed):
+    """
+    Compare an engine on the scenario with this seed. Every seed always makes
+    the same scenario, so a failure can be run again.
+    """
+    return compare(engine_name, generate_scenario(random.Random(seed)), timeout)
+
+
+def get_diffs_table(diffs, limit):
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Age", justify="right")
+    table.add_column("Column")
+    table.add_column("Reference", justify="right")
+    table.add_column("Engine", justify="right")
+    table.add_column("Difference", justify="right")
+
+    def format_value(value):
+        if isinstance(value, float):
+            return f"{value:,.2f}"
+        return "" if value is None else str(value)
+
+    for age, column, expected, actual in diffs[:limit]:
+        difference = ""
+        if isinstance(expected, float) and isinstance(actual, float):
+            difference = f"{actual - expected:+,.2f}"
+        table.add_row(
+            format_value(age),
+            column,
+            format_value(expected),
+            format_value(actual),
+            difference
+        )
+    if len(diffs) > limit:
+        table.add_row("", f"...and {len(diffs) - limit:,} more", "", "", "")
+    return table
+
+
+def get_results_table(results):
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Engine")
+    table.add_column("Match", justify="right")
+    table.add_column("Mismatch", justify="right")
+    table.add_column("Invalid", justify="right")
+    table.add_column("Timeout", justify="right")
+    for engine_name, counts in results.items():
+        color = "red" if counts["mismatch"] else "green"
+        table.add_row(
+            engine_name,
+            f"{counts['match']:,}",
+            f"[{color}]{counts['mismatch']:,}[/{color}]",
+            f"{counts['invalid']:,}",
+            f"{counts['timeout']:,}"
+        )
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare simulation engines against the reference",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "--engine",
+        help=(
+            "Which engine should be compared? This option can be used multiple"
+            " times. Defaults to every engine."
+        ),
+        required=False,
+        choices=ENGINES.keys(),
+        action="append",
+        default=[]
+    )
+    parser.add_argument(
+        "--scenarios",
+        help="How many random scenarios should each engine be compared on?",
+        required=False,
+        type=int,
+        default=100
+    )
+    parser.add_argument(
+        "--seed",
+        help="The seed of the first scenario. Scenario i uses seed + i.",
+        required=False,
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "--shrink-limit",
+        help="How many simpler scenarios can be tried to shrink a failure?",
+        required=False,
+        type=int,
+        default=500
+    )
+    parser.add_argument(
+        "--max-diffs",
+        help="How many differences should be shown for a failure?",
+        required=False,
+        type=int,
+        default=20
+    )
+    parser.add_argument(
+        "--timeout",
+        help="How many seconds can an engine take to simulate one scenario?",
+        required=False,
+        type=float,
+        default=DEFAULT_TIMEOUT
+    )
+    parser.add_argument(
+        "--workers",
+        help="How many processes should compare scenarios? Defaults to the number of CPUs.",
+        required=False,
+        type=int,
+        default=None
+    )
+    args = parser.parse_args()
+    engine_names = args.engine or list(ENGINES)
+
+    #
+    # The engines are compared by their ledgers, so every simulation, here and
+    # in the workers, has to keep one.
+    #
+    ledger.start()
+    workers = args.workers or os.cpu_count()
+    seeds = range(args.seed, args.seed + args.scenarios)
+
+    console = Console()
+    results = {}
+    failures = {}
+    with progress.Reporter(total=len(seeds) * len(engine_names)) as reporter:
+        #
+        # The workers are started after the reporter, so their simulations
+        # are counted too.
+        #
+        if workers == 1:
+            executor = optimize.SerialExecutor()
+        else:
+            executor = concurrent.futures.ProcessPoolExecutor(workers)
+        try:
+            for engine_name in engine_names:
+                reporter.update("Comparing {}:", engine_name)
+                counts = {"match": 0, "mismatch": 0, "invalid": 0, "timeout": 0}
+                for seed, (status, _) in zip(seeds, executor.map(
+                        functools.partial(compare_seed, engine_name, args.timeout),
+                        seeds)):
+                    counts[status] += 1
+                    if status == "mismatch":
+                        failures.setdefault(engine_name, seed)
+                    reporter.advance()
+                results[engine_name] = counts
+        finally:
+            if workers != 1:
+                executor.shutdown()
+
+    console.print(get_results_table(results))
+
+    #
+    # Shrink the first failure of each engine into a scenario small enough to
+    # debug.
+    #
+    for engine_name, seed in failures.items():
+        with progress.Reporter(
+                f"Shrinking seed {seed} for {engine_name}") as reporter:
+            scenario, diffs = shrink(
+                engine_name,
+                generate_scenario(random.Random(seed)),
+                args.shrink_limit,
+                args.timeout,
+                callback=lambda tries: reporter.update(
+                    "Shrinking seed {} for {}: {:,} tries", seed, engine_name, tries
+                )
+            )
+        console.print(
+            f":fire: {engine_name} doesn't match the reference with seed {seed}."
+            " The simplest scenario that still fails is:"
+        )
+        console.print(" ".join(get_command_line(scenario)) or "(the defaults)")
+        console.print(
+            "with a Roth conversion amount of"
+            f" {scenario.get(ROTH_CONVERSION_AMOUNT, 0):,.2f}."
+        )
+        console.print(get_diffs_table(diffs, args.max_diffs))
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
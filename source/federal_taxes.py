@@ -114,6 +114,20 @@ def get_standard_deduction(married):
     key = 'married' if married else 'single'
     return FederalIncomeTax_2021.deductions[key]
 
+def get_income_to_fill_bracket(tax_rate, married):
+    """
+    This inverts the tax brackets. It returns the most income you can have
+    before any of it is taxed above the given rate, including the standard
+    deduction. The top bracket has no limit, so there is nothing to fill.
+    """
+    key = 'married' if married else 'single'
+    brackets = FederalIncomeTax_2021.brackets[key]
+    rates = [rate for _, _, rate in brackets[:-1]]
+    assert tax_rate in rates, f"{tax_rate=} must be one of {rates}"
+    for (_, _, rate), (next_minimum, _, _) in zip(brackets, brackets[1:]):
+        if rate == tax_rate:
+            return next_minimum + get_standard_deduction(married)
+
 def calculate_fica_tax(gross_income, married):
     assert gross_income >= 0
     # This is the 2021 limit.
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+
+import argparse
+import concurrent.futures
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+
+#
+# Nothing is ever shown, so this works without a display.
+#
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from rich.console import Console
+from rich.table import Table
+
+import benchmark
+import cache
+import graph
+import optimize
+import sim
+
+#
+# Where the golden values are kept, next to the figures themselves.
+#
+DEFAULT_GOLDEN = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "figures", "golden.json"
+)
+
+#
+# Every figure in the README, what made it, and its scenario in
+# benchmark.SCENARIOS. The graphs are graph.py with --full-curve. The sims are
+# screenshots of sim.py, and sim_03 and sim_04 are the other tables from the
+# same run as sim_02, so they share its results.
+#
+FIGURES = {
+    "sim_01": ("sim", "sim_01"),
+    "sim_02": ("sim", "sim_02"),
+    "sim_03": ("sim", "sim_02"),
+    "sim_04": ("sim", "sim_02"),
+    "figure_01": ("graph", "figure_01"),
+    "figure_02": ("graph", "figure_02"),
+    "figure_03": ("graph", "figure_03"),
+    "figure_04": ("graph", "figure_04"),
+    "figure_05": ("graph", "figure_05"),
+    "figure_06": ("graph", "figure_06"),
+    "figure_07": ("graph", "figure_07"),
+    "figure_08": ("graph", "figure_08"),
+    "figure_09": ("graph", "figure_09"),
+    "figure_10": ("graph", "figure_10"),
+    "figure_11": ("graph", "figure_11"),
+}
+
+
+def get_peak_rss():
+    """
+    The most memory this process has used, in bytes. Linux reports kilobytes,
+    but macOS reports bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_timing(times):
+    """
+    Like benchmark.Benchmark.run(), the fastest time is the best estimate of how
+    fast a figure can be made, and the rest are just noise from the machine.
+    """
+    return {
+        "seconds": min(times),
+        "median": statistics.median(times),
+        "repeat": len(times),
+    }
+
+
+def simulate_cell(arguments):
+    """
+    Find the assets after death for one point of a graph, like
+    graph.my_calculation() but without the cache, and count the simulations it
+    took. This runs in a worker process, so it also says how much memory the
+    worker has used.
+    """
+    args, rate_of_return, years_to_wait = arguments
+    simulations = 0
+
+    def objective(simulation):
+        nonlocal simulations
+        simulations += 1
+        return sim.simulate_to_death(simulation)
+
+    _, simulation = sim.find_best_roth_conversion_amount(
+        args,
+        objective=objective,
+        rate_of_return=rate_of_return,
+        years_to_wait=years_to_wait
+    )
+    return simulation.get_total_assets_after_death(), simulations, get_peak_rss()
+
+
+def run_graph(name, roth_conversion_unit, workers=None, save_dir=None,
+              repeat=3):
+    """
+    Simulate every point of a graph, repeat times. The time is only the
+    simulations, not drawing the graph. Every graph gets its own workers, so
+    their peak memory is only this graph's.
+    """
+    args = graph.create_parser().parse_args(benchmark.SCENARIOS[name] + [
+        "--full-curve",
+        "--no-cache",
+        f"--roth-conversion-unit={roth_conversion_unit}",
+    ])
+    working_years = args.age_of_retirement - args.current_age
+    cells = [
+        (args, rate_of_return, years_to_wait)
+        for rate_of_return in graph.RETURN_RATES
+        for years_to_wait in range(working_years)
+    ]
+
+    times = []
+    if workers == 1:
+        executor = optimize.SerialExecutor()
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(workers)
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results = list(executor.map(simulate_cell, cells))
+            times.append(time.perf_counter() - start)
+    finally:
+        if workers != 1:
+            executor.shutdown()
+
+    estates = {f"{rate_of_return:.2f}": [] for rate_of_return in graph.RETURN_RATES}
+    for (_, rate_of_return, _), (assets, _, _) in zip(cells, results):
+        estates[f"{rate_of_return:.2f}"].append(round(assets, 2))
+
+    if save_dir:
+        curves = []
+        for rate_of_return in graph.RETURN_RATES:
+            vals = list(enumerate(estates[f"{rate_of_return:.2f}"]))
+            curves.append((rate_of_return, vals, graph.get_best_index(vals)))
+        plt.figure(figsize=(16, 9))
+        graph.plot(args, curves, graph.RETURN_RATES)
+        plt.savefig(os.path.join(save_dir, f"{name}.png"), bbox_inches="tight")
+        plt.close("all")
+
+    return {
+        **get_timing(times),
+        "simulations": sum(result[1] for result in results),
+        "peak_rss": max(result[2] for result in results),
+        "estates": estates,
+    }
+
+
+def run_sim(name, repeat=3):
+    """
+    Do what sim.py does by default, repeat times: find the best Roth conversion
+    amount, and keep the simulation that used it.
+    """
+    args = sim.create_parser().parse_args(benchmark.SCENARIOS[name] + ["--no-cache"])
+    times = []
+    for _ in range(repeat):
+        simulations = 0
+
+        def objective(simulation):
+            nonlocal simulations
+            simulations += 1
+            return sim.simulate_to_death(simulation)
+
+        start = time.perf_counter()
+        amount, simulation = sim.find_best_roth_conversion_amount(
+            args, objective=objective
+        )
+        times.append(time.perf_counter() - start)
+    return {
+        **get_timing(times),
+        "simulations": simulations,
+        "peak_rss": get_peak_rss(),
+        "estates": {
+            "roth_conversion_amount": round(amount, 2),
+            "assets_after_death": round(simulation.get_total_assets_after_death(), 2),
+            "total_taxes": round(simulation.get_total_taxes(), 2),
+        },
+    }
+
+
+def run(patterns=None, roth_conversion_unit=10000, workers=None, save_dir=None,
+        repeat=3, callback=None):
+    """
+    Make every figure whose name matches one of the patterns (or all of them),
+    and return the results in a form that can be written as JSON. Figures with
+    the same scenario are only made once.
+    """
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+    results = {}
+    made = {}
+    for name, (kind, scenario) in FIGURES.items():
+        if patterns and not any(fnmatch.fnmatch(name, p) for p in patterns):
+            continue
+        if (kind, scenario) not in made:
+            if callback:
+                callback(name)
+            if kind == "graph":
+                made[(kind, scenario)] = run_graph(
+                    scenario, roth_conversion_unit, workers, save_dir, repeat
+                )
+            else:
+                made[(kind, scenario)] = run_sim(scenario, repeat)
+        results[name] = made[(kind, scenario)]
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "code_version": cache.get_code_version(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "roth_conversion_unit": roth_conversion_unit,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(golden, current, threshold):
+    """
+    Compare a run to the golden values. This returns a row for every figure in
+    both: the golden and current results, the ratio of the fastest times,
+    whether it got slower by more than the threshold (e.g. 0.25 is 25%), and
+    whether any estate changed. Estates are compared to the cent, so a change that is only meant to
+    be faster must not change them at all.
+    """
+    rows = []
+    for name, result in current["results"].items():
+        if name not in golden["results"]:
+            continue
+        before = golden["results"][name]
+        ratio = result["seconds"] / before["seconds"] if before["seconds"] else 1.0
+        rows.append((
+            name,
+            before,
+            result,
+            ratio,
+            ratio > 1 + threshold,
+            result["estates"] != before["estates"]
+        ))
+    return rows
+
+
+def format_size(size):
+    return f"{size / 1024 / 1024:,.1f}MB"
+
+
+def get_results_table(results):
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Figure")
+    table.add_column("Time", justify="right")
+    table.add_column("Simulations", justify="right")
+    table.add_column("Peak RSS", justify="right")
+    for name, result in results["results"].items():
+        table.add_row(
+            name,
+            f"{result['seconds']:,.2f}s",
+            f"{result['simulations']:,}",
+            format_size(result["peak_rss"])
+        )
+    return table
+
+
+def get_comparison_table(rows):
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Figure")
+    table.add_column("Golden", justify="right")
+    table.add_column("Current", justify="right")
+    table.add_column("Ratio", justify="right")
+    table.add_column("Simulations", justify="right")
+    table.add_column("Peak RSS", justify="right")
+    table.add_column("Estates")
+    for name, before, after, ratio, regressed, changed in rows:
+        color = "red" if regressed else "green" if ratio < 1 else "white"
+        table.add_row(
+            name,
+            f"{before['seconds']:,.2f}s",
+            f"{after['seconds']:,.2f}s",
+            f"[{color}]{ratio:.2f}x[/{color}]",
+            f"{before['simulations']:,} -> {after['simulations']:,}",
+            f"{format_size(before['peak_rss'])} -> {format_size(after['peak_rss'])}",
+            "[red]changed[/red]" if changed else "[green]same[/green]"
+        )
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Make the README figures and compare them to golden values",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "--golden",
+        help="The JSON file with the golden values.",
+        required=False,
+        default=DEFAULT_GOLDEN
+    )
+    parser.add_argument(
+        "--update",
+        help=(
+            "Write the results of this run to the golden file, rather than"
+            " comparing them. Figures that weren't run are kept."
+        ),
+        action="store_true"
+    )
+    parser.add_argument(
+        "--figure",
+        help=(
+            "Only make figures matching this pattern, like 'figure_0*'. This"
+            " option can be used multiple times."
+        ),
+        required=False,
+        action="append",
+        default=[]
+    )
+    parser.add_argument(
+        "--save-dir",
+        help="Save the graphs as PNG files in this directory.",
+        required=False,
+        metavar="DIR",
+        default=None
+    )
+    parser.add_argument(
+        "--roth-conversion-unit",
+        help=(
+            "The Roth conversion unit for the graphs. The README figures used"
+            " 1000, which takes much longer. It must match the golden values."
+        ),
+        required=False,
+        type=float,
+        default=10000
+    )
+    parser.add_argument(
+        "--workers",
+        help="How many processes to simulate the graphs with. Defaults to one per CPU.",
+        required=False,
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        "--repeat",
+        help="How many times to make each figure. The fastest time counts.",
+        required=False,
+        type=int,
+        default=3
+    )
+    parser.add_argument(
+        "--output",
+        help="Write the results to this JSON file.",
+        required=False,
+        default=None
+    )
+    parser.add_argument(
+        "--threshold",
+        help="How much slower (0.25 is 25%%) than the golden time counts as a regression?",
+        required=False,
+        type=float,
+        default=0.25
+    )
+    args = parser.parse_args()
+
+    golden = None
+    if os.path.exists(args.golden):
+        with open(args.golden) as f:
+            golden = json.load(f)
+        if golden["roth_conversion_unit"] != args.roth_conversion_unit:
+            if not args.update:
+                parser.error(
+                    f"{args.golden} was made with --roth-conversion-unit="
+                    f"{golden['roth_conversion_unit']:g}"
+                )
+            golden = None
+
+    console = Console()
+    with console.status("Making figures") as status:
+        results = run(
+            args.figure,
+            args.roth_conversion_unit,
+            args.workers,
+            args.save_dir,
+            args.repeat,
+            callback=lambda name: status.update(f"Making {name}")
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update:
+        if golden:
+            golden["results"].update(results["results"])
+            results["results"] = {
+                name: golden["results"][name]
+                for name in FIGURES if name in golden["results"]
+            }
+        with open(args.golden, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        console.print(get_results_table(results))
+        return
+
+    if golden is None:
+        console.print(get_results_table(results))
+        console.print(f"There are no golden values in {args.golden}; use --update.")
+        return
+
+    rows = compare(golden, results, args.threshold)
+    console.print(get_comparison_table(rows))
+    changed = [row[0] for row in rows if row[5]]
+    regressions = [row[0] for row in rows if row[4]]
+    if changed:
+        console.print(f":fire: {len(changed)} figures have different estates:"
+                      f" {', '.join(changed)}")
+    if regressions:
+        console.print(f":fire: {len(regressions)} figures are more than"
+                      f" {args.threshold:.0%} slower: {', '.join(regressions)}")
+    if changed or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
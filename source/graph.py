@@ -3,124 +3,314 @@
 import argparse
 import concurrent.futures
 import itertools
+import json
+import math
+import os
 import matplotlib.pyplot as plt
 
-from rich.progress import Progress
+from rich.console import Console
+from rich.table import Table
 
+import cache
+import memory
+import metrics
+import optimize
+import profiling
+import progress
 import state_taxes
+import stats
+import store
+import tracing
+import workers
 
-from sim import Simulation
+from sim import (
+    find_best_roth_conversion_amount, get_simulation_params, simulate_to_death
+)
+
+
+#
+# The rates of return we draw a line for, and the color of each line.
+#
+RETURN_RATES = [1.01, 1.02, 1.03, 1.04, 1.05, 1.06, 1.07]
+COLORS = [
+    'tab:blue', 'tab:red', 'tab:orange', 'tab:purple',
+    'tab:brown', 'tab:olive', 'tab:cyan'
+]
+
+
+def scale(values):
+    """
+    Depending on the variables, these values can be part of a pretty wide
+    range, which looks bad. In my experience, unscaled graphs just look like
+    straight lines. I'm not really an expert in normalizing data, so I just
+    looked up "how to normalize data" and featured scaling looked right.
+
+    Link: https://en.wikipedia.org/wiki/Feature_scaling
+    """
+    def _scale(val):
+        return (val - min(values))/(max(values) - min(values))
+    return list(map(_scale, values))
+
+
+def get_best_index(vals):
+    """
+    The years to wait with the most assets.
+    """
+    best_index = 0
+    most_assets = 0
+    for index, assets in vals:
+        if assets > most_assets:
+            best_index = index
+        most_assets = max(most_assets, assets)
+    return best_index
+
+
+def plot(args, curves, return_rates):
+    """
+    Draw the graph, but don't show it. The curves are (rate, assets for every
+    years to wait, best years to wait), like get_curves() in main() yields.
+    """
+    best_indices = []
+    for rate_of_return, vals, best_index in curves:
+        color = COLORS[return_rates.index(rate_of_return) % len(COLORS)]
+        plt.plot(
+            [v[0] for v in vals],
+            scale([v[1] for v in vals]),
+            label=f"Rate of Return: {rate_of_return:.2f}",
+            linestyle='-',
+            marker=None if args.full_curve else '.',
+            color=color
+        )
+
+        while True:
+            if best_index in best_indices:
+                best_index += 0.1
+            if best_index not in best_indices:
+                break
+
+        best_indices.append(best_index)
+        plt.axvline(x=best_index, color=color, linestyle=':')
+
+    plt.xlabel("Years to Wait Before Deferring Taxes")
+    plt.ylabel("Estate At Death After Taxes")
+    plt.title("When to Start Deferring Taxes?")
+
+    rows = [
+        ["Starting Age", f"{args.current_age}"],
+        ["Age of Marriage", f"{args.age_of_marriage}"],
+        ["Age of Retirement", f"{args.age_of_retirement}"],
+        ["Age to Start RMDs", f"{args.age_to_start_rmds}"],
+        ["Age of Death", f"{args.age_of_death}"],
+        ["Current Income", f"${args.income:,.2f}"],
+        ["Max Income", f"${args.max_income:,.2f}"],
+        ["Yearly Spending", f"${args.spending:,.2f}"],
+        ["Yearly Income Raise", f"{args.yearly_income_raise:.2f}"],
+        ["HSA Starting Balance", f"${args.starting_balance_hsa:,.2f}"],
+        ["Taxable Starting Balance", f"${args.starting_balance_taxable:,.2f}"],
+        ["Trad 401k Starting Balance", f"${args.starting_balance_trad_401k:,.2f}"],
+        ["Trad IRA Starting Balance", f"${args.starting_balance_trad_ira:,.2f}"],
+        ["Roth 401k Starting Balance", f"${args.starting_balance_roth_401k:,.2f}"],
+        ["Roth IRA Starting Balance", f"${args.starting_balance_roth_ira:,.2f}"],
+        ["HSA Contribution Limit", f"${args.contribution_limit_hsa:,.2f}"],
+        ["401k Normal Contribution Limit", f"${args.contribution_limit_401k:,.2f}"],
+        ["401k Total Contribution Limit", f"${args.contribution_limit_401k_total:,.2f}"],
+        ["IRA Contribution Limit", f"${args.contribution_limit_ira:,.2f}"],
+        ["Mega-Backdoor Roth", args.do_mega_backdoor_roth],
+        ["Work State", f"{args.work_state}"],
+        ["Retirement State", f"{args.retirement_state}"],
+        ["HSA Employer Contribution", f"{args.employer_contribution_hsa}"],
+    ]
+
+    the_table = plt.table(cellText=rows, bbox=[1.05, 0.25, 0.5, 0.75])
+    the_table.auto_set_font_size(False)
+    the_table.auto_set_column_width((0, 1))
+    plt.subplots_adjust(right=0.65)
+
+    plt.legend(bbox_to_anchor=(1.041, -0.01), loc="lower left")
 
 
 def my_calculation(arguments):
     """
-    This function returns the assets after death for the given arguments.
+    This function returns the assets after death for the given arguments. The
+    result is looked up in the on-disk cache first, and stored there after.
     """
     args, rate_of_return, years_to_wait = arguments
 
+    result_cache = cache.from_args(args)
+    if result_cache is not None:
+        key = cache.get_scenario_key(
+            get_simulation_params(
+                args,
+                rate_of_return=rate_of_return,
+                years_to_wait=years_to_wait
+            ),
+            search="best-roth-conversion-amount",
+            roth_conversion_unit=args.roth_conversion_unit
+        )
+        cached = result_cache.get(key)
+        if cached is not None:
+            result_cache.close()
+            return cached["estate"]
+
     #
     # Calculate the most efficient Roth conversion amount.
     #
-    most_assets = 0
-    roth_conversion_amount = 0
-    best_roth_conversion_amount = 0
-
-    while True:
-        simulation = Simulation(
-            args.starting_balance_hsa,
-            args.starting_balance_taxable,
-            args.starting_balance_trad_401k,
-            args.starting_balance_trad_ira,
-            args.starting_balance_roth_401k,
-            args.starting_balance_roth_ira,
-            rate_of_return,
-            years_to_wait,
-            args.current_age,
-            args.age_of_retirement,
-            args.age_to_start_rmds,
-            args.age_of_death,
-            roth_conversion_amount, # this is our variable
-            args.income,
-            args.yearly_income_raise,
-            args.max_income,
-            args.age_of_marriage,
-            args.spending,
-            args.contribution_limit_hsa,
-            args.contribution_catch_up_amount_hsa,
-            args.contribution_catch_up_age_hsa,
-            args.contribution_limit_401k,
-            args.contribution_limit_401k_total,
-            args.contribution_catch_up_amount_401k,
-            args.contribution_catch_up_age_401k,
-            args.contribution_limit_ira,
-            args.contribution_catch_up_amount_ira,
-            args.contribution_catch_up_age_ira,
-            args.do_mega_backdoor_roth,
-            args.work_state,
-            args.retirement_state,
-            args.add_dependent,
-            args.public_safety_employee,
-            args.employer_match_401k,
-            args.max_contribution_percentage_401k,
-            args.employer_contribution_hsa
+    roth_conversion_amount, simulation = find_best_roth_conversion_amount(
+        args,
+        rate_of_return=rate_of_return,
+        years_to_wait=years_to_wait
+    )
+    if result_cache is not None:
+        result_cache.put(
+            key,
+            simulation.get_total_assets_after_death(),
+            simulation.get_total_taxes(),
+            roth_conversion_amount
         )
-        simulation.simulate()
+        result_cache.close()
+    return simulation.get_total_assets_after_death()
 
-        if round(simulation.get_total_assets_after_death(), 2) >= round(most_assets, 2):
-            best_roth_conversion_amount = roth_conversion_amount
-            most_assets = simulation.get_total_assets_after_death()
 
-        traditional_money = (
-            simulation.accounts.trad_401k.get_value()
-            + simulation.accounts.trad_ira.get_value()
+def find_best_pair(arguments):
+    """
+    Rather than simulating every years to wait and every Roth conversion
+    amount, search for the best pair of them. This returns the best years to
+    wait, the best Roth conversion amount, the assets after death, the assets
+    for every years to wait that was tried, and how many simulations it took.
+    """
+    args, rate_of_return = arguments
+    tried = {}
+    simulations = 0
+
+    def objective(simulation):
+        nonlocal simulations
+        simulations += 1
+        assets = simulate_to_death(simulation)
+        tried[simulation.years_to_wait] = max(
+            tried.get(simulation.years_to_wait, assets), assets
         )
-        if round(traditional_money, 2) == 0:
-            break
-        roth_conversion_amount += args.roth_conversion_unit
-
-    simulation = Simulation(
-        args.starting_balance_hsa,
-        args.starting_balance_taxable,
-        args.starting_balance_trad_401k,
-        args.starting_balance_trad_ira,
-        args.starting_balance_roth_401k,
-        args.starting_balance_roth_ira,
-        rate_of_return,
-        years_to_wait,
-        args.current_age,
-        args.age_of_retirement,
-        args.age_to_start_rmds,
-        args.age_of_death,
-        best_roth_conversion_amount,
-        args.income,
-        args.yearly_income_raise,
-        args.max_income,
-        args.age_of_marriage,
-        args.spending,
-        args.contribution_limit_hsa,
-        args.contribution_catch_up_amount_hsa,
-        args.contribution_catch_up_age_hsa,
-        args.contribution_limit_401k,
-        args.contribution_limit_401k_total,
-        args.contribution_catch_up_amount_401k,
-        args.contribution_catch_up_age_401k,
-        args.contribution_limit_ira,
-        args.contribution_catch_up_amount_ira,
-        args.contribution_catch_up_age_ira,
-        args.do_mega_backdoor_roth,
-        args.work_state,
-        args.retirement_state,
-        args.add_dependent,
-        args.public_safety_employee,
-        args.employer_match_401k,
-        args.max_contribution_percentage_401k,
-        args.employer_contribution_hsa
-    )
-    simulation.simulate()
-    return simulation.get_total_assets_after_death()
+        return assets
 
+    best = optimize.find_best_years_to_wait(
+        args,
+        objective=objective,
+        coarse_factor=args.coarse_factor,
+        rate_of_return=rate_of_return
+    )
+    return (
+        best.get_value(),
+        best.get_detail().get_value(),
+        best.get_objective(),
+        sorted(tried.items()),
+        simulations
+    )
 
-def main():
+
+def get_best_pairs_table(rows):
+    """
+    Show the best years to wait and Roth conversion amount for each rate.
+    """
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Rate of Return", justify="right")
+    table.add_column("Years to Wait", justify="right")
+    table.add_column("Roth Conversion", justify="right")
+    table.add_column("Assets After Death", justify="right")
+    table.add_column("Simulations", justify="right")
+    for rate_of_return, years_to_wait, amount, assets, simulations in rows:
+        table.add_row(
+            f"{rate_of_return:.2f}",
+            str(years_to_wait),
+            f"{amount:,.2f}",
+            f"{assets:,.2f}",
+            f"{simulations:,}"
+        )
+    return table
+
+
+def store_calculation(arguments):
+    """
+    Like my_calculation(), but write the assets after death straight into the
+    result store, rather than sending them back.
+    """
+    args, path, index, rate_of_return, years_to_wait = arguments
+    assets = my_calculation((args, rate_of_return, years_to_wait))
+    result_store = store.ResultStore(path, mode="r+")
+    result_store.write(index, assets=assets)
+    result_store.close()
+
+
+def shared_calculation(arguments):
+    """
+    Like my_calculation(), but write the assets after death into a shared
+    array that the parent allocated, rather than sending them back.
+    """
+    args, handle, index, rate_of_return, years_to_wait = arguments
+    assets = my_calculation((args, rate_of_return, years_to_wait))
+    shared = store.attach_shared_array(handle)
+    try:
+        values = shared.get_array()
+        values[index] = assets
+        del values
+    finally:
+        shared.close()
+
+
+def get_checkpoint_key(args, return_rates):
+    """
+    A checkpoint can only be resumed by the same graph: the same arguments,
+    rates, and code. The code is the simulation and this file, which decides
+    what goes in each cell.
+    """
+    return cache.get_scenario_key(
+        get_simulation_params(args),
+        search="graph-full-curve",
+        roth_conversion_unit=args.roth_conversion_unit,
+        return_rates=return_rates,
+        graph_version=cache.get_file_hash(__file__)
+    )
+
+
+def load_checkpoint(path):
+    """
+    Read a checkpoint file. It is JSON lines: the first line describes the
+    graph (its key, arguments, and rates), and every line after that is one
+    finished cell. If we crashed in the middle of writing a line, the last line
+    is incomplete (it isn't JSON, or it doesn't end with a newline), so it is
+    ignored.
+
+    This returns the description, a dictionary of (rate of return, years to
+    wait) to the assets after death, and the size in bytes of the complete
+    lines, which is where the next line should be written.
+    """
+    with open(path, "rb") as f:
+        lines = f.read().splitlines(keepends=True)
+    assert lines, f"{path} is empty"
+    header = json.loads(lines[0])
+    size = len(lines[0])
+    cells = {}
+    for number, line in enumerate(lines[1:], start=2):
+        try:
+            cell = json.loads(line)
+        except json.JSONDecodeError:
+            cell = None
+        if cell is None or not line.endswith(b"\n"):
+            assert number == len(lines), f"{path}:{number} is not JSON"
+            continue
+        cells[(cell["rate_of_return"], cell["years_to_wait"])] = cell["assets"]
+        size += len(line)
+    return header, cells, size
+
+
+def write_checkpoint_line(f, record):
+    """
+    Write a line and make sure it is on disk before moving on.
+    """
+    f.write(json.dumps(record) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def create_parser():
     parser = argparse.ArgumentParser(
         description="Make a tax graph",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
@@ -365,111 +555,330 @@ def main():
         type=float,
         default=1000
     )
+    parser.add_argument(
+        "--full-curve",
+        help=(
+            "Simulate every years to wait and every Roth conversion amount,"
+            " rather than searching for the best pair."
+        ),
+        action="store_true"
+    )
+    parser.add_argument(
+        "--coarse-factor",
+        help=(
+            "When searching for the best pair, how many Roth conversion units"
+            " apart are the first amounts tried?"
+        ),
+        required=False,
+        type=int,
+        default=16
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help=(
+            "Append every finished point of the full curve to this file. If it"
+            " already exists, skip the points it has."
+        ),
+        required=False,
+        metavar="FILE",
+        default=None
+    )
+    parser.add_argument(
+        "--plot-checkpoint",
+        help="Plot the full curve from this checkpoint file without simulating.",
+        required=False,
+        metavar="FILE",
+        default=None
+    )
+    parser.add_argument(
+        "--store",
+        help=(
+            "Write every point of the full curve into a memory-mapped result"
+            " store at this path, with its axes in PATH.json. If it already"
+            " exists, skip the points it has."
+        ),
+        required=False,
+        metavar="PATH",
+        default=None
+    )
+    parser.add_argument(
+        "--plot-store",
+        help="Plot the full curve from this result store without simulating.",
+        required=False,
+        metavar="PATH",
+        default=None
+    )
+    parser.add_argument(
+        "--save",
+        help="Save the graph to this file (like figure.png) instead of showing it.",
+        required=False,
+        metavar="FILE",
+        default=None
+    )
+    cache.add_arguments(parser)
+    stats.add_arguments(parser)
+    profiling.add_arguments(parser)
+    tracing.add_arguments(parser)
+    memory.add_arguments(parser)
+    metrics.add_arguments(parser)
+    return parser
 
+
+def main():
+    parser = create_parser()
     args = parser.parse_args()
+    save = args.save
+    show_stats = args.stats
+    if args.stats:
+        stats.enable()
+    profiling.start(args)
+    tracing.start(args)
+    if args.memory_report:
+        memory.start()
+    metrics.start(args, "graph")
+    if args.checkpoint and not args.full_curve:
+        parser.error("--checkpoint only works with --full-curve")
+    if args.store and not args.full_curve:
+        parser.error("--store only works with --full-curve")
+    if args.store and args.checkpoint:
+        parser.error("use either --store or --checkpoint, not both")
 
-    def scale(values):
-        """
-        Depending on the variables, these values can be part of a pretty wide
-        range, which looks bad. In my experience, unscaled graphs just look like
-        straight lines. I'm not really an expert in normalizing data, so I just
-        looked up "how to normalize data" and featured scaling looked right.
+    #
+    # A checkpoint has everything we need to plot, including the arguments it
+    # was made with.
+    #
+    cells = {}
+    return_rates = list(RETURN_RATES)
+    if args.plot_checkpoint:
+        header, cells, _ = load_checkpoint(args.plot_checkpoint)
+        args = argparse.Namespace(**header["args"])
+        args.full_curve = True
+        args.checkpoint = None
+        args.store = None
+        args.plot_store = None
+        args.plot_checkpoint = True
+        return_rates = header["return_rates"]
+    elif args.checkpoint and os.path.exists(args.checkpoint):
+        header, cells, size = load_checkpoint(args.checkpoint)
+        if header["key"] != get_checkpoint_key(args, return_rates):
+            parser.error(
+                f"{args.checkpoint} was made with different arguments or code;"
+                " use another file"
+            )
 
-        Link: https://en.wikipedia.org/wiki/Feature_scaling
-        """
-        def _scale(val):
-            return (val - min(values))/(max(values) - min(values))
-        return list(map(_scale, values))
+        #
+        # If the last line was cut off, cut it off the file too, so the next
+        # line we write starts on a line of its own.
+        #
+        os.truncate(args.checkpoint, size)
+    elif args.checkpoint:
+        with open(args.checkpoint, "w") as f:
+            write_checkpoint_line(f, {
+                "key": get_checkpoint_key(args, return_rates),
+                "args": vars(args),
+                "return_rates": return_rates,
+            })
+
+    #
+    # A result store works the same way, but the results live in a memory
+    # mapped file instead of a dictionary, and workers write them directly.
+    #
+    result_store = None
+    if args.plot_store:
+        result_store = store.ResultStore(args.plot_store)
+        args = argparse.Namespace(**result_store.get_metadata()["args"])
+        args.full_curve = True
+        args.store = None
+        args.plot_checkpoint = None
+        args.plot_store = True
+        return_rates = [float(r) for r in result_store.get_axis("rate_of_return")]
+    elif args.store and store.exists(args.store):
+        result_store = store.ResultStore(args.store, mode="r+")
+        if result_store.get_metadata()["key"] != get_checkpoint_key(args, return_rates):
+            parser.error(
+                f"{args.store} was made with different arguments or code;"
+                " use another path"
+            )
+    elif args.store:
+        result_store = store.create_store(
+            args.store,
+            axes=[
+                ("rate_of_return", return_rates),
+                ("years_to_wait", range(args.age_of_retirement - args.current_age)),
+            ],
+            fields=["assets"],
+            metadata={
+                "key": get_checkpoint_key(args, return_rates),
+                "args": vars(args),
+            }
+        )
 
     #
     # Generate our outputs.
     #
     working_years = args.age_of_retirement - args.current_age
-    return_rates = [1.01, 1.02, 1.03, 1.04, 1.05, 1.06, 1.07]
-    colors = [
-        'tab:blue', 'tab:red', 'tab:orange', 'tab:purple',
-        'tab:brown', 'tab:olive', 'tab:cyan'
-    ]
 
     assert working_years >= 0
 
-    best_indices = []
-    num_calculations = working_years * len(return_rates)
-    with Progress() as progress:
-        task = progress.add_task("Calculating:", total=num_calculations)
-        for rate_of_return, color in zip(return_rates, colors):
-            inputs = list(range(working_years))
-            vals = []
-            with concurrent.futures.ProcessPoolExecutor() as executor:
-                for i, j in zip(inputs, executor.map(
-                        my_calculation, itertools.product([args],
-                        [rate_of_return], inputs))
-                ):
-                    progress.update(task, advance=1)
-                    vals.append((i, j))
-                vals = sorted(vals, key=lambda l: l[0])
-
-            plt.plot(
-                [v[0] for v in vals],
-                scale([v[1] for v in vals]),
-                label=f"Rate of Return: {rate_of_return:.2f}",
-                linestyle='-',
-                color=color
-            )
-
-            best_index = 0
-            most_assets = 0
-            for index, assets in enumerate([v[1] for v in vals]):
-                if assets > most_assets:
-                    best_index = index
-                most_assets = max(most_assets, assets)
-
-            while True:
-                if best_index in best_indices:
-                    best_index += 0.1
-                if best_index not in best_indices:
-                    break
+    def simulate_cells():
+        """
+        Simulate every years to wait for every rate, skipping the cells we
+        already have. Finished cells are appended to the checkpoint as soon as
+        they are done, so Ctrl-C (or a crash) doesn't lose them.
+        """
+        if result_store:
+            missing = [
+                (rate_of_return, int(years_to_wait))
+                for rate_of_return, years_to_wait in (
+                    result_store.get_point(index).values()
+                    for index in result_store.get_missing()
+                )
+            ]
+        else:
+            missing = [
+                (rate_of_return, years_to_wait)
+                for rate_of_return in return_rates
+                for years_to_wait in range(working_years)
+                if (rate_of_return, years_to_wait) not in cells
+            ]
+        checkpoint = open(args.checkpoint, "a") if args.checkpoint else None
 
-            best_indices.append(best_index)
-            plt.axvline(x=best_index, color=color, linestyle=':')
+        #
+        # Without a result store, workers write into shared memory instead.
+        #
+        shared = None
+        if not result_store:
+            shared = store.create_shared_array((len(return_rates), working_years))
+            shared_values = shared.get_array()
+        try:
+            with progress.Reporter(
+                "Calculating:",
+                total=working_years * len(return_rates),
+                completed=working_years * len(return_rates) - len(missing)
+            ) as reporter:
+                metrics.set_workers(os.cpu_count())
+                with concurrent.futures.ProcessPoolExecutor() as executor:
+                    futures = {}
+                    for rate_of_return, years_to_wait in missing:
+                        if result_store:
+                            future = executor.submit(workers.wrap(store_calculation), (
+                                args,
+                                result_store.get_path(),
+                                result_store.get_index(
+                                    rate_of_return=rate_of_return,
+                                    years_to_wait=years_to_wait
+                                ),
+                                rate_of_return,
+                                years_to_wait
+                            ))
+                        else:
+                            future = executor.submit(workers.wrap(shared_calculation), (
+                                args,
+                                shared.get_handle(),
+                                (return_rates.index(rate_of_return), years_to_wait),
+                                rate_of_return,
+                                years_to_wait
+                            ))
+                        futures[future] = (rate_of_return, years_to_wait)
+                    try:
+                        for future in concurrent.futures.as_completed(futures):
+                            workers.unwrap(future.result())
+                            rate_of_return, years_to_wait = futures[future]
+                            if result_store:
+                                reporter.advance()
+                                continue
+                            assets = float(shared_values[
+                                return_rates.index(rate_of_return), years_to_wait
+                            ])
+                            cells[(rate_of_return, years_to_wait)] = assets
+                            if checkpoint:
+                                write_checkpoint_line(checkpoint, {
+                                    "rate_of_return": rate_of_return,
+                                    "years_to_wait": years_to_wait,
+                                    "assets": assets,
+                                })
+                            reporter.advance()
+                    except KeyboardInterrupt:
+                        for future in futures:
+                            future.cancel()
+                        raise
+        finally:
+            if checkpoint:
+                checkpoint.close()
+            if shared:
+                del shared_values
+                shared.close()
 
-    plt.xlabel("Years to Wait Before Deferring Taxes")
-    plt.ylabel("Estate At Death After Taxes")
-    plt.title("When to Start Deferring Taxes?")
+    def get_curves():
+        """
+        This yields the rate, the assets for every years to wait that we have,
+        and the best years to wait.
+        """
+        for rate_of_return in return_rates:
+            if result_store:
+                row = result_store.read("assets", rate_of_return=rate_of_return)
+                vals = [
+                    (years_to_wait, float(assets))
+                    for years_to_wait, assets in enumerate(row)
+                    if not math.isnan(assets)
+                ]
+            else:
+                vals = [
+                    (years_to_wait, cells[(rate_of_return, years_to_wait)])
+                    for years_to_wait in range(working_years)
+                    if (rate_of_return, years_to_wait) in cells
+                ]
+            if not vals:
+                continue
+            yield rate_of_return, vals, get_best_index(vals)
 
-    cells = [
-        ["Starting Age", f"{args.current_age}"],
-        ["Age of Marriage", f"{args.age_of_marriage}"],
-        ["Age of Retirement", f"{args.age_of_retirement}"],
-        ["Age to Start RMDs", f"{args.age_to_start_rmds}"],
-        ["Age of Death", f"{args.age_of_death}"],
-        ["Current Income", f"${args.income:,.2f}"],
-        ["Max Income", f"${args.max_income:,.2f}"],
-        ["Yearly Spending", f"${args.spending:,.2f}"],
-        ["Yearly Income Raise", f"{args.yearly_income_raise:.2f}"],
-        ["HSA Starting Balance", f"${args.starting_balance_hsa:,.2f}"],
-        ["Taxable Starting Balance", f"${args.starting_balance_taxable:,.2f}"],
-        ["Trad 401k Starting Balance", f"${args.starting_balance_trad_401k:,.2f}"],
-        ["Trad IRA Starting Balance", f"${args.starting_balance_trad_ira:,.2f}"],
-        ["Roth 401k Starting Balance", f"${args.starting_balance_roth_401k:,.2f}"],
-        ["Roth IRA Starting Balance", f"${args.starting_balance_roth_ira:,.2f}"],
-        ["HSA Contribution Limit", f"${args.contribution_limit_hsa:,.2f}"],
-        ["401k Normal Contribution Limit", f"${args.contribution_limit_401k:,.2f}"],
-        ["401k Total Contribution Limit", f"${args.contribution_limit_401k_total:,.2f}"],
-        ["IRA Contribution Limit", f"${args.contribution_limit_ira:,.2f}"],
-        ["Mega-Backdoor Roth", args.do_mega_backdoor_roth],
-        ["Work State", f"{args.work_state}"],
-        ["Retirement State", f"{args.retirement_state}"],
-        ["HSA Employer Contribution", f"{args.employer_contribution_hsa}"],
-    ]
+    def get_best_pairs():
+        """
+        Search for the best pair for every rate, one rate per process. This
+        yields the same as get_curves(), but only the years to wait that were
+        tried have assets.
+        """
+        rows = []
+        with progress.Reporter("Searching:", total=len(return_rates)) as reporter:
+            metrics.set_workers(os.cpu_count())
+            with concurrent.futures.ProcessPoolExecutor() as executor:
+                for rate_of_return, result in zip(return_rates, workers.map(
+                        executor, find_best_pair,
+                        itertools.product([args], return_rates))
+                ):
+                    reporter.advance()
+                    years_to_wait, amount, assets, vals, simulations = result
+                    rows.append((rate_of_return, years_to_wait, amount, assets,
+                                 simulations))
+                    yield rate_of_return, vals, years_to_wait
+        Console().print(get_best_pairs_table(rows))
 
-    the_table = plt.table(cellText=cells, bbox=[1.05, 0.25, 0.5, 0.75])
-    the_table.auto_set_font_size(False)
-    the_table.auto_set_column_width((0, 1))
-    plt.subplots_adjust(right=0.65)
+    if args.full_curve and not (args.plot_checkpoint or args.plot_store):
+        try:
+            simulate_cells()
+        except KeyboardInterrupt:
+            if args.checkpoint or args.store:
+                total = working_years * len(return_rates)
+                finished = len(cells)
+                if result_store:
+                    finished = total - len(result_store.get_missing())
+                Console().print(
+                    f"Stopped with {finished:,} of {total:,} points finished."
+                    " Run the same command again to pick up where this left off."
+                )
+            return
 
-    plt.legend(bbox_to_anchor=(1.041, -0.01), loc="lower left")
-    plt.show()
+    results = get_curves() if args.full_curve else get_best_pairs()
+    plot(args, results, return_rates)
+    if show_stats:
+        Console().print(stats.get_stats_table(stats.collector))
+    if memory.report is not None:
+        Console().print(memory.get_report_table(memory.report))
+        Console().print(memory.get_sites_table(memory.report, "sweep"))
+    if save:
+        plt.savefig(save, bbox_inches="tight")
+    else:
+        plt.show()
 
 if __name__ == "__main__":
     main()
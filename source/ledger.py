@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+import atexit
+import csv
+import json
+import os
+
+#
+# Arrow output is optional, so pyarrow only has to be installed to use it.
+#
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+#
+# The columns of the ledger, in order, and the type of each one. Every column
+# not listed in COLUMN_TYPES is money, in dollars. The changes are how much
+# went in (or came out) of each account this year, before interest.
+#
+COLUMNS = [
+    "age",
+    "married",
+    "retired",
+    "hsa",
+    "hsa_change",
+    "roth_401k",
+    "roth_401k_change",
+    "roth_ira",
+    "roth_ira_change",
+    "taxable",
+    "taxable_change",
+    "trad_401k",
+    "trad_401k_change",
+    "trad_401k_rmd",
+    "trad_ira",
+    "trad_ira_change",
+    "trad_ira_rmd",
+    "roth_conversion",
+    "income",
+    "spending",
+    "dependents",
+    "state",
+    "federal_income_tax",
+    "fica_tax",
+    "ltcg_tax",
+    "state_tax",
+    "penalties",
+    "total_taxes",
+]
+COLUMN_TYPES = {
+    "age": int,
+    "married": bool,
+    "retired": bool,
+    "dependents": int,
+    "state": str,
+}
+TYPES = [COLUMN_TYPES.get(name, float) for name in COLUMNS]
+
+#
+# Whether new simulations keep a ledger. Building a row every year isn't free,
+# so it is only done when something will read the rows, like an output file.
+#
+recording = False
+
+#
+# The formats we can write, and the file extensions that pick them.
+#
+FORMATS = {
+    "csv": [".csv"],
+    "jsonl": [".jsonl", ".ndjson"],
+    "arrow": [".arrow", ".feather"],
+}
+
+
+class Ledger:
+    """
+    This is the numbers behind the math table, one list per column, with a
+    value in every column for every year. Unlike the table, nothing is
+    formatted, so it can be written out or compared as is.
+    """
+    def __init__(self):
+        self.columns = {name: [] for name in COLUMNS}
+
+    def __len__(self):
+        return len(self.columns["age"])
+
+    def append(self, **values):
+        """
+        Add a year. Every column needs a value, and it is converted to the
+        column's type, so money is always a float, even when it happens to be
+        a whole number. This way the same year is always written the same way.
+        """
+        for (name, column), kind in zip(self.columns.items(), TYPES):
+            column.append(kind(values[name]))
+
+    def get_columns(self):
+        return self.columns
+
+    def get_rows(self):
+        """
+        Every year, as a dictionary of column to value.
+        """
+        for row in zip(*self.columns.values()):
+            yield dict(zip(COLUMNS, row))
+
+
+class CsvWriter:
+    def __init__(self, path, labels):
+        self.file = open(path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([*labels, *COLUMNS])
+
+    def write(self, ledger, labels):
+        label_values = list(labels.values())
+        for row in zip(*ledger.get_columns().values()):
+            self.writer.writerow([*label_values, *row])
+
+    def close(self):
+        self.file.close()
+
+
+class JsonLinesWriter:
+    def __init__(self, path, labels):
+        self.file = open(path, "w")
+
+    def write(self, ledger, labels):
+        for row in ledger.get_rows():
+            self.file.write(json.dumps({**labels, **row}) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class ArrowWriter:
+    """
+    This writes an Arrow IPC file (which Feather, pandas, and polars can read)
+    with one record batch per ledger, built straight from its columns.
+    """
+    def __init__(self, path, labels):
+        types = {int: pyarrow.int64(), bool: pyarrow.bool_(), str: pyarrow.string()}
+        self.schema = pyarrow.schema(
+            [(name, types.get(kind, pyarrow.float64())) for name, kind in labels.items()]
+            + [(name, types.get(COLUMN_TYPES.get(name), pyarrow.float64()))
+               for name in COLUMNS]
+        )
+        self.sink = pyarrow.OSFile(path, "wb")
+        self.writer = pyarrow.ipc.new_file(self.sink, self.schema)
+
+    def write(self, ledger, labels):
+        columns = [[value] * len(ledger) for value in labels.values()]
+        columns += ledger.get_columns().values()
+        self.writer.write_batch(pyarrow.record_batch(
+            [pyarrow.array(column, field.type)
+             for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        ))
+
+    def close(self):
+        self.writer.close()
+        self.sink.close()
+
+
+WRITERS = {
+    "csv": CsvWriter,
+    "jsonl": JsonLinesWriter,
+    "arrow": ArrowWriter,
+}
+
+
+class LedgerOutput:
+    """
+    This writes the ledgers of any number of simulations to one file, one
+    after the other, as they are finished. Only one ledger is ever held, so a
+    batch of many scenarios takes no more memory than one.
+
+    The labels are extra columns that come first in every row, to tell the
+    ledgers apart, given as a dictionary of name to type, like
+    {"simulation": int}. Every write() gives a value for each of them.
+    """
+    def __init__(self, path, output_format, labels):
+        assert output_format != "arrow" or pyarrow is not None, (
+            "writing Arrow needs pyarrow"
+        )
+        self.labels = labels
+        self.writer = WRITERS[output_format](path, labels)
+        self.closed = False
+
+    def write(self, ledger, **labels):
+        assert labels.keys() == self.labels.keys(), labels
+        self.writer.write(ledger, {name: labels[name] for name in self.labels})
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.close()
+
+
+def start():
+    """
+    Keep a ledger in every simulation created from now on, in this process and
+    in any worker forked after this.
+    """
+    global recording
+    recording = True
+
+
+def get_format(path, output_format=None):
+    """
+    The format to write, which is the one asked for, or else the one the file
+    extension picks, or else CSV.
+    """
+    if output_format:
+        return output_format
+    extension = os.path.splitext(path)[1].lower()
+    for name, extensions in FORMATS.items():
+        if extension in extensions:
+            return name
+    return "csv"
+
+
+def open_output(path, output_format, labels):
+    """
+    Start writing ledgers to a file. It is closed when the process exits, if it
+    isn't closed before then, so whatever was written is kept however we exit.
+    """
+    output = LedgerOutput(path, get_format(path, output_format), labels)
+    atexit.register(output.close)
+    start()
+    return output
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--output",
+        help=(
+            "Write the ledger, the numbers behind the math table, to this file."
+        ),
+        required=False,
+        metavar="FILE",
+        default=None
+    )
+    parser.add_argument(
+        "--format",
+        help=(
+            "The format of --output. Defaults to the one its extension picks"
+            " (.csv, .jsonl, or .arrow), or else csv. Arrow needs pyarrow."
+        ),
+        required=False,
+        choices=FORMATS.keys(),
+        default=None
+    )
+    parser.add_argument(
+        "--output-every-simulation",
+        help=(
+            "With --output, write the ledger of every simulation the search"
+            " tries, not just the best one."
+        ),
+        action="store_true"
+    )
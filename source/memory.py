@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+import os
+import tracemalloc
+
+from rich.table import Table
+
+#
+# The memory report of this process, or None when memory isn't measured.
+#
+report = None
+
+
+class NotMeasuring:
+    """
+    What measure() returns when memory isn't measured. It does nothing.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NOT_MEASURING = NotMeasuring()
+
+
+class Measurement:
+    """
+    This measures the memory used by a block of code: the peak above what was
+    in use when it started, and how much more is in use when it ends, which is
+    what it retained. With sites, it also finds which lines allocated what it
+    retained, which needs a snapshot at both ends, so it is slow.
+
+    Measurements can be nested. tracemalloc only has one peak, so every time
+    one starts or ends, the peak so far is given to every measurement that is
+    still open before the peak is reset.
+    """
+    def __init__(self, memory_report, kind, sites):
+        self.report = memory_report
+        self.kind = kind
+        self.sites = sites
+        self.start = 0
+        self.peak = 0
+        self.snapshot = None
+
+    def __enter__(self):
+        self.report.fold()
+        tracemalloc.reset_peak()
+        if self.sites:
+            self.snapshot = take_snapshot()
+        self.start = tracemalloc.get_traced_memory()[0]
+        self.peak = self.start
+        self.report.stack.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.report.fold()
+        self.report.stack.pop()
+        retained = tracemalloc.get_traced_memory()[0] - self.start
+        sites = None
+        if self.sites:
+            sites = {}
+            for stat in take_snapshot().compare_to(self.snapshot, "lineno"):
+                if not stat.size_diff:
+                    continue
+                frame = stat.traceback[0]
+                site = f"{os.path.basename(frame.filename)}:{frame.lineno}"
+                sites[site] = sites.get(site, 0) + stat.size_diff
+        self.report.add(self.kind, self.peak - self.start, retained, sites)
+        return False
+
+
+def take_snapshot():
+    """
+    A snapshot without tracemalloc's own allocations.
+    """
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ])
+
+
+class MemoryReport:
+    """
+    This keeps the peak and retained memory of every measurement of each kind,
+    like every simulation and every sweep, and how much each allocation site
+    retained. Reports from workers can be merged into it.
+    """
+    def __init__(self, kinds=None, sites=None):
+        self.kinds = {kind: dict(values) for kind, values in (kinds or {}).items()}
+        self.sites = {kind: dict(values) for kind, values in (sites or {}).items()}
+        self.stack = []
+        self.pid = os.getpid()
+
+    def fold(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        for measurement in self.stack:
+            measurement.peak = max(measurement.peak, peak)
+
+    def measure(self, kind, sites=False):
+        return Measurement(self, kind, sites)
+
+    def add(self, kind, peak, retained, sites=None):
+        values = self.kinds.setdefault(kind, {
+            "count": 0,
+            "peak_total": 0,
+            "peak_max": 0,
+            "retained_total": 0,
+            "retained_max": 0,
+        })
+        values["count"] += 1
+        values["peak_total"] += peak
+        values["peak_max"] = max(values["peak_max"], peak)
+        values["retained_total"] += retained
+        values["retained_max"] = max(values["retained_max"], retained)
+        if sites:
+            kind_sites = self.sites.setdefault(kind, {})
+            for site, size in sites.items():
+                kind_sites[site] = kind_sites.get(site, 0) + size
+
+    def get_kinds(self):
+        return self.kinds
+
+    def get_sites(self, kind):
+        return self.sites.get(kind, {})
+
+    def merge(self, other):
+        for kind, values in other.get_kinds().items():
+            mine = self.kinds.setdefault(kind, dict.fromkeys(values, 0))
+            for name, value in values.items():
+                if name.endswith("_max"):
+                    mine[name] = max(mine[name], value)
+                else:
+                    mine[name] += value
+            kind_sites = self.sites.setdefault(kind, {})
+            for site, size in other.get_sites(kind).items():
+                kind_sites[site] = kind_sites.get(site, 0) + size
+
+    def to_dict(self):
+        return {"kinds": self.kinds, "sites": self.sites}
+
+
+def start():
+    """
+    Start measuring memory in this process.
+    """
+    global report
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    report = MemoryReport()
+    return report
+
+
+def stop():
+    global report
+    report = None
+    tracemalloc.stop()
+
+
+def measure(kind, sites=False):
+    """
+    Measure a block of code, like:
+
+        with memory.measure("simulation"):
+            simulation.simulate()
+
+    When memory isn't measured, this costs next to nothing.
+    """
+    if report is None:
+        return NOT_MEASURING
+    return report.measure(kind, sites)
+
+
+class Measured:
+    """
+    This wraps a worker function so it measures memory of its own, and returns
+    its report with its result. It can be pickled as long as the function can.
+    If it runs in the process that is already measuring (with only one worker),
+    everything is measured there, and the report it returns is empty.
+    """
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, *args):
+        global report
+        if report is not None and report.pid == os.getpid():
+            return self.function(*args), MemoryReport().to_dict()
+        previous = report
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        report = MemoryReport()
+        try:
+            result = self.function(*args)
+            return result, report.to_dict()
+        finally:
+            report = previous
+            if started:
+                tracemalloc.stop()
+
+
+def wrap(function):
+    """
+    If memory is measured, wrap a function that is about to be sent to a
+    worker (see unwrap()). Otherwise, this is the same function.
+    """
+    return function if report is None else Measured(function)
+
+
+def unwrap(result):
+    """
+    Take the report out of the result of a wrapped function and add it to
+    ours, then return the real result.
+    """
+    if report is None:
+        return result
+    result, values = result
+    report.merge(MemoryReport(**values))
+    return result
+
+
+def format_size(size):
+    return f"{size / 1024:,.1f}KB"
+
+
+def get_report_table(memory_report):
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Measured")
+    table.add_column("Count", justify="right")
+    table.add_column("Mean Peak", justify="right")
+    table.add_column("Max Peak", justify="right")
+    table.add_column("Mean Retained", justify="right")
+    table.add_column("Max Retained", justify="right")
+    for kind, values in memory_report.get_kinds().items():
+        count = max(values["count"], 1)
+        table.add_row(
+            kind,
+            f"{values['count']:,}",
+            format_size(values["peak_total"] / count),
+            format_size(values["peak_max"]),
+            format_size(values["retained_total"] / count),
+            format_size(values["retained_max"])
+        )
+    return table
+
+
+def get_sites_table(memory_report, kind, top=10):
+    """
+    The allocation sites that retained the most, on average, per measurement of
+    this kind.
+    """
+    count = max(memory_report.get_kinds().get(kind, {}).get("count", 0), 1)
+    sites = sorted(
+        memory_report.get_sites(kind).items(), key=lambda item: -abs(item[1])
+    )
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column(f"Allocation Site ({kind})")
+    table.add_column("Mean Retained", justify="right")
+    for site, size in sites[:top]:
+        table.add_row(site, format_size(size / count))
+    return table
+
+
+def add_arguments(parser):
+    """
+    Both sim.py and graph.py accept these.
+    """
+    parser.add_argument(
+        "--memory-report",
+        help=(
+            "Measure the peak and retained memory of every simulation and every"
+            " Roth conversion sweep, including in workers, with tracemalloc."
+            " This makes everything much slower."
+        ),
+        action="store_true"
+    )
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+import argparse
+import atexit
+import os
+import time
+
+import stats
+
+#
+# The run that metrics are written for, or None when they are off.
+#
+run = None
+
+#
+# Every metric name starts with this.
+#
+PREFIX = "wealth_optimizer"
+
+#
+# The upper bounds of the buckets of the iterations per year histograms. A
+# search that is working well takes a few dozen iterations at most.
+#
+ITERATION_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+
+
+def format_value(value):
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class Run:
+    """
+    This is one run of a command, like a sweep in graph.py, and the metrics it
+    writes to a Prometheus textfile when it ends, for node exporter's textfile
+    collector to pick up. The file only ever has the last run, so every metric
+    is a gauge (or a histogram) of that run, and the timestamp of when it ended
+    tells if a cron job stopped running.
+
+    Everything but the wall time comes from the stats (see stats.Stats), which
+    are collected from every worker, so a run turns them on.
+    """
+    def __init__(self, path, command):
+        self.path = path
+        self.command = command
+        self.collector = stats.enable()
+        self.started = time.perf_counter()
+        self.workers = None
+        self.pid = os.getpid()
+
+    def set_workers(self, count):
+        """
+        Say how many worker processes the run uses. If it uses more than one
+        pool, the biggest one counts.
+        """
+        self.workers = max(self.workers or 0, count)
+
+    def get_lines(self):
+        wall_time = time.perf_counter() - self.started
+        counters = self.collector.get_counters()
+        timers = self.collector.get_timers()
+        histograms = self.collector.get_histograms()
+        lines = []
+
+        def add(name, kind, description, samples):
+            lines.append(f"# HELP {PREFIX}_{name} {description}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for suffix, labels, value in samples:
+                labels = {"command": self.command, **labels}
+                text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+                lines.append(
+                    f"{PREFIX}_{name}{suffix}{{{text}}} {format_value(value)}"
+                )
+
+        add("last_run_timestamp_seconds", "gauge",
+            "When the last run ended, in seconds since the epoch.",
+            [("", {}, time.time())])
+        add("wall_time_seconds", "gauge",
+            "How long the last run took.",
+            [("", {}, wall_time)])
+        add("scenarios_evaluated", "gauge",
+            "How many scenarios the last run searched for the best Roth"
+            " conversion amount, not counting cached results.",
+            [("", {}, counters.get("scenarios", 0))])
+        add("simulations", "gauge",
+            "How many simulations the last run finished, including Monte Carlo"
+            " paths.",
+            [("", {}, counters.get("simulations", 0))])
+        add("simulations_per_second", "gauge",
+            "Simulations per second of wall time in the last run.",
+            [("", {}, counters.get("simulations", 0) / wall_time)])
+
+        caches = ["result", "evaluation"]
+        add("cache_hits", "gauge",
+            "How many lookups in each cache found a result in the last run.",
+            [("", {"cache": name}, counters.get(f"cache/{name}/hits", 0))
+             for name in caches])
+        add("cache_misses", "gauge",
+            "How many lookups in each cache found nothing in the last run.",
+            [("", {"cache": name}, counters.get(f"cache/{name}/misses", 0))
+             for name in caches])
+        ratios = []
+        for name in caches:
+            hits = counters.get(f"cache/{name}/hits", 0)
+            lookups = hits + counters.get(f"cache/{name}/misses", 0)
+            if lookups:
+                ratios.append(("", {"cache": name}, hits / lookups))
+        add("cache_hit_ratio", "gauge",
+            "The fraction of lookups in each cache that hit in the last run.",
+            ratios)
+
+        samples = []
+        for loop in ["contribution", "withdrawal"]:
+            histogram = histograms.get(f"{loop}_bisection_iterations", {})
+            for bound in ITERATION_BUCKETS:
+                samples.append(("_bucket", {"loop": loop, "le": str(bound)}, sum(
+                    amount for value, amount in histogram.items()
+                    if value <= bound
+                )))
+            count = sum(histogram.values())
+            samples.append(("_bucket", {"loop": loop, "le": "+Inf"}, count))
+            samples.append(("_sum", {"loop": loop}, sum(
+                value * amount for value, amount in histogram.items()
+            )))
+            samples.append(("_count", {"loop": loop}, count))
+        add("solver_iterations_per_year", "histogram",
+            "How many iterations the contribution and withdrawal binary"
+            " searches took in each simulated year where they ran.",
+            samples)
+
+        if self.workers:
+            busy = timers.get("worker_busy", 0.0)
+            add("workers", "gauge",
+                "How many worker processes the last run used.",
+                [("", {}, self.workers)])
+            add("worker_busy_seconds", "gauge",
+                "How long workers spent working in the last run, added up.",
+                [("", {}, busy)])
+            add("worker_utilization", "gauge",
+                "The fraction of the workers' wall time they spent working.",
+                [("", {}, busy / (wall_time * self.workers))])
+        return lines
+
+    def write(self):
+        """
+        Write the metrics. The textfile collector may read the file at any
+        time, so it is written next to it first, then renamed over it.
+        """
+        if self.pid != os.getpid():
+            return
+        partial = f"{self.path}.{self.pid}.tmp"
+        with open(partial, "w") as f:
+            f.write("\n".join(self.get_lines()) + "\n")
+        os.replace(partial, self.path)
+
+
+def start(args, command):
+    """
+    Start a run if the command line asked for metrics. They are written when
+    the process exits, however it exits.
+    """
+    global run
+    if not args.metrics_file:
+        return
+    run = Run(args.metrics_file, command)
+    atexit.register(run.write)
+
+
+def set_workers(count):
+    if run is not None:
+        run.set_workers(count)
+
+
+def parse_metrics_file(path):
+    """
+    Node exporter's textfile collector only reads files ending in .prom, and
+    quietly ignores everything else, so catch that here rather than never.
+    """
+    if not path.endswith(".prom"):
+        raise argparse.ArgumentTypeError(f"{path} must end in .prom")
+    return path
+
+
+def add_arguments(parser):
+    """
+    Both sim.py and graph.py accept these.
+    """
+    parser.add_argument(
+        "--metrics-file",
+        help=(
+            "When the run ends, write metrics about it to this file in the"
+            " Prometheus text format, for node exporter's textfile collector."
+            " The name must end in .prom."
+        ),
+        required=False,
+        metavar="FILE",
+        type=parse_metrics_file,
+        default=None
+    )
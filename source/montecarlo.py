@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import random
+
+import progress
+import sim
+import stats
+
+
+def get_rates_of_return(rate_of_return, volatility, years, paths, seed):
+    """
+    Generate a rate of return for every year of every path. The yearly rates of
+    return are normally distributed around the long-term rate of return. The
+    same seed always generates the same paths, so different scenarios can be
+    compared against the same market.
+    """
+    rng = random.Random(seed)
+    return [
+        [max(rng.gauss(rate_of_return, volatility), 0) for _ in range(years)]
+        for _ in range(paths)
+    ]
+
+
+def simulate_path(args, roth_conversion_amount, rates_of_return):
+    """
+    Simulate a single path, where every year has its own rate of return.
+    """
+    simulation = sim.create_simulation(
+        args,
+        roth_conversion_amount=roth_conversion_amount
+    )
+    while not simulation.stop_simulation():
+        simulation.simulate_year()
+        simulation.set_rate_of_return(
+            rates_of_return[simulation.get_simulation_year()]
+        )
+        simulation.increment_year()
+    if stats.collector is not None:
+        stats.collector.count("simulations")
+    progress.count()
+    return simulation
+
+
+def get_success_rate(args, roth_conversion_amount, paths, volatility, seed):
+    """
+    This is the fraction of paths where we never ran out of money.
+    """
+    successes = 0
+    for rates_of_return in get_rates_of_return(
+            args.rate_of_return,
+            volatility,
+            args.age_of_death - args.current_age,
+            paths,
+            seed):
+        simulation = simulate_path(args, roth_conversion_amount, rates_of_return)
+        if not simulation.get_needed_to_continue():
+            successes += 1
+    return successes/paths
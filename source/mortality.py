@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import csv
+
+from rich.table import Table
+
+#
+# The simulation cannot go past the end of the Uniform Lifetime Table.
+#
+MAX_AGE_OF_DEATH = 115
+
+
+def load_life_table(path):
+    """
+    Read a period life table from a CSV file. The file must have an "age"
+    column and a "qx" column, where qx is the probability that someone who is
+    alive at the start of that age dies before their next birthday. This is the
+    format used by the SSA's period life tables:
+
+        https://www.ssa.gov/oact/STATS/table4c6.html
+
+    Any other columns are ignored.
+    """
+    life_table = {}
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            age = int(row["age"])
+            qx = float(row["qx"])
+            assert 0 <= qx <= 1, f"{age=} {qx=}"
+            life_table[age] = qx
+    assert life_table, f"{path} has no rows"
+    return life_table
+
+
+def get_max_age_of_death(life_table):
+    """
+    This is the oldest age we need to simulate to. Everyone still alive at this
+    age is assumed to die at this age.
+    """
+    return min(max(life_table) + 1, MAX_AGE_OF_DEATH)
+
+
+def get_death_probabilities(life_table, current_age):
+    """
+    Calculate the probability of dying at each age, given that you are alive at
+    your current age. Dying at an age means you do not live through that year,
+    which is how the age of death variable works in the simulation. Ages that
+    are missing from the table are assumed to be fatal.
+    """
+    max_age_of_death = get_max_age_of_death(life_table)
+    assert current_age <= max_age_of_death
+
+    probabilities = {}
+    still_alive = 1.0
+    for age in range(current_age, max_age_of_death):
+        probabilities[age] = still_alive * life_table.get(age, 1.0)
+        still_alive -= probabilities[age]
+    probabilities[max_age_of_death] = still_alive
+    return probabilities
+
+
+def get_expected_outcome(outcomes, probabilities):
+    """
+    Given the outcome of dying at each age (from simulate_every_age_of_death)
+    and the probability of dying at each age, calculate the expected estate
+    after taxes and the probability of running out of money before death.
+    """
+    expected_assets = 0
+    probability_of_running_out = 0
+    for age, probability in probabilities.items():
+        assets_after_death, needed_to_continue = outcomes[age]
+        expected_assets += probability * max(assets_after_death, 0)
+        if needed_to_continue:
+            probability_of_running_out += probability
+    return expected_assets, probability_of_running_out
+
+
+def get_lifespan_table(outcomes, probabilities):
+    """
+    This shows what would happen if you were to die at each age, and how likely
+    that is to happen.
+    """
+    expected_assets, probability_of_running_out = get_expected_outcome(
+        outcomes, probabilities
+    )
+
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Age of Death", justify="right")
+    table.add_column("Probability", justify="right")
+    table.add_column("Assets After Taxes", justify="right")
+    table.add_column("Needed to Continue", justify="right")
+    for age, probability in probabilities.items():
+        assets_after_death, needed_to_continue = outcomes[age]
+        table.add_row(
+            f"{age}",
+            f"{probability*100:.2f}%",
+            f"{max(assets_after_death, 0):,.2f}",
+            f"[red]{needed_to_continue:,.2f}[/red]" if needed_to_continue else "",
+        )
+    table.add_section()
+    table.add_row(
+        "Expected",
+        "",
+        f"[bold]{expected_assets:,.2f}[/bold]",
+        f"[red]{probability_of_running_out*100:.2f}%[/red]"
+        if probability_of_running_out else "",
+    )
+    return table
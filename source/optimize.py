@@ -0,0 +1,1079 @@
+#!/usr/bin/env python3
+
+import argparse
+import concurrent.futures
+import copy
+import functools
+import math
+import os
+import time
+
+from rich.console import Console
+from rich.table import Table
+
+import metrics
+import montecarlo
+import progress
+import sim
+import stats
+import workers
+
+
+def with_value(args, name, value):
+    """
+    Return a copy of the arguments with one of them changed.
+    """
+    params = vars(args).copy()
+    params[name] = value
+    return argparse.Namespace(**params)
+
+
+def meets_goals(args, roth_conversion_amount, simulation):
+    """
+    Check if the simulation never ran out of money and, if a minimum estate is
+    given, left at least that much after taxes. If a success rate is given, the
+    Roth conversion amount is also put through a Monte Carlo simulation, and
+    enough paths must never run out of money.
+    """
+    if simulation.get_needed_to_continue():
+        return False
+    if args.min_estate and simulation.get_total_assets_after_death() < args.min_estate:
+        return False
+    if args.success_rate is None:
+        return True
+    success_rate = montecarlo.get_success_rate(
+        args,
+        roth_conversion_amount,
+        args.paths,
+        args.volatility,
+        args.seed
+    )
+    return success_rate >= args.success_rate
+
+
+def is_sustainable(args, checkpoint=None):
+    """
+    Like sim.py, this first finds the best Roth conversion amount. Then it
+    checks if that meets our goals.
+    """
+    roth_conversion_amount, simulation = sim.find_best_roth_conversion_amount(
+        args,
+        checkpoint=checkpoint
+    )
+    return meets_goals(args, roth_conversion_amount, simulation)
+
+
+def is_retirement_age_sustainable(args, candidate):
+    age_of_retirement, checkpoint = candidate
+    return is_sustainable(
+        with_value(args, "age_of_retirement", age_of_retirement),
+        checkpoint
+    )
+
+
+################################################################################
+# Anytime Search
+################################################################################
+
+class Deadline:
+    """
+    This is a wall-clock budget for a search. Without a number of seconds, it
+    never expires. Nested searches share the same deadline.
+    """
+    def __init__(self, seconds=None):
+        self.end = None
+        if seconds is not None:
+            self.end = time.monotonic() + seconds
+
+    def has_expired(self):
+        return self.end is not None and time.monotonic() >= self.end
+
+    def get_remaining(self):
+        if self.end is None:
+            return math.inf
+        return max(self.end - time.monotonic(), 0)
+
+
+class BestSoFar:
+    """
+    This holds the best value a search has found so far, the objective and
+    simulation that go with it, and the error bound: how far the value could
+    be from the real best, assuming there is only one peak. The error is None
+    until the search knows enough to bound it, and zero once it is done. A
+    search can also keep a detail with the value, like the result of a search
+    nested inside it.
+
+    Some searches, like coordinate descent, can't bound the error at all. They
+    set the step they are taking instead, which is only how finely they were
+    searching when they stopped, and zero once they are done.
+
+    Searches update this as they go, so if they are stopped early (because
+    they ran out of time or the user pressed Ctrl-C) there is still an answer.
+    """
+    def __init__(self):
+        self.value = None
+        self.objective = None
+        self.simulation = None
+        self.detail = None
+        self.error = None
+        self.step = None
+
+    def get_value(self):
+        return self.value
+
+    def get_objective(self):
+        return self.objective
+
+    def get_simulation(self):
+        return self.simulation
+
+    def get_detail(self):
+        return self.detail
+
+    def get_error(self):
+        return self.error
+
+    def get_step(self):
+        return self.step
+
+    def has_value(self):
+        return self.value is not None
+
+    def set(self, value, objective, simulation=None, detail=None):
+        self.value = value
+        self.objective = objective
+        self.simulation = simulation
+        self.detail = detail
+
+    def update(self, value, objective, simulation=None, detail=None):
+        """
+        Keep the value if it is better. Like the Roth conversion sweep, ties go
+        to the larger value.
+        """
+        if self.value is not None:
+            if round(objective, 2) < round(self.objective, 2):
+                return False
+            if round(objective, 2) == round(self.objective, 2) and value < self.value:
+                return False
+        self.set(value, objective, simulation, detail)
+        return True
+
+    def set_error(self, error):
+        self.error = error
+
+    def set_step(self, step):
+        self.step = step
+
+
+def refine(evaluate, best, lo, hi, step, unit, deadline):
+    """
+    After a coarse pass with this step, the real best is within a step of the
+    best so far. Check halfway to each side, which halves the error bound, and
+    keep going until the step is the unit or the deadline expires. The
+    evaluate() function must update the best so far.
+    """
+    best.set_error(step - unit)
+    while step > unit:
+        step = max(step/2, unit)
+        center = best.get_value()
+        for value in (center - step, center + step):
+            if lo <= value <= hi:
+                if deadline.has_expired():
+                    return best
+                evaluate(value)
+        best.set_error(step - unit)
+    return best
+
+
+def find_best_years_to_wait(args, objective=None, deadline=None, best=None,
+                            callback=None, coarse_step=4, coarse_factor=None,
+                            **kwargs):
+    """
+    Find how many years of Roth contributions maximize the objective. Each
+    candidate runs its own search for the best Roth conversion amount. Every
+    coarse_step years is tried first, then the best is refined one year at a
+    time. Waiting longer than we work is the same as waiting until retirement,
+    so that is as far as we look.
+
+    Until a candidate stops waiting, it is the same as waiting the longest. So
+    one simulation that waits the longest is saved at the start of every year,
+    and each candidate starts from its copy rather than from the beginning.
+
+    With a coarse_factor, each Roth conversion search is coarse to fine too,
+    which makes this a joint search over both. With a deadline, each Roth
+    conversion search gets an equal share of the time that is left, and this
+    returns the best so far when time runs out. It returns a BestSoFar whose
+    detail is the BestSoFar of the Roth conversion search that goes with the
+    best years to wait.
+    """
+    if objective is None:
+        objective = sim.simulate_to_death
+    if deadline is None:
+        deadline = Deadline()
+    if best is None:
+        best = BestSoFar()
+
+    hi = max(args.age_of_retirement - args.current_age, 0)
+    candidates = list(range(0, hi, coarse_step)) + [hi]
+    evaluated = set()
+
+    waiting = sim.create_simulation(with_value(args, "years_to_wait", hi), **kwargs)
+    checkpoints = []
+    for years_to_wait in range(hi + 1):
+        waiting.simulate_until(args.current_age + years_to_wait)
+        checkpoints.append(copy.deepcopy(waiting))
+
+    def evaluate(years_to_wait):
+        years_to_wait = int(years_to_wait)
+        if years_to_wait in evaluated:
+            return
+        evaluated.add(years_to_wait)
+        if callback:
+            callback(years_to_wait)
+
+        #
+        # Give this candidate its share of the time. There are usually two
+        # more candidates for each level of refinement.
+        #
+        remaining = len([c for c in candidates if c not in evaluated])
+        remaining += 2 * max(math.ceil(math.log2(coarse_step)), 0)
+        inner_deadline = None
+        if deadline.end is not None:
+            inner_deadline = Deadline(deadline.get_remaining() / (remaining + 1))
+
+        checkpoint = checkpoints[years_to_wait]
+        checkpoint.years_to_wait = years_to_wait
+        inner = BestSoFar()
+        sim.find_best_roth_conversion_amount(
+            args,
+            objective=objective,
+            checkpoint=checkpoint,
+            deadline=inner_deadline,
+            best=inner,
+            coarse_factor=coarse_factor
+        )
+        best.update(years_to_wait, inner.get_objective(), inner.get_simulation(),
+                    inner)
+
+    for years_to_wait in candidates:
+        if best.has_value() and deadline.has_expired():
+            return best
+        evaluate(years_to_wait)
+    return refine(evaluate, best, 0, hi, coarse_step, 1, deadline)
+
+
+################################################################################
+# Roth Conversion Schedule
+################################################################################
+
+def optimize_roth_conversion_schedule(args, objective=None, callback=None,
+                                      deadline=None, best=None, **kwargs):
+    """
+    Find a Roth conversion amount for every year between retirement and RMDs,
+    rather than one amount for all of them. This uses coordinate descent: we
+    start with the best single amount, then move each year's amount up or down
+    by a step for as long as that helps. When a full pass doesn't help, the step
+    is cut in half, until it is smaller than the Roth conversion unit.
+
+    We keep a copy of the simulation at the start of every conversion year.
+    Changing a year's amount doesn't change anything before it, so trying a new
+    amount only simulates from that year on.
+
+    Like find_best_roth_conversion_amount(), the objective defaults to the
+    total assets after death. This returns the schedule (a dictionary of age to
+    amount) and the value of the objective. With a deadline, this stops when
+    time runs out. If a BestSoFar is given, it holds a copy of the best schedule
+    so far, and its error is the current step.
+    """
+    if objective is None:
+        objective = sim.simulate_to_death
+    if deadline is None:
+        deadline = Deadline()
+    if best is None:
+        best = BestSoFar()
+
+    roth_conversion_amount, _ = sim.find_best_roth_conversion_amount(
+        args, objective=objective, deadline=deadline, **kwargs
+    )
+
+    simulation = sim.create_simulation(args, **kwargs)
+    simulation.simulate_until(simulation.get_age_of_retirement())
+    ages = list(range(
+        simulation.get_current_age(),
+        min(simulation.age_to_start_rmds, simulation.age_of_death)
+    ))
+    if simulation.stop_simulation() or not simulation.do_roth_conversion():
+        ages = []
+
+    schedule = {age: roth_conversion_amount for age in ages}
+    simulation.roth_conversion_schedule = schedule
+
+    def get_checkpoints(simulation):
+        """
+        Simulate through every conversion year, saving a copy at the start of
+        each one. This returns the copies and the objective.
+        """
+        checkpoints = {}
+        for age in ages:
+            if age < simulation.get_current_age():
+                continue
+            simulation.simulate_until(age)
+            checkpoints[age] = copy.deepcopy(simulation)
+        return checkpoints, objective(simulation)
+
+    def try_amount(age, amount):
+        candidate = copy.deepcopy(checkpoints[age])
+        candidate.roth_conversion_schedule = {**schedule, age: amount}
+        return objective(candidate)
+
+    checkpoints, most_assets = get_checkpoints(simulation)
+    directions = {age: 1 for age in ages}
+    step = args.roth_conversion_unit * 4
+    best.set(dict(schedule), most_assets)
+    best.set_step(step)
+    while ages and step >= args.roth_conversion_unit:
+        improved = False
+        for age in ages:
+            if deadline.has_expired():
+                return schedule, most_assets
+            if callback:
+                callback(age, step)
+
+            #
+            # Try the direction that helped last time first. Once a direction
+            # helps, keep going that way until it stops helping.
+            #
+            for direction in (directions[age], -directions[age]):
+                moved = False
+                while schedule[age] + direction*step >= 0:
+                    amount = schedule[age] + direction*step
+                    assets = try_amount(age, amount)
+                    if round(assets, 2) <= round(most_assets, 2):
+                        break
+                    schedule[age] = amount
+                    most_assets = assets
+                    moved = True
+                    best.set(dict(schedule), most_assets)
+                if moved:
+                    directions[age] = direction
+                    improved = True
+
+                    #
+                    # Every year after this one has changed, so replace their
+                    # copies.
+                    #
+                    simulation = copy.deepcopy(checkpoints[age])
+                    simulation.roth_conversion_schedule = dict(schedule)
+                    later_checkpoints, _ = get_checkpoints(simulation)
+                    checkpoints.update(later_checkpoints)
+                    break
+        if not improved:
+            step /= 2
+            best.set_step(step if step >= args.roth_conversion_unit else 0)
+
+    best.set_step(0)
+    return schedule, most_assets
+
+
+def get_roth_conversion_schedule_table(schedule):
+    """
+    This shows how much to convert at each age.
+    """
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Age", justify="right")
+    table.add_column("Roth Conversion", justify="right")
+    for age, amount in sorted(schedule.items()):
+        table.add_row(f"{age}", f"{amount:,.2f}" if amount else "")
+    return table
+
+
+################################################################################
+# Goal Seeking
+################################################################################
+
+#
+# These are objectives for goal_seek(). They are given the arguments, the best
+# Roth conversion amount, and the simulation that used it. Objectives must be
+# defined at the module level so they can be sent to other processes.
+#
+
+def get_assets_after_death(args, roth_conversion_amount, simulation):
+    return simulation.get_total_assets_after_death()
+
+
+def get_total_taxes(args, roth_conversion_amount, simulation):
+    return simulation.get_total_taxes()
+
+
+def get_needed_to_continue(args, roth_conversion_amount, simulation):
+    return simulation.get_needed_to_continue()
+
+
+def get_sustainability(args, roth_conversion_amount, simulation):
+    """
+    This is 1 if the simulation meets our goals, otherwise it is 0.
+    """
+    return 1 if meets_goals(args, roth_conversion_amount, simulation) else 0
+
+
+objectives = {
+    'assets-after-death': get_assets_after_death,
+    'total-taxes': get_total_taxes,
+    'needed-to-continue': get_needed_to_continue,
+    'sustainability': get_sustainability,
+}
+
+
+def evaluate(args, name, objective, value, checkpoint=None):
+    """
+    Change one of the arguments, find the best Roth conversion amount, and
+    return the objective for that simulation. If a checkpoint is given, every
+    simulation picks up from a copy of it, with the argument changed there too,
+    so the argument must not matter before the checkpoint's age.
+    """
+    args = with_value(args, name, value)
+    if checkpoint is not None:
+        checkpoint = copy.deepcopy(checkpoint)
+        setattr(checkpoint, name, value)
+    roth_conversion_amount, simulation = sim.find_best_roth_conversion_amount(
+        args,
+        checkpoint=checkpoint
+    )
+    return objective(args, roth_conversion_amount, simulation)
+
+
+class EvaluationCache:
+    """
+    This remembers the objective for every scenario that has been evaluated. By
+    default, every call to goal_seek() shares the same cache.
+    """
+    def __init__(self):
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return (
+            f"EvaluationCache(size={len(self.values)}"
+            f" hits={self.hits}"
+            f" misses={self.misses}"
+            f")"
+        )
+
+    @staticmethod
+    def get_key(args, objective):
+        return (
+            objective.__module__,
+            objective.__qualname__,
+            tuple(sorted(
+                (name, tuple(value) if isinstance(value, list) else value)
+                for name, value in vars(args).items()
+            ))
+        )
+
+    def get(self, key):
+        if key in self.values:
+            self.hits += 1
+            if stats.collector is not None:
+                stats.collector.count("cache/evaluation/hits")
+            return True, self.values[key]
+        self.misses += 1
+        if stats.collector is not None:
+            stats.collector.count("cache/evaluation/misses")
+        return False, None
+
+    def put(self, key, value):
+        self.values[key] = value
+
+    def has(self, key):
+        """
+        Whether the key has a value, without counting it as a hit or a miss.
+        """
+        return key in self.values
+
+
+evaluation_cache = EvaluationCache()
+
+
+#
+# Why a goal_seek() stopped. It converged when the answer is within the
+# tolerance, reached the target when maximize() found a value good enough to
+# stop early, was exhausted when the budget ran out, and was unbracketed when
+# bisect() never found where the objective crosses the target.
+#
+CONVERGED = "converged"
+REACHED_TARGET = "reached-target"
+EXHAUSTED = "exhausted"
+UNBRACKETED = "unbracketed"
+
+
+class GoalSeekResult:
+    """
+    This is what goal_seek() found, and why it stopped. If the search ran out
+    of evaluations before it converged, the value is the best one found so far,
+    and it is exhausted. That is not the same as a target that can't be
+    reached: if the value is None and the search is exhausted, we just didn't
+    get to look far enough.
+    """
+    def __init__(self, name, value, objective, evaluations, reason):
+        self.name = name
+        self.value = value
+        self.objective = objective
+        self.evaluations = evaluations
+        self.reason = reason
+
+    def __repr__(self):
+        return (
+            f"GoalSeekResult({self.name}={self.value!r}"
+            f" objective={self.objective!r}"
+            f" evaluations={self.evaluations}"
+            f" reason={self.reason}"
+            f")"
+        )
+
+    def get_value(self):
+        return self.value
+
+    def get_objective(self):
+        return self.objective
+
+    def get_evaluations(self):
+        return self.evaluations
+
+    def get_reason(self):
+        return self.reason
+
+    def is_converged(self):
+        return self.reason == CONVERGED
+
+    def is_exhausted(self):
+        return self.reason == EXHAUSTED
+
+
+class Evaluator:
+    """
+    This evaluates batches of values for goal_seek(). It checks the cache first,
+    sends everything else to the executor, and keeps track of the budget.
+    """
+    def __init__(self, args, name, objective, cache, executor, budget,
+                 checkpoint=None):
+        self.args = args
+        self.name = name
+        self.objective = objective
+        self.cache = cache
+        self.executor = executor
+        self.budget = budget
+        self.checkpoint = checkpoint
+        self.evaluations = 0
+
+    def get_remaining(self):
+        if self.budget is None:
+            return float("inf")
+        return self.budget - self.evaluations
+
+    def get_affordable(self, values):
+        """
+        Return as many of the values, from the start, as the budget can cover.
+        Values that are already in the cache are free.
+        """
+        affordable = []
+        missing = set()
+        for value in values:
+            key = self.cache.get_key(with_value(self.args, self.name, value), self.objective)
+            if not self.cache.has(key) and value not in missing:
+                if len(missing) >= self.get_remaining():
+                    break
+                missing.add(value)
+            affordable.append(value)
+        return affordable
+
+    def __call__(self, values):
+        results = {}
+        missing = []
+        for value in values:
+            key = self.cache.get_key(with_value(self.args, self.name, value), self.objective)
+            found, result = self.cache.get(key)
+            if found:
+                results[value] = result
+            elif value not in missing:
+                missing.append(value)
+
+        assert len(missing) <= self.get_remaining()
+        self.evaluations += len(missing)
+        function = functools.partial(
+            evaluate, self.args, self.name, self.objective,
+            checkpoint=self.checkpoint
+        )
+        for value, result in zip(missing, workers.map(self.executor, function, missing)):
+            key = self.cache.get_key(with_value(self.args, self.name, value), self.objective)
+            self.cache.put(key, result)
+            results[value] = result
+
+        return [results[value] for value in values]
+
+
+class SerialExecutor:
+    """
+    This has the same map() as an executor, but it does everything in this
+    process. It is used when there is only one worker.
+    """
+    def map(self, function, *iterables):
+        return map(function, *iterables)
+
+
+def split(lo, hi, count, integer):
+    """
+    Return evenly spaced values between lo and hi, not including either end.
+    They are in order from lo to hi, even if lo is larger.
+    """
+    values = [lo + (hi - lo)*i/(count + 1) for i in range(1, count + 1)]
+    if integer:
+        values = [
+            value for value in dict.fromkeys(round(value) for value in values)
+            if value not in (lo, hi)
+        ]
+    return values
+
+
+def bisect(evaluator, lo, hi, target, tolerance, batch_size, integer,
+           callback=None):
+    """
+    Find where the objective crosses the target, assuming it only goes one way.
+    The value on the side that reaches the target is returned, so the objective
+    there is at least the target.
+
+    If hi is None, we start from the current value of the argument and keep
+    doubling it until the objective crosses the target. If it doesn't cross
+    after doubling once, we also try lo, in case the answer is below where we
+    started.
+    """
+    def reaches_target(result):
+        return result >= target
+
+    if integer:
+        tolerance = max(tolerance, 1)
+
+    #
+    # First, bracket the answer. The objective at a and b will be on opposite
+    # sides of the target.
+    #
+    a, a_result = None, None
+    b, b_result = None, None
+    exhausted = False
+    if hi is not None:
+        ends = evaluator.get_affordable([lo, hi])
+        points = list(zip(ends, evaluator(ends)))
+        if len(points) < 2:
+            exhausted = True
+            for value, result in points:
+                a, a_result = value, result
+        else:
+            (a, a_result), (b, b_result) = points
+            if reaches_target(a_result) == reaches_target(b_result):
+                b = None
+    else:
+        candidate = max(getattr(evaluator.args, evaluator.name), lo + tolerance)
+        if integer:
+            candidate = math.ceil(candidate)
+        start = None
+        checked_lo = lo >= candidate
+        for _ in range(64):
+            count = min(batch_size, evaluator.get_remaining())
+            if count <= 0:
+                exhausted = True
+                break
+            candidates = [candidate * 2**i for i in range(count)]
+            for value, result in zip(candidates, evaluator(candidates)):
+                if start is None:
+                    start = (value, result)
+                if reaches_target(result) != reaches_target(start[1]):
+                    b, b_result = value, result
+                    break
+                a, a_result = value, result
+            if b is not None:
+                break
+            if not checked_lo and a != start[0]:
+                if evaluator.get_remaining() <= 0:
+                    exhausted = True
+                    break
+                checked_lo = True
+                lo_result, = evaluator([lo])
+                if reaches_target(lo_result) != reaches_target(start[1]):
+                    a, a_result = lo, lo_result
+                    b, b_result = start
+                    break
+            candidate = candidates[-1] * 2
+
+    if b is None:
+        found = a is not None and reaches_target(a_result)
+        return GoalSeekResult(evaluator.name, a if found else None,
+                              a_result if found else None,
+                              evaluator.evaluations,
+                              EXHAUSTED if exhausted else UNBRACKETED)
+
+    #
+    # Now narrow it down, from a towards b.
+    #
+    while abs(b - a) > tolerance:
+        if callback:
+            callback(min(a, b), max(a, b))
+        count = min(batch_size, evaluator.get_remaining())
+        if count <= 0:
+            exhausted = True
+            break
+        candidates = split(a, b, count, integer)
+        for value, result in zip(candidates, evaluator(candidates)):
+            if reaches_target(result) != reaches_target(a_result):
+                b, b_result = value, result
+                break
+            a, a_result = value, result
+
+    if reaches_target(a_result):
+        value, result = a, a_result
+    else:
+        value, result = b, b_result
+    return GoalSeekResult(evaluator.name, value, result, evaluator.evaluations,
+                          EXHAUSTED if exhausted else CONVERGED)
+
+
+def maximize(evaluator, lo, hi, target, tolerance, batch_size, integer,
+             callback=None):
+    """
+    Find the value between lo and hi with the largest objective, assuming the
+    objective goes up and then down. Each batch keeps the neighbors of the best
+    value so far. If a target is given, we stop as soon as it is reached.
+    """
+    assert hi is not None
+    if integer:
+        tolerance = max(tolerance, 1)
+
+    ends = evaluator.get_affordable([lo, hi])
+    points = list(zip(ends, evaluator(ends)))
+    if len(points) < 2:
+        best_value, best_result = max(points, key=lambda point: point[1],
+                                      default=(None, None))
+        return GoalSeekResult(evaluator.name, best_value, best_result,
+                              evaluator.evaluations, EXHAUSTED)
+
+    reason = CONVERGED
+    while abs(hi - lo) > tolerance:
+        best_value, best_result = max(points, key=lambda point: point[1])
+        if target is not None and best_result >= target:
+            reason = REACHED_TARGET
+            break
+        if callback:
+            callback(lo, hi)
+        count = min(max(batch_size, 2), evaluator.get_remaining())
+        if count < 2:
+            reason = EXHAUSTED
+            break
+        candidates = split(lo, hi, count, integer)
+        points = sorted(
+            [points[0]] + list(zip(candidates, evaluator(candidates))) + [points[-1]]
+        )
+        index = max(range(len(points)), key=lambda i: points[i][1])
+        points = points[max(index - 1, 0):index + 2]
+        lo, hi = points[0][0], points[-1][0]
+
+    best_value, best_result = max(points, key=lambda point: point[1])
+    return GoalSeekResult(evaluator.name, best_value, best_result,
+                          evaluator.evaluations, reason)
+
+
+strategies = {
+    'bisect': bisect,
+    'maximize': maximize,
+}
+
+#
+# These arguments only make sense as whole numbers. Argparse does not convert
+# defaults, so we cannot tell from the values themselves.
+#
+integer_arguments = {
+    'age_of_death',
+    'age_of_marriage',
+    'age_of_retirement',
+    'age_to_start_rmds',
+    'contribution_catch_up_age_401k',
+    'contribution_catch_up_age_hsa',
+    'contribution_catch_up_age_ira',
+    'current_age',
+    'years_to_wait',
+}
+
+
+def goal_seek(args, name, objective, target=None, strategy="bisect", lo=0,
+              hi=None, tolerance=1, budget=None, max_workers=None,
+              cache=evaluation_cache, checkpoint=None, callback=None):
+    """
+    Search for the value of one argument that makes the objective hit the
+    target (bisect), or makes the objective as large as possible (maximize).
+    The objective can be a function or one of the names in objectives.
+
+    Every candidate gets its own best Roth conversion amount. Candidates are
+    evaluated in batches, one per worker, across a process pool. Results are
+    remembered in the cache, and the budget limits how many new evaluations one
+    call can make. If the budget runs out, the best value so far is returned.
+    The result says why the search stopped (see GoalSeekResult).
+
+    If the argument doesn't matter until some age, a checkpoint (a simulation
+    of the arguments up to that age) saves simulating the years before it for
+    every candidate. See evaluate().
+    """
+    name = name.replace("-", "_")
+    assert hasattr(args, name), name
+    if isinstance(objective, str):
+        objective = objectives[objective]
+    if strategy == "bisect":
+        assert target is not None
+
+    max_workers = max_workers or os.cpu_count()
+    integer = name in integer_arguments
+    metrics.set_workers(max_workers)
+
+    if max_workers == 1:
+        executor = SerialExecutor()
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers)
+
+    try:
+        evaluator = Evaluator(args, name, objective, cache, executor, budget,
+                              checkpoint)
+        return strategies[strategy](
+            evaluator, lo, hi, target, tolerance, max_workers, integer, callback
+        )
+    finally:
+        if max_workers != 1:
+            executor.shutdown()
+
+
+
+def find_first_success(evaluate, candidates, executor, batch_size,
+                       callback=None):
+    """
+    Find the first candidate where evaluate() returns True. This assumes that it
+    returns False for every candidate before the answer and True for every
+    candidate after it. If it is never True, this returns None.
+
+    Each batch evaluates evenly spaced candidates between the last failure and
+    the first success, one per worker, so every batch narrows the range by the
+    batch size plus one.
+    """
+    #
+    # These are indices. Everything at or before lo fails, and everything at or
+    # after hi succeeds. Neither end has been evaluated yet.
+    #
+    lo, hi = -1, len(candidates)
+    while hi - lo > 1:
+        if callback:
+            callback(candidates[lo + 1], candidates[hi - 1])
+        count = min(batch_size, hi - lo - 1)
+        indices = [lo + (hi - lo)*i//(count + 1) for i in range(1, count + 1)]
+        for index, success in zip(indices, workers.map(
+                executor, evaluate, [candidates[i] for i in indices])):
+            if success:
+                hi = index
+                break
+            lo = index
+
+    if hi == len(candidates):
+        return None
+    return candidates[hi]
+
+
+def solve_spending(args, callback=None):
+    """
+    Find the most we can spend each year in retirement without running out of
+    money. While we work, we spend the usual amount.
+
+    Until we retire, a simulation is the same regardless of what we will spend
+    in retirement. So we simulate until retirement once, and every candidate
+    picks up from a copy of it. Nobody can spend twice what they have when
+    they retire in one year, so that is the upper bound, and the search never
+    has to double its way up to one.
+    """
+    checkpoint = sim.create_simulation(args)
+    checkpoint.simulate_until(checkpoint.get_age_of_retirement())
+    if checkpoint.stop_simulation():
+        return None
+
+    result = goal_seek(
+        args,
+        "retirement_spending",
+        get_sustainability,
+        1,
+        hi=2 * checkpoint.get_total_assets() + args.solve_tolerance,
+        tolerance=args.solve_tolerance,
+        checkpoint=checkpoint,
+        callback=(lambda lo, hi: callback(round(lo, 2), round(hi, 2))) if callback else None
+    )
+    if result.get_value() is None:
+        return None
+    return round(result.get_value(), 2)
+
+
+def solve_age_of_retirement(args, callback=None):
+    """
+    Find the earliest age we can retire without running out of money.
+
+    Until we retire, a simulation is the same regardless of when we will retire.
+    So we simulate working until death once, and save a copy of the simulation
+    at every age. Each candidate age picks up from its copy.
+    """
+    prefix = sim.create_simulation(args, age_of_retirement=args.age_of_death)
+    candidates = []
+    for age in range(args.current_age, args.age_of_death + 1):
+        prefix.simulate_until(age)
+        checkpoint = copy.deepcopy(prefix)
+        checkpoint.age_of_retirement = age
+        candidates.append((age, checkpoint))
+
+    metrics.set_workers(os.cpu_count())
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        solution = find_first_success(
+            functools.partial(is_retirement_age_sustainable, args),
+            candidates,
+            executor,
+            batch_size=os.cpu_count(),
+            callback=(lambda lo, hi: callback(lo[0], hi[0])) if callback else None
+        )
+    return solution[0] if solution else None
+
+
+solvers = {
+    'spending': solve_spending,
+    'age-of-retirement': solve_age_of_retirement,
+}
+
+#
+# The argument that each solver's solution is for.
+#
+solved_arguments = {
+    'spending': 'retirement_spending',
+    'age-of-retirement': 'age_of_retirement',
+}
+
+
+def solve(args, variable, callback=None):
+    """
+    Solve for the given variable. The callback is called with the lower and
+    upper bounds as the search progresses.
+    """
+    return solvers[variable](args, callback)
+
+
+def main():
+    """
+    Search for the value of any simulation argument from the command line.
+    """
+    parser = sim.create_parser()
+    parser.description = "Goal Seek"
+    parser.add_argument(
+        "--goal-seek",
+        help="Which argument should we search for? (e.g. starting-balance-taxable)",
+        metavar="ARGUMENT",
+        required=True
+    )
+    parser.add_argument(
+        "--objective",
+        help="What should the argument change?",
+        required=False,
+        choices=objectives.keys(),
+        default="assets-after-death"
+    )
+    parser.add_argument(
+        "--target",
+        help="What value should the objective reach? Optional for maximize.",
+        required=False,
+        type=float,
+        default=None
+    )
+    parser.add_argument(
+        "--strategy",
+        help="Bisect assumes the objective only goes one way. Maximize assumes it goes up, then down.",
+        required=False,
+        choices=strategies.keys(),
+        default="bisect"
+    )
+    parser.add_argument(
+        "--lo",
+        help="What is the lowest value to try?",
+        required=False,
+        type=float,
+        default=0
+    )
+    parser.add_argument(
+        "--hi",
+        help="What is the highest value to try? If not given, bisect will find one.",
+        required=False,
+        type=float,
+        default=None
+    )
+    parser.add_argument(
+        "--budget",
+        help="What is the most number of evaluations to make?",
+        required=False,
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        "--workers",
+        help="How many processes should evaluate candidates? Defaults to the number of CPUs.",
+        required=False,
+        type=int,
+        default=None
+    )
+    args = parser.parse_args()
+    metrics.start(args, "goal-seek")
+
+    name = args.goal_seek.replace("-", "_")
+    lo, hi = args.lo, args.hi
+    tolerance = args.solve_tolerance
+    if name in integer_arguments:
+        lo = int(lo)
+        hi = int(hi) if hi is not None else None
+        tolerance = 1
+
+    with progress.Reporter() as reporter:
+        result = goal_seek(
+            args,
+            name,
+            args.objective,
+            args.target,
+            strategy=args.strategy,
+            lo=lo,
+            hi=hi,
+            tolerance=tolerance,
+            budget=args.budget,
+            max_workers=args.workers,
+            callback=lambda lo, hi: reporter.update(
+                "Searching for {}: {:,.2f} - {:,.2f}", args.goal_seek, lo, hi
+            )
+        )
+
+    console = Console()
+    if result.get_value() is None and result.is_exhausted():
+        console.print(
+            f"The budget ran out after {result.get_evaluations()} evaluations,"
+            f" before any {args.goal_seek} was found. Try a larger --budget."
+        )
+        return
+    if result.get_value() is None:
+        console.print(f"The {args.objective} never reaches {args.target:,.2f}. :fire:")
+        return
+    status = {
+        CONVERGED: "",
+        REACHED_TARGET: ", stopped early, the target was reached",
+        EXHAUSTED: ", not converged, the budget ran out",
+        UNBRACKETED: ", not converged",
+    }[result.get_reason()]
+    console.print(
+        f"{args.goal_seek}: [underline]{result.get_value():,.2f}[/underline]"
+        f" ({args.objective}: {result.get_objective():,.2f},"
+        f" evaluations: {result.get_evaluations()}"
+        f"{status})"
+    )
+
+
+if __name__ == "__main__":
+    main()
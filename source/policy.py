@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+
+import operator
+
+import federal_taxes
+
+#
+# These are the buckets that money can be contributed to or withdrawn from. The
+# order matters; it is the order they are subtracted in when figuring out what
+# is left, so changing it could change the results by a fraction of a cent.
+#
+CONTRIBUTION_BUCKETS = (
+    "hsa",
+    "roth_401k",
+    "roth_ira",
+    "trad_401k",
+    "trad_ira",
+)
+WITHDRAWAL_BUCKETS = (
+    "hsa",
+    "taxable",
+    "roth_401k",
+    "roth_ira",
+    "roth_401k_with_interest",
+    "roth_ira_with_interest",
+    "trad_401k",
+    "trad_ira",
+)
+
+
+def get_account_name(bucket):
+    """
+    Roth withdrawals are split into contributions and gains, but they come
+    from the same account.
+    """
+    return bucket.replace("_with_interest", "")
+
+
+class Step:
+    """
+    This is one step of a contribution or withdrawal order. The step moves as
+    much money as it can into (or out of) the bucket, but no more than what is
+    left, what is available, and the cap.
+
+    The bucket, cap, and condition are names, so a policy is just data. The
+    cap is one of the functions in caps, and the condition is the name of a
+    method on the simulation (or anything else that runs the policy), which
+    decides if the step happens this year. If the bucket is in resolvers, the
+    bucket is picked each time the step runs.
+    """
+    def __init__(self, bucket, cap=None, when=None, limit="value",
+                 employer=False):
+        self.bucket = bucket
+        self.cap = cap
+        self.when = when
+        self.limit = limit
+        self.employer = employer
+
+    def __repr__(self):
+        return (
+            f"Step(bucket={self.bucket!r}"
+            f" cap={self.cap!r}"
+            f" when={self.when!r}"
+            f" limit={self.limit!r}"
+            f"{' employer=True' if self.employer else ''}"
+            f")"
+        )
+
+
+class Penalty:
+    """
+    Withdrawals from the bucket are penalized at this rate, unless the
+    condition is true.
+    """
+    def __init__(self, bucket, rate, unless):
+        self.bucket = bucket
+        self.rate = rate
+        self.unless = unless
+
+
+################################################################################
+# Caps
+################################################################################
+
+#
+# Every cap is called with the simulation, the buckets so far, this year's
+# income, and this year's tax deductions.
+#
+
+def employer_hsa(engine, buckets, income, deductions):
+    return engine.employer_contribution_hsa
+
+
+def employer_match_401k(engine, buckets, income, deductions):
+    return min(
+        min(
+            engine.get_income() * engine.employer_match_401k,
+            engine.get_401k_total_contribution_limit()
+        ),
+        engine.get_income() * engine.max_contribution_percentage_401k
+    )
+
+
+def hsa_limit(engine, buckets, income, deductions):
+    return min(income, engine.get_hsa_contribution_limit() - buckets["hsa"])
+
+
+def normal_limit_401k(engine, buckets, income, deductions):
+    """
+    Employer match does not count towards the normal 401k limit.
+    """
+    return min(
+        min(
+            income,
+            engine.get_401k_normal_contribution_limit() - buckets["employer_401k"]
+        ),
+        engine.get_income() * (
+            engine.max_contribution_percentage_401k
+            - engine.employer_match_401k
+        )
+    )
+
+
+def ira_limit(engine, buckets, income, deductions):
+    return min(income, engine.get_ira_contribution_limit())
+
+
+def mega_backdoor_roth(engine, buckets, income, deductions):
+    return min(
+        income,
+        (
+            engine.get_401k_total_contribution_limit()
+            - buckets["trad_401k"]
+            - buckets["roth_401k"]
+        )
+    )
+
+
+def standard_deduction(engine, buckets, income, deductions):
+    """
+    This much traditional money will not have federal income taxes.
+    """
+    return max((
+        engine.get_standard_deduction()
+        - income
+        - buckets["trad_401k"]
+        - buckets["trad_ira"]
+    ), 0)
+
+
+def zero_tax_ltcg(engine, buckets, income, deductions):
+    """
+    This much in gains will not have federal income taxes.
+    """
+    return max(engine.get_zero_tax_ltcg_income() - (
+        income
+        + buckets["trad_401k"]
+        + buckets["trad_ira"]
+        - deductions
+    ), 0)
+
+
+caps = {
+    'employer-hsa': employer_hsa,
+    'employer-match-401k': employer_match_401k,
+    'hsa-limit': hsa_limit,
+    'normal-limit-401k': normal_limit_401k,
+    'ira-limit': ira_limit,
+    'mega-backdoor-roth': mega_backdoor_roth,
+    'standard-deduction': standard_deduction,
+    'zero-tax-ltcg': zero_tax_ltcg,
+}
+
+
+################################################################################
+# Resolvers
+################################################################################
+
+def preferred_401k(engine, buckets, amount, income):
+    return "roth_401k" if engine.prefer_roth() else "trad_401k"
+
+
+def preferred_ira(engine, buckets, amount, income):
+    """
+    If there are no tax deductions for the traditional IRA (because our income
+    is too high) we might as well contribute to Roth.
+
+    TODO: Maybe add a more granular approach, rather than an all or nothing
+    approach.
+    """
+    would_be_agi_if_trad = (
+        income
+        - buckets["hsa"]
+        - buckets["trad_401k"]
+        + buckets["employer_401k"] # Employer match doesn't lower AGI.
+        - amount
+    )
+    if engine.prefer_roth() or not federal_taxes.fully_tax_deductible_ira(
+            would_be_agi_if_trad, engine.is_married()):
+        return "roth_ira"
+    return "trad_ira"
+
+
+resolvers = {
+    '401k': preferred_401k,
+    'ira': preferred_ira,
+}
+
+
+################################################################################
+# Policies
+################################################################################
+
+#
+# This is the order we contribute to accounts while we are working.
+#
+CONTRIBUTION_POLICY = [
+    #
+    # First, we must get our employer HSA contribution. We are not required to
+    # contribute anything for this.
+    #
+    Step("hsa", cap="employer-hsa"),
+    #
+    # Next, we must get the employer 401k match. This is free money. Then add
+    # in the employer contribution. Normally, this is always going to the
+    # pre-tax (traditional) bucket.
+    #
+    Step("401k", cap="employer-match-401k"),
+    Step("trad_401k", cap="employer-match-401k", employer=True),
+    #
+    # Next, contribute to your HSA since it is the ultimate retirement account.
+    #
+    # https://www.madfientist.com/ultimate-retirement-account/
+    #
+    Step("hsa", cap="hsa-limit"),
+    Step("401k", cap="normal-limit-401k"),
+    Step("ira", cap="ira-limit"),
+    Step("roth_ira", cap="mega-backdoor-roth", when="do_mega_backdoor_roth"),
+]
+
+#
+# This is the order we withdraw from accounts, after RMDs and Roth conversions.
+#
+WITHDRAWAL_POLICY = [
+    #
+    # If we can withdrawal money without penalty, we should at least withdrawal
+    # the standard deduction, because this will not have federal income taxes
+    # and it will reduce our RMDs later.
+    #
+    Step("trad_401k", cap="standard-deduction",
+         when="can_make_401k_withdrawal_penalty_free"),
+    #
+    # If we didn't get enough from the traditional 401k, the next best option
+    # is taxable. Up until the $80k mark for married folk. This is a lot of
+    # space. If we're younger than 60, we want to do this before we try to
+    # withdrawal from IRAs, because those will be penalized.
+    #
+    Step("taxable", cap="zero-tax-ltcg",
+         when="can_make_ira_withdrawal_penalty_free"),
+    #
+    # Next, if we didn't have enough in taxable, we should take from the
+    # traditional IRA up to the standard deduction, so it's not taxed.
+    #
+    Step("trad_ira", cap="standard-deduction",
+         when="can_make_ira_withdrawal_penalty_free"),
+    #
+    # This will withdrawal whatever we need from the LTCG zero bracket
+    # regardless of age. Then, regardless of penalty, take the standard
+    # deduction.
+    #
+    Step("taxable", cap="zero-tax-ltcg"),
+    Step("trad_401k", cap="standard-deduction"),
+    Step("trad_ira", cap="standard-deduction"),
+    #
+    # Roth contributions can be withdrawn without penalty.
+    #
+    Step("roth_401k", limit="contributions"),
+    Step("roth_ira", limit="contributions"),
+    #
+    # Time to drain our taxable account. Everything else will cost us. LTCG
+    # will be cheaper than income tax.
+    #
+    Step("taxable"),
+    #
+    # We'll have to pay some level of income tax on this.
+    #
+    Step("trad_401k"),
+    Step("trad_ira"),
+    #
+    # We're old, we need money, and we've run out of money in other accounts.
+    # Non-qualified withdrawals will be treated as income.
+    #
+    Step("hsa", when="can_make_hsa_withdrawal_penalty_free"),
+    #
+    # Unless we're younger than 60, we'll have to pay income tax on the gains.
+    #
+    Step("roth_401k_with_interest"),
+    Step("roth_ira_with_interest"),
+    #
+    # I think that HSA early withdrawal penalties are the worse and, as of
+    # 2021, you must be five years older than other retirement accounts.
+    #
+    Step("hsa"),
+]
+
+#
+# Police officers, firefighters, EMTs, and air traffic controllers are
+# considered public safety employees, and they get a little extra time to
+# access their qualified retirement plans. If you are under age 65, you pay a
+# 20% penalty on nonmedical HSA withdrawals.
+#
+# TODO: Check that these are right.
+#
+PENALTIES = [
+    Penalty("roth_ira", 0.10, unless="can_make_ira_withdrawal_penalty_free"),
+    Penalty("trad_ira", 0.10, unless="can_make_ira_withdrawal_penalty_free"),
+    Penalty("roth_401k", 0.10, unless="can_make_401k_withdrawal_penalty_free"),
+    Penalty("trad_401k", 0.10, unless="can_make_401k_withdrawal_penalty_free"),
+    Penalty("hsa", 0.20, unless="can_make_hsa_withdrawal_penalty_free"),
+]
+
+
+#
+# Compiled steps are shared by every simulation with the same policy.
+#
+compiled_steps = {}
+
+
+class CompiledPolicy:
+    """
+    A policy is compiled once per simulation. Each year, only the steps whose
+    conditions are true are compiled into a function that runs them, with
+    their caps, resolvers, and buckets already looked up, because this is run
+    many times per year while searching for the right contribution or
+    withdrawal.
+    """
+    def __init__(self, steps, buckets, penalties=(), withdrawals=False):
+        self.steps = list(steps)
+        self.buckets = buckets
+        self.withdrawals = withdrawals
+        self.account_names = [get_account_name(step.bucket) for step in self.steps]
+        self.penalties = [
+            (penalty.bucket, penalty.rate, penalty.unless)
+            for penalty in penalties
+        ]
+        for step in self.steps:
+            assert step.cap is None or step.cap in caps, step
+            assert step.bucket in buckets or step.bucket in resolvers, step
+
+    def __deepcopy__(self, memo):
+        """
+        A compiled policy never changes, so copies of a simulation can share it.
+        """
+        return self
+
+    def get_steps(self, engine):
+        """
+        These are the steps that happen this year. For withdrawals, the
+        engine's get_account() returns the account that a bucket withdraws
+        from. If it returns None, the engine does not have that account and the
+        step is skipped. Accounts do not change while we search, so how much is
+        in them is only checked once.
+        """
+        active = []
+        available = []
+        for index, step in enumerate(self.steps):
+            if step.when is not None and not getattr(engine, step.when)():
+                continue
+            if self.withdrawals:
+                account = engine.get_account(self.account_names[index])
+                if account is None:
+                    continue
+                if step.limit == "contributions":
+                    available.append(account.get_contributions())
+                else:
+                    available.append(account.get_value())
+            active.append(step)
+
+        key = (self.buckets, self.withdrawals, repr(active))
+        if key not in compiled_steps:
+            compiled_steps[key] = self.compile(active)
+        return compiled_steps[key], tuple(available)
+
+    def compile(self, steps):
+        """
+        Look up everything each step needs ahead of time, and return one
+        function that runs the steps in order. What is left is always
+        subtracted in the same order, so the results do not depend on which
+        step is running.
+        """
+        get_buckets = operator.itemgetter(*self.buckets)
+        plan = []
+        for index, step in enumerate(steps):
+            #
+            # For withdrawals, these are the buckets that take from the same
+            # account as this one, so they share what is available in it.
+            #
+            same_account = None
+            if self.withdrawals:
+                same_account = [
+                    other for other in self.buckets
+                    if get_account_name(other) == get_account_name(step.bucket)
+                ]
+            plan.append((
+                index,
+                step.bucket,
+                caps[step.cap] if step.cap is not None else None,
+                resolvers.get(step.bucket),
+                same_account,
+                step.employer,
+            ))
+
+        def run(engine, total, buckets, income, deductions, available):
+            for index, bucket, cap, resolver, same_account, employer in plan:
+                amount = total
+                for value in get_buckets(buckets):
+                    amount -= value
+                if cap is not None:
+                    amount = min(amount, cap(engine, buckets, income, deductions))
+                if resolver is not None:
+                    bucket = resolver(engine, buckets, amount, income)
+                if same_account is not None:
+                    left = available[index]
+                    for other in same_account:
+                        left -= buckets[other]
+                    amount = min(amount, left)
+                buckets[bucket] += amount
+                if employer:
+                    buckets["employer_401k"] += amount
+            return buckets
+        return run
+
+    def get_penalties(self, engine):
+        """
+        These are the penalties that apply this year.
+        """
+        return [
+            (bucket, rate)
+            for bucket, rate, unless in self.penalties
+            if not getattr(engine, unless)()
+        ]
+
+    def get_empty_buckets(self):
+        buckets = dict.fromkeys(self.buckets, 0)
+        buckets["employer_401k"] = 0
+        return buckets
+
+    def run(self, steps, engine, total, buckets, income=0, deductions=0):
+        """
+        Run this year's steps until the total has been contributed or
+        withdrawn. Each step takes as much as it can, up to what is left, its
+        cap, and (for withdrawals) what is left in the account.
+        """
+        function, available = steps
+        return function(engine, total, buckets, income, deductions, available)
+
+    def get_penalty_fees(self, penalties, buckets):
+        penalty_fees = 0
+        for bucket, rate in penalties:
+            penalty_fees += buckets[bucket] * rate
+        return penalty_fees
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import atexit
+import cProfile
+import glob
+import os
+import pstats
+import shutil
+import signal
+import tempfile
+import uuid
+
+#
+# The profiling session of this process, or None when profiling is off. It is
+# only started by the command line, in the process that parsed it.
+#
+session = None
+
+#
+# How much CPU time passes between stack samples for the flame graph.
+#
+SAMPLE_INTERVAL = 0.001
+
+
+class Profiler:
+    """
+    This profiles the process it runs in. With profile, it is cProfile, which
+    sees every call. With flamegraph, it samples the whole stack every
+    SAMPLE_INTERVAL seconds of CPU time, which is what a flame graph needs and
+    cProfile doesn't keep. Sampling uses a signal, so it only works on Unix,
+    and only in the main thread.
+    """
+    def __init__(self, profile=False, flamegraph=False):
+        self.profile = cProfile.Profile() if profile else None
+        self.flamegraph = flamegraph
+        self.samples = {}
+        self.previous_handler = None
+        self.previous_timer = None
+
+    def sample(self, signum, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(
+                f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                f":{code.co_firstlineno})"
+            )
+            frame = frame.f_back
+        stack = ";".join(reversed(names))
+        self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def start(self):
+        if self.flamegraph:
+            self.previous_handler = signal.signal(signal.SIGPROF, self.sample)
+            self.previous_timer = signal.setitimer(
+                signal.ITIMER_PROF, SAMPLE_INTERVAL, SAMPLE_INTERVAL
+            )
+        if self.profile:
+            self.profile.enable()
+
+    def stop(self):
+        if self.profile:
+            self.profile.disable()
+        if self.flamegraph:
+            signal.setitimer(signal.ITIMER_PROF, *self.previous_timer)
+            signal.signal(signal.SIGPROF, self.previous_handler)
+
+    def dump(self, directory):
+        """
+        Write what was collected to new files in the directory, so that the
+        profiles from every process can be merged later.
+        """
+        name = os.path.join(directory, f"{os.getpid()}-{uuid.uuid4().hex}")
+        if self.profile:
+            self.profile.dump_stats(f"{name}.pstats")
+        if self.flamegraph:
+            with open(f"{name}.folded", "w") as f:
+                for stack, count in self.samples.items():
+                    f.write(f"{stack} {count}\n")
+
+
+class Session:
+    """
+    The profiler of the process that parsed the command line, where the
+    profiles of its workers are collected, and where they all end up.
+    """
+    def __init__(self, profile_path, flamegraph_path):
+        self.profile_path = profile_path
+        self.flamegraph_path = flamegraph_path
+        self.directory = tempfile.mkdtemp(prefix="wealth-optimizer-profile-")
+        self.pid = os.getpid()
+        self.profiler = Profiler(bool(profile_path), bool(flamegraph_path))
+
+    def finish(self):
+        """
+        Stop profiling, and merge the profile of this process with the profiles
+        of every worker into one of each.
+        """
+        self.profiler.stop()
+        self.profiler.dump(self.directory)
+        if self.profile_path:
+            paths = sorted(glob.glob(os.path.join(self.directory, "*.pstats")))
+            merged = pstats.Stats(paths[0])
+            merged.add(*paths[1:])
+            merged.dump_stats(self.profile_path)
+        if self.flamegraph_path:
+            samples = {}
+            for path in glob.glob(os.path.join(self.directory, "*.folded")):
+                with open(path) as f:
+                    for line in f:
+                        stack, _, count = line.rstrip("\n").rpartition(" ")
+                        samples[stack] = samples.get(stack, 0) + int(count)
+            with open(self.flamegraph_path, "w") as f:
+                for stack, count in sorted(samples.items()):
+                    f.write(f"{stack} {count}\n")
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class Profiled:
+    """
+    This wraps a worker function so it is profiled in the worker, and its
+    profile is written where the session can find it. It can be pickled as long
+    as the function can. If it runs in the process that is already profiling
+    (with only one worker), it doesn't need to do anything.
+    """
+    def __init__(self, function, directory, profile, flamegraph):
+        self.function = function
+        self.directory = directory
+        self.profile = profile
+        self.flamegraph = flamegraph
+
+    def __call__(self, *args):
+        if session is not None and session.pid == os.getpid():
+            return self.function(*args)
+        profiler = Profiler(self.profile, self.flamegraph)
+        profiler.start()
+        try:
+            return self.function(*args)
+        finally:
+            profiler.stop()
+            profiler.dump(self.directory)
+
+
+def start(args):
+    """
+    Start profiling if the command line asked for it. The profiles are written
+    when the process exits, however it exits.
+    """
+    global session
+    if not (args.profile or args.flamegraph):
+        return
+    session = Session(args.profile, args.flamegraph)
+    session.profiler.start()
+    atexit.register(session.finish)
+
+
+def wrap(function):
+    """
+    If we are profiling, wrap a function that is about to be sent to a worker
+    (see Profiled). Otherwise, this is the same function.
+    """
+    if session is None:
+        return function
+    return Profiled(
+        function,
+        session.directory,
+        bool(session.profile_path),
+        bool(session.flamegraph_path)
+    )
+
+
+def add_arguments(parser):
+    """
+    Both sim.py and graph.py accept these.
+    """
+    parser.add_argument(
+        "--profile",
+        help=(
+            "Profile with cProfile, including every worker process, and write"
+            " the merged profile to this file. Read it with python -m pstats."
+        ),
+        required=False,
+        metavar="FILE",
+        default=None
+    )
+    parser.add_argument(
+        "--flamegraph",
+        help=(
+            "Sample the stack, including every worker process, and write the"
+            " collapsed stacks to this file for flamegraph.pl or speedscope."
+        ),
+        required=False,
+        metavar="FILE",
+        default=None
+    )
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+import datetime
+import multiprocessing
+import time
+
+from rich.console import Console
+from rich.live import Live
+from rich.progress_bar import ProgressBar
+from rich.table import Table
+
+#
+# The count of finished simulations, shared with every worker process, or None
+# when nothing is showing progress. Workers forked after it is created add to
+# the same count.
+#
+counter = None
+
+#
+# How many times a second progress is drawn. Updates in between only change a
+# few numbers, so they cost next to nothing however often they happen.
+#
+REFRESH_PER_SECOND = 4
+
+
+def count(amount=1):
+    """
+    Count finished simulations, in this process or any worker.
+    """
+    if counter is not None:
+        with counter.get_lock():
+            counter.value += amount
+
+
+class Reporter:
+    """
+    This shows what a long search is doing: a description, how many of its
+    tasks are done (with a bar and an ETA, if we know how many there are), and
+    how many simulations a second every process is finishing. It is drawn
+    REFRESH_PER_SECOND times a second, not every time something changes, and
+    when the output isn't a terminal, it isn't drawn at all.
+
+    Use it like:
+
+        with progress.Reporter("Calculating", total=len(cells)) as reporter:
+            for cell in cells:
+                reporter.update("Calculating {}", cell)
+                ...
+                reporter.advance()
+
+    The description is only formatted when it is drawn.
+    """
+    def __init__(self, description="", total=None, completed=0, console=None):
+        self.console = console or Console()
+        self.description = description
+        self.values = ()
+        self.total = total
+        self.completed = completed
+        self.started_with = completed
+        self.start = None
+        self.live = None
+        self.previous_counter = None
+
+    def __enter__(self):
+        global counter
+        self.start = time.perf_counter()
+        if not self.console.is_terminal:
+            return self
+        self.previous_counter = counter
+        counter = multiprocessing.Value("q", 0)
+        self.live = Live(
+            console=self.console,
+            transient=True,
+            refresh_per_second=REFRESH_PER_SECOND,
+            get_renderable=self.render
+        )
+        self.live.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        global counter
+        if self.live is not None:
+            self.live.stop()
+            counter = self.previous_counter
+        return False
+
+    def update(self, description, *values):
+        self.description = description
+        self.values = values
+
+    def advance(self, amount=1):
+        self.completed += amount
+
+    def get_simulations(self):
+        return counter.value if counter is not None else 0
+
+    def render(self):
+        elapsed = time.perf_counter() - self.start
+        parts = []
+        if self.total:
+            parts.append(f"{self.completed:,}/{self.total:,}")
+        simulations = self.get_simulations()
+        if simulations:
+            parts.append(f"{simulations / elapsed:,.0f} simulations/s")
+        done = self.completed - self.started_with
+        if self.total and done:
+            remaining = (self.total - self.completed) * elapsed / done
+            parts.append(f"ETA {datetime.timedelta(seconds=round(remaining))}")
+
+        grid = Table.grid(padding=(0, 1))
+        grid.add_column(no_wrap=True)
+        row = [self.description.format(*self.values)]
+        if self.total:
+            grid.add_column(width=20)
+            row.append(ProgressBar(total=self.total, completed=self.completed))
+        grid.add_column(no_wrap=True)
+        row.append("  ".join(parts))
+        grid.add_row(*row)
+        return grid
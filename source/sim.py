@@ -1,18 +1,36 @@
 #!/usr/bin/env python3
 
 import argparse
+import copy
+import inspect
+import sys
+import time
 
 from rich.table import Table
-from rich.live import Live
 from rich.console import Console
 
+import cache
 import federal_taxes
+import ledger
+import memory
+import metrics
+import mortality
+import optimize
+import policy
+import progress
+import profiling
 import state_taxes
+import stats
+import tracing
 import ult
 
 from account import Account
 
 
+class Accounts:
+    """This class is just used as a container."""
+
+
 class Simulation:
     """
     Simulate the state of finances for every year until you die.
@@ -54,7 +72,13 @@ class Simulation:
                  public_safety_employee,
                  employer_match_401k,
                  max_contribution_percentage_401k,
-                 employer_contribution_hsa
+                 employer_contribution_hsa,
+                 roth_conversion_schedule=None,
+                 roth_conversion_bracket=None,
+                 roth_conversion_ceiling=None,
+                 retirement_spending=None,
+                 contribution_policy=None,
+                 withdrawal_policy=None
     ):
         assert 0 <= current_age <= age_of_death <= 115
         assert 0 <= income
@@ -87,9 +111,19 @@ class Simulation:
         self.params_table.add_row("Starting Balance Trad IRA", f"{starting_balance_trad_ira:,.2f}")
         self.params_table.add_row("Starting Balance Roth 401k", f"{starting_balance_roth_401k:,.2f}")
         self.params_table.add_row("Starting Balance Roth IRA", f"{starting_balance_roth_ira:,.2f}")
-        self.params_table.add_row("Yearly Roth Conversion Amount", f"{roth_conversion_amount:,.2f}")
+        if roth_conversion_bracket is not None:
+            self.params_table.add_row("Roth Conversion Fills Bracket", f"{roth_conversion_bracket*100:.2f}%")
+        if roth_conversion_ceiling is not None:
+            self.params_table.add_row("Roth Conversion Income Ceiling", f"{roth_conversion_ceiling:,.2f}")
+        if roth_conversion_schedule is not None:
+            for age, amount in sorted(roth_conversion_schedule.items()):
+                self.params_table.add_row(f"Roth Conversion Amount at {age}", f"{amount:,.2f}")
+        elif roth_conversion_bracket is None and roth_conversion_ceiling is None:
+            self.params_table.add_row("Yearly Roth Conversion Amount", f"{roth_conversion_amount:,.2f}")
         self.params_table.add_row("Years to Prefer Roth Contributions", str(years_to_wait))
         self.params_table.add_row("Spending", f"{spending:,.2f}")
+        if retirement_spending is not None:
+            self.params_table.add_row("Spending in Retirement", f"{retirement_spending:,.2f}")
         self.params_table.add_row("HSA Contribution Limit", f"{contribution_limit_hsa:,.2f}")
         self.params_table.add_row("HSA Catch-up Contribution", f"{contribution_catch_up_amount_hsa:,.2f}")
         self.params_table.add_row("HSA Catch-up Contribution Age", f"{contribution_catch_up_age_hsa:d}")
@@ -105,9 +139,6 @@ class Simulation:
         self.params_table.add_row("Max Contribution Percentage 401k", f"{max_contribution_percentage_401k*100:.2f}%")
         self.params_table.add_row("Employer Contribution HSA", f"{employer_contribution_hsa:,.2f}")
 
-        class Accounts:
-            """This class is just used as a container."""
-
         #
         # These are our accounts:
         #
@@ -162,7 +193,26 @@ class Simulation:
         self.public_safety_employee = public_safety_employee
         self.retirement_state = retirement_state
         self.roth_conversion_amount = roth_conversion_amount
+        self.roth_conversion_schedule = roth_conversion_schedule
+        self.roth_conversion_bracket = roth_conversion_bracket
+        self.roth_conversion_ceiling = roth_conversion_ceiling
+
+        #
+        # These decide the order we contribute to and withdraw from accounts.
+        # Other policies can be given to compare strategies.
+        #
+        self.contribution_policy = policy.CompiledPolicy(
+            contribution_policy or policy.CONTRIBUTION_POLICY,
+            policy.CONTRIBUTION_BUCKETS
+        )
+        self.withdrawal_policy = policy.CompiledPolicy(
+            withdrawal_policy or policy.WITHDRAWAL_POLICY,
+            policy.WITHDRAWAL_BUCKETS,
+            policy.PENALTIES,
+            withdrawals=True
+        )
         self.spending = spending
+        self.retirement_spending = retirement_spending
         self.starting_age = current_age
         self.starting_income = income
         self.work_state = work_state
@@ -193,6 +243,19 @@ class Simulation:
         self.max_contribution_percentage_401k = max_contribution_percentage_401k
         self.employer_contribution_hsa = employer_contribution_hsa
 
+        #
+        # This will contain the numbers behind the table, for writing out, if
+        # anything will read them (see ledger.start()).
+        #
+        self.ledger = ledger.Ledger() if ledger.recording else None
+
+        #
+        # What we would have left if we died at each age simulated so far by
+        # simulate_until(), so simulate_every_age_of_death() has every age even
+        # when it picks up from a checkpoint.
+        #
+        self.outcomes = {}
+
         #
         # This will contain a table with all of our math.
         #
@@ -278,8 +341,23 @@ class Simulation:
         return max(self.starting_income * multiplier, self.max_income)
 
     def get_spending(self):
+        """
+        If there is a separate amount for retirement, we spend that once we
+        retire, and the usual amount while we work.
+        """
+        if self.retirement_spending is not None and self.is_retired():
+            return self.retirement_spending
         return self.spending
 
+    def get_standard_deduction(self):
+        return federal_taxes.get_standard_deduction(self.is_married())
+
+    def get_zero_tax_ltcg_income(self):
+        return federal_taxes.zero_tax_ltcg_income(self.is_married())
+
+    def get_account(self, account_name):
+        return getattr(self.accounts, account_name)
+
     def get_rule_of_55_age(self):
         """
         Under the terms of this rule, you can withdraw funds from your current
@@ -447,14 +525,45 @@ class Simulation:
     def do_roth_conversion(self):
         return self.is_retired() and not self.must_take_rmds()
 
-    def get_roth_conversion_amount(self):
+    def has_roth_conversion_ceiling(self):
+        """
+        If there is a Roth conversion bracket or ceiling, it decides how much
+        to convert each year, rather than the amount or schedule.
+        """
+        return (
+            self.roth_conversion_bracket is not None
+            or self.roth_conversion_ceiling is not None
+        )
+
+    def get_roth_conversion_amount(self, other_income=0):
         """
         This is how much we will transfer from traditional 401k/IRA to your Roth
-        IRA after retirement but before RMDs are required.
+        IRA after retirement but before RMDs are required. If there is a Roth
+        conversion schedule, it maps each age to that year's amount, and ages
+        that are not in it do not convert anything.
+
+        If there is a Roth conversion bracket (a federal tax rate) or ceiling
+        (an income), we convert exactly enough to bring this year's income up
+        to the top of that bracket or the ceiling, whichever is lower. The
+        other income is everything else that will be taxed as income this year.
         """
+        if self.has_roth_conversion_ceiling():
+            ceiling = sys.float_info.max
+            if self.roth_conversion_bracket is not None:
+                ceiling = federal_taxes.get_income_to_fill_bracket(
+                    self.roth_conversion_bracket,
+                    self.is_married()
+                )
+            if self.roth_conversion_ceiling is not None:
+                ceiling = min(ceiling, self.roth_conversion_ceiling)
+            return max(round(ceiling - other_income, 2), 0)
+        if self.roth_conversion_schedule is not None:
+            return self.roth_conversion_schedule.get(self.get_current_age(), 0)
         return self.roth_conversion_amount
 
     def get_estate_tax(self):
+        if stats.collector is not None:
+            stats.collector.count("tax_calls/estate")
         return federal_taxes.calculate_estate_tax(self.get_total_assets())
 
     def get_taxes_for_heir(self):
@@ -467,6 +576,8 @@ class Simulation:
         # difference in age, rather than a hardcoded value. To simplify our
         # calculation, we can assume everything goes to the eldest child.
         #
+        if stats.collector is not None:
+            stats.collector.count("tax_calls/heir")
         return federal_taxes.calculate_minimum_remaining_tax_for_heir(
             (
                 self.accounts.trad_401k.get_value()
@@ -502,6 +613,28 @@ class Simulation:
         tax_deductions = 0
         this_years_income = 0
 
+        #
+        # If stats are on, count what we do and time each part of the year.
+        #
+        collector = stats.collector
+        if collector is not None:
+            year_start = phase_start = time.perf_counter()
+            counters = collector.get_counters()
+            contribution_iterations = counters.get(
+                "contribution_bisection_iterations", 0
+            )
+            withdrawal_iterations = counters.get(
+                "withdrawal_bisection_iterations", 0
+            )
+
+        #
+        # If tracing is on (and this year is sampled), record every iteration
+        # of the binary searches below.
+        #
+        tracer = tracing.tracer
+        if tracer is not None and not tracer.start_year(self.get_current_age()):
+            tracer = None
+
         ########################################################################
         # Contributions
         ########################################################################
@@ -529,153 +662,31 @@ class Simulation:
         #
         if not self.is_retired():
             this_years_income = self.get_income()
+            contribution_steps = self.contribution_policy.get_steps(self)
 
             #
             # We'll break out of this once the ideal amount is found.
             #
             while True:
-                hsa_contribution = 0
                 taxable_contribution = 0
-                roth_401k_contribution = 0
-                roth_ira_contribution = 0
-                trad_401k_contribution = 0
-                trad_ira_contribution = 0
-                employer_401k_contribution = 0
-
-                def whats_left_to_contribute():
-                    return (
-                        total_contribution_limit
-                        - hsa_contribution
-                        - roth_401k_contribution
-                        - roth_ira_contribution
-                        - trad_401k_contribution
-                        - trad_ira_contribution
-                    )
-
-                #
-                # First, we must get our employer HSA contribution. We are not
-                # required to contribute anything for this.
-                #
-                hsa_contribution += min(
-                    self.employer_contribution_hsa,
-                    whats_left_to_contribute()
-                )
 
                 #
-                # Next, we must get the employer 401k match. This is free money.
+                # Contribute to accounts in the order of the contribution
+                # policy, until we hit the total contribution limit.
                 #
-                if self.prefer_roth():
-                    roth_401k_contribution += min(
-                        min(min(
-                            self.get_income() * self.employer_match_401k,
-                            self.get_401k_total_contribution_limit()
-                        ), whats_left_to_contribute()),
-                        self.get_income() * self.max_contribution_percentage_401k
-                    )
-                else:
-                    trad_401k_contribution += min(
-                        min(min(
-                            self.get_income() * self.employer_match_401k,
-                            self.get_401k_total_contribution_limit()
-                        ), whats_left_to_contribute()),
-                        self.get_income() * self.max_contribution_percentage_401k
-                    )
-
-                #
-                # Add in the employer contribution. Normally, this is always
-                # going to the pre-tax (traditional) bucket.
-                #
-                employer_401k_contribution = min(
-                        min(min(
-                            self.get_income() * self.employer_match_401k,
-                            self.get_401k_total_contribution_limit()
-                        ), whats_left_to_contribute()),
-                        self.get_income() * self.max_contribution_percentage_401k
-                    )
-                trad_401k_contribution += employer_401k_contribution
-
-                #
-                # Next, contribute to your HSA since it is the ultimate
-                # retirement account.
-                #
-                # https://www.madfientist.com/ultimate-retirement-account/
-                #
-                hsa_contribution += min(min(
-                    this_years_income,
-                    self.get_hsa_contribution_limit() - hsa_contribution
-                ), whats_left_to_contribute())
-
-                #
-                # Calculate 401k contribution. Employer match does not count
-                # towards the normal 401k limit.
-                #
-                if self.prefer_roth():
-                    roth_401k_contribution += min(
-                        min(min(
-                            this_years_income,
-                            self.get_401k_normal_contribution_limit() - employer_401k_contribution
-                        ), whats_left_to_contribute()),
-                        self.get_income() * (
-                            self.max_contribution_percentage_401k
-                            - self.employer_match_401k
-                        )
-                    )
-                else:
-                    trad_401k_contribution += min(
-                        min(min(
-                            this_years_income,
-                            self.get_401k_normal_contribution_limit() - employer_401k_contribution
-                        ), whats_left_to_contribute()),
-                        self.get_income() * (
-                            self.max_contribution_percentage_401k
-                            - self.employer_match_401k
-                        )
-                    )
-
-                #
-                # Calculate IRA contribution. If there are no tax deductions for
-                # the traditional IRA (because our income is too high) we might
-                # as well contribute to Roth.
-                #
-                would_be_ira_contribution = min(
-                    min(this_years_income, self.get_ira_contribution_limit()),
-                    whats_left_to_contribute()
-                )
-
-                would_be_agi_if_trad = (
+                contributions = self.contribution_policy.run(
+                    contribution_steps,
+                    self,
+                    total_contribution_limit,
+                    self.contribution_policy.get_empty_buckets(),
                     this_years_income
-                    - hsa_contribution
-                    - trad_401k_contribution
-                    + employer_401k_contribution # Employer match doesn't lower AGI.
-                    - would_be_ira_contribution
                 )
-
-                #
-                # TODO: Maybe add a more granular approach, rather than an all
-                # or nothing approach.
-                #
-                if self.prefer_roth() or not federal_taxes.fully_tax_deductible_ira(
-                        would_be_agi_if_trad, self.is_married()):
-                    roth_ira_contribution += would_be_ira_contribution
-                else:
-                    trad_ira_contribution += would_be_ira_contribution
-
-                #
-                # Calculate Mega-Backdoor Roth contribution, if applicable.
-                #
-                if self.do_mega_backdoor_roth():
-                    after_tax_contribution = min(
-                        min(
-                            this_years_income,
-                            (
-                                self.get_401k_total_contribution_limit()
-                                - trad_401k_contribution
-                                - roth_401k_contribution
-                            )
-                        ),
-                        whats_left_to_contribute()
-                    )
-                    roth_ira_contribution += after_tax_contribution
+                hsa_contribution = contributions["hsa"]
+                roth_401k_contribution = contributions["roth_401k"]
+                roth_ira_contribution = contributions["roth_ira"]
+                trad_401k_contribution = contributions["trad_401k"]
+                trad_ira_contribution = contributions["trad_ira"]
+                employer_401k_contribution = contributions["employer_401k"]
 
                 tax_deductions = (
                     hsa_contribution
@@ -718,6 +729,12 @@ class Simulation:
                     self.get_current_state(),
                     self.get_num_dependents()
                 )
+                if collector is not None:
+                    collector.count("contribution_bisection_iterations")
+                    collector.count("tax_calls/fica")
+                    collector.count("tax_calls/federal_income")
+                    collector.count("tax_calls/savers_credit")
+                    collector.count("tax_calls/state")
 
                 #
                 # We can't have negative taxes. The saver's credit could
@@ -740,6 +757,15 @@ class Simulation:
                     - trad_ira_contribution
                 )
 
+                if tracer is not None:
+                    tracer.record(
+                        "contribution",
+                        minimum_contribution,
+                        maximum_contribution,
+                        total_contribution_limit,
+                        result
+                    )
+
                 #
                 # Binary search our way to the ideal contribution. We want the
                 # result to be zero, which will happen when there is no leftover
@@ -775,6 +801,11 @@ class Simulation:
             self.accounts.roth_ira.contribute(roth_ira_contribution)
             self.accounts.trad_ira.contribute(trad_ira_contribution)
 
+        if collector is not None:
+            now = time.perf_counter()
+            collector.add_time("contributions", now - phase_start)
+            phase_start = now
+
         ########################################################################
         # Required Minimum Distribution (RMD) Calculations
         ########################################################################
@@ -789,43 +820,38 @@ class Simulation:
         # Withdrawals
         ########################################################################
 
+        #
+        # A Roth conversion that fills a bracket or ceiling depends on how much
+        # of our other withdrawals are taxed as income, so it is worked out
+        # inside the search below, after them. Any other conversion is a set
+        # amount, so it is part of the bare minimum.
+        #
         bare_minimum_withdrawal = trad_401k_rmd + trad_ira_rmd
-        if self.do_roth_conversion():
-            bare_minimum_withdrawal += self.get_roth_conversion_amount()
+        roth_conversion_amount = 0
+        fill_roth_conversion = (
+            self.do_roth_conversion() and self.has_roth_conversion_ceiling()
+        )
+        if self.do_roth_conversion() and not fill_roth_conversion:
+            roth_conversion_amount = self.get_roth_conversion_amount()
+            bare_minimum_withdrawal += roth_conversion_amount
         minimum_withdrawal = bare_minimum_withdrawal
         total_withdrawal = bare_minimum_withdrawal
         maximum_withdrawal = self.get_total_assets()
         penalty_fees = 0
+        withdrawal_steps = self.withdrawal_policy.get_steps(self)
+        withdrawal_penalties = self.withdrawal_policy.get_penalties(self)
 
         while True:
-            hsa_withdrawal = 0
-            taxable_withdrawal = 0
-            roth_401k_withdrawal = 0
-            roth_ira_withdrawal = 0
+            if collector is not None:
+                collector.count("withdrawal_bisection_iterations")
             trad_401k_withdrawal = 0
             trad_ira_withdrawal = 0
-            roth_401k_with_interest_withdrawal = 0
-            roth_ira_with_interest_withdrawal = 0
 
             ltcg_taxes = 0
-            penalty_fees = 0
             conversion_amount = 0
             roth_gains = 0
             savers_credit = 0
 
-            def whats_left_to_withdrawal():
-                return (
-                    total_withdrawal
-                    - hsa_withdrawal
-                    - taxable_withdrawal
-                    - roth_401k_withdrawal
-                    - roth_ira_withdrawal
-                    - roth_401k_with_interest_withdrawal
-                    - roth_ira_with_interest_withdrawal
-                    - trad_401k_withdrawal
-                    - trad_ira_withdrawal
-                )
-
             #
             # First things first, take the RMDs.
             #
@@ -839,14 +865,14 @@ class Simulation:
             #
             # TODO: Enforce the 5 year maturity rule.
             #
-            if self.do_roth_conversion():
+            if self.do_roth_conversion() and not fill_roth_conversion:
                 trad_401k_conversion = min(
                     self.accounts.trad_401k.get_value() - trad_401k_withdrawal,
-                    self.get_roth_conversion_amount()
+                    roth_conversion_amount
                 )
                 trad_ira_conversion = min(
                     self.accounts.trad_ira.get_value() - trad_ira_withdrawal,
-                    self.get_roth_conversion_amount() - trad_401k_conversion
+                    roth_conversion_amount - trad_401k_conversion
                 )
 
                 conversion_amount = trad_401k_conversion + trad_ira_conversion
@@ -854,187 +880,32 @@ class Simulation:
                 trad_ira_withdrawal += trad_ira_conversion
 
             #
-            # If we can withdrawal money without penalty, we should at least
-            # withdrawal the standard deduction, because this will not have
-            # federal income taxes and it will reduce our RMDs later.
-            #
-            if self.can_make_401k_withdrawal_penalty_free():
-                trad_401k_withdrawal += min(min(
-                    self.accounts.trad_401k.get_value() - trad_401k_withdrawal,
-                    max((
-                        federal_taxes.get_standard_deduction(self.is_married())
-                        - this_years_income
-                        - trad_401k_withdrawal
-                        - trad_ira_withdrawal
-                    ), 0)
-                ), whats_left_to_withdrawal())
-
-            #
-            # If we didn't get enough from the traditional 401k, the next best
-            # option is taxable. Up until the $80k mark for married folk. This
-            # is a lot of space.
+            # Withdraw from accounts in the order of the withdrawal policy,
+            # until we have withdrawn the total, then apply any penalties.
             #
-            # If we're younger than 60, we want to do this before we try to
-            # withdrawal from IRAs, because those will be penalized.
-            #
-            if self.can_make_ira_withdrawal_penalty_free():
-                taxable_withdrawal += min(min(
-                    self.accounts.taxable.get_value() - taxable_withdrawal,
-                    whats_left_to_withdrawal()
-                ), max(federal_taxes.zero_tax_ltcg_income(self.is_married()) - (
-                        this_years_income
-                        + trad_401k_withdrawal
-                        + trad_ira_withdrawal
-                        - tax_deductions
-                    ), 0)
-                )
-
-            #
-            # Next, if we didn't have enough in taxable, we should take from the
-            # traditional IRA up to the standard deduction, so it's not taxed.
-            #
-            if self.can_make_ira_withdrawal_penalty_free():
-                trad_ira_withdrawal += min(min(
-                    self.accounts.trad_ira.get_value() - trad_ira_withdrawal,
-                    max((
-                        federal_taxes.get_standard_deduction(self.is_married())
-                        - this_years_income
-                        - trad_401k_withdrawal
-                        - trad_ira_withdrawal
-                    ), 0)
-                ), whats_left_to_withdrawal())
-
-            #
-            # This will withdrawal whatever we need from the LTCG zero bracket
-            # regardless of age.
-            #
-            taxable_withdrawal += min(min(
-                self.accounts.taxable.get_value() - taxable_withdrawal,
-                whats_left_to_withdrawal()
-            ), max(federal_taxes.zero_tax_ltcg_income(self.is_married()) - (
-                    this_years_income
-                    + trad_401k_withdrawal
-                    + trad_ira_withdrawal
-                    - tax_deductions
-                ), 0)
-            )
-
-            #
-            # Next, regardless of penalty, take the standard deduction.
-            #
-            trad_401k_withdrawal += min(min(
-                self.accounts.trad_401k.get_value() - trad_401k_withdrawal,
-                max((
-                    federal_taxes.get_standard_deduction(self.is_married())
-                    - this_years_income
-                    - trad_401k_withdrawal
-                    - trad_ira_withdrawal
-                ), 0)
-            ), whats_left_to_withdrawal())
-
-            #
-            # If the trad 401k runs out of money, this will cover the rest.
-            #
-            trad_ira_withdrawal += min(min(
-                self.accounts.trad_ira.get_value() - trad_ira_withdrawal,
-                max((
-                    federal_taxes.get_standard_deduction(self.is_married())
-                    - this_years_income
-                    - trad_401k_withdrawal
-                    - trad_ira_withdrawal
-                ), 0)
-            ), whats_left_to_withdrawal())
-
-            #
-            # This will be penalty free.
-            #
-            roth_401k_withdrawal += min(
-                self.accounts.roth_401k.get_contributions() - roth_401k_withdrawal,
-                whats_left_to_withdrawal()
+            withdrawal_buckets = self.withdrawal_policy.get_empty_buckets()
+            withdrawal_buckets["trad_401k"] = trad_401k_withdrawal
+            withdrawal_buckets["trad_ira"] = trad_ira_withdrawal
+            self.withdrawal_policy.run(
+                withdrawal_steps,
+                self,
+                total_withdrawal,
+                withdrawal_buckets,
+                this_years_income,
+                tax_deductions
             )
-            roth_ira_withdrawal += min(
-                self.accounts.roth_ira.get_contributions() - roth_ira_withdrawal,
-                whats_left_to_withdrawal()
-            )
-
-            #
-            # Time to drain our taxable account. Everything else will cost us.
-            # LTCG will be cheaper than income tax.
-            #
-            taxable_withdrawal += min(
-                self.accounts.taxable.get_value() - taxable_withdrawal,
-                whats_left_to_withdrawal()
-            )
-
-            #
-            # We'll have to pay some level of income tax on this.
-            #
-            trad_401k_withdrawal += min(
-                self.accounts.trad_401k.get_value() - trad_401k_withdrawal,
-                whats_left_to_withdrawal()
-            )
-            trad_ira_withdrawal += min(
-                self.accounts.trad_ira.get_value() - trad_ira_withdrawal,
-                whats_left_to_withdrawal()
-            )
-
-            #
-            # We're old, we need money, and we've run out of money in other
-            # accounts. Non-qualified withdrawals will be treated as income.
-            #
-            if self.can_make_hsa_withdrawal_penalty_free():
-                hsa_withdrawal += min(
-                    self.accounts.hsa.get_value() - hsa_withdrawal,
-                    whats_left_to_withdrawal()
-                )
-
-            #
-            # Unless we're younger than 60, we'll have to pay income tax on the
-            # gains. If we're this far, that means we have already extracted all
-            # of our contributions, meaning this whole thing will be treated as
-            # income.
-            #
-            roth_401k_with_interest_withdrawal += min(
-                self.accounts.roth_401k.get_value() - roth_401k_withdrawal,
-                whats_left_to_withdrawal()
-            )
-            roth_ira_with_interest_withdrawal += min(
-                self.accounts.roth_ira.get_value() - roth_ira_withdrawal,
-                whats_left_to_withdrawal()
-            )
-
-            #
-            # I think that HSA early withdrawal penalties are the worse and, as
-            # of 2021, you must be five years older than other retirement
-            # accounts.
-            #
-            hsa_withdrawal += min(
-                self.accounts.hsa.get_value() - hsa_withdrawal,
-                whats_left_to_withdrawal()
+            hsa_withdrawal = withdrawal_buckets["hsa"]
+            taxable_withdrawal = withdrawal_buckets["taxable"]
+            roth_401k_withdrawal = withdrawal_buckets["roth_401k"]
+            roth_ira_withdrawal = withdrawal_buckets["roth_ira"]
+            roth_401k_with_interest_withdrawal = withdrawal_buckets["roth_401k_with_interest"]
+            roth_ira_with_interest_withdrawal = withdrawal_buckets["roth_ira_with_interest"]
+            trad_401k_withdrawal = withdrawal_buckets["trad_401k"]
+            trad_ira_withdrawal = withdrawal_buckets["trad_ira"]
+            penalty_fees = self.withdrawal_policy.get_penalty_fees(
+                withdrawal_penalties, withdrawal_buckets
             )
 
-            #
-            # Police officers, firefighters, EMTs, and air traffic controllers
-            # are considered public safety employees, and they get a little
-            # extra time to access their qualified retirement plans. For them,
-            # the rule applies in the calendar year in which they turn 50.
-            #
-            # TODO: Check that these are right.
-            #
-            if not self.can_make_ira_withdrawal_penalty_free():
-                penalty_fees += roth_ira_withdrawal * 0.10
-                penalty_fees += trad_ira_withdrawal * 0.10
-            if not self.can_make_401k_withdrawal_penalty_free():
-                penalty_fees += roth_401k_withdrawal * 0.10
-                penalty_fees += trad_401k_withdrawal * 0.10
-
-            #
-            # If you are under age 65, you pay a 20% penalty on nonmedical
-            # withdrawals, and you pay the tax in addition to the penalty.
-            #
-            if not self.can_make_hsa_withdrawal_penalty_free():
-                penalty_fees += hsa_withdrawal * 0.20
-
             #
             # If you’re over 59½ and your account is at least five years old,
             # you can withdraw contributions and earnings with no tax or
@@ -1049,6 +920,45 @@ class Simulation:
                     roth_ira_with_interest_withdrawal,
                     dry_run=True
                 ).get_gains()
+                if collector is not None:
+                    collector.count("dry_run_withdrawals", 2)
+
+            #
+            # If the Roth conversion fills a bracket or ceiling, convert
+            # whatever room the income from our other withdrawals left.
+            #
+            if fill_roth_conversion:
+                roth_conversion_amount = self.get_roth_conversion_amount(
+                    this_years_income
+                    + trad_401k_withdrawal
+                    + trad_ira_withdrawal
+                    + roth_gains
+                    + (0 if self.can_make_hsa_withdrawal_penalty_free() else hsa_withdrawal)
+                    - tax_deductions
+                )
+                trad_401k_conversion = min(
+                    self.accounts.trad_401k.get_value() - trad_401k_withdrawal,
+                    roth_conversion_amount
+                )
+                trad_ira_conversion = min(
+                    self.accounts.trad_ira.get_value() - trad_ira_withdrawal,
+                    roth_conversion_amount - trad_401k_conversion
+                )
+
+                conversion_amount = trad_401k_conversion + trad_ira_conversion
+                trad_401k_withdrawal += trad_401k_conversion
+                trad_ira_withdrawal += trad_ira_conversion
+
+                #
+                # A set amount conversion is in the buckets before the
+                # penalties are worked out, so this one must be too. Otherwise
+                # filling a bracket would dodge the early withdrawal penalty.
+                #
+                withdrawal_buckets["trad_401k"] = trad_401k_withdrawal
+                withdrawal_buckets["trad_ira"] = trad_ira_withdrawal
+                penalty_fees = self.withdrawal_policy.get_penalty_fees(
+                    withdrawal_penalties, withdrawal_buckets
+                )
 
             taxable_income = max(round(
                 this_years_income
@@ -1073,6 +983,9 @@ class Simulation:
                     ltcg=withdrawal.get_gains(),
                     just_ltcg=True
                 )
+                if collector is not None:
+                    collector.count("dry_run_withdrawals")
+                    collector.count("tax_calls/ltcg")
 
             #
             # When calculating the FICA tax, we must not include retirement
@@ -1082,6 +995,8 @@ class Simulation:
                 this_years_income - hsa_contribution,
                 self.is_married()
             )
+            if collector is not None:
+                collector.count("tax_calls/fica")
 
             #
             # Calculate the federal taxes. This includes the federal income tax
@@ -1092,6 +1007,8 @@ class Simulation:
                 self.is_married(),
                 self.get_num_dependents()
             )
+            if collector is not None:
+                collector.count("tax_calls/federal_income")
 
             #
             # Calculate saver's credit. This provides tax credits if you are low
@@ -1108,6 +1025,8 @@ class Simulation:
                     ),
                     self.is_married()
                 )
+                if collector is not None:
+                    collector.count("tax_calls/savers_credit")
 
             #
             # Apply saver's credit. Credits cannot result in negative taxes.
@@ -1123,6 +1042,8 @@ class Simulation:
                 self.get_current_state(),
                 self.get_num_dependents()
             )
+            if collector is not None:
+                collector.count("tax_calls/state")
 
             this_years_taxes = (
                 federal_income_tax
@@ -1158,6 +1079,15 @@ class Simulation:
                 + trad_ira_withdrawal
             )
 
+            if tracer is not None:
+                tracer.record(
+                    "withdrawal",
+                    minimum_withdrawal,
+                    maximum_withdrawal,
+                    total_withdrawal,
+                    result
+                )
+
             #
             # We've calculated the result (excess/insufficent funds).
             #
@@ -1209,6 +1139,8 @@ class Simulation:
         ]
         for withdrawal in withdrawals:
             assert withdrawal.get_insufficient() == 0, withdrawal
+        if tracer is not None:
+            tracer.end_year(self.needed_to_continue)
 
         #
         # Now is the time to do the Roth conversion.
@@ -1227,6 +1159,11 @@ class Simulation:
 
         this_years_federal_taxes = federal_income_tax + fica_tax
 
+        if collector is not None:
+            now = time.perf_counter()
+            collector.add_time("withdrawals", now - phase_start)
+            phase_start = now
+
         #
         # We have finished the year. Add an entry to the table. This will get
         # printed when the simulation is over.
@@ -1258,6 +1195,63 @@ class Simulation:
             f"[red]{this_years_federal_taxes:,.2f}[/red]" if this_years_federal_taxes else "",
             f"[purple]{self.get_total_taxes():,.2f}[/purple]" if self.get_total_taxes() else "",
         )
+        if self.ledger is not None:
+            self.ledger.append(
+                age=self.get_current_age(),
+                married=self.is_married(),
+                retired=self.is_retired(),
+                hsa=self.accounts.hsa.get_value(),
+                hsa_change=self.accounts.hsa.get_yearly_change(),
+                roth_401k=self.accounts.roth_401k.get_value(),
+                roth_401k_change=self.accounts.roth_401k.get_yearly_change(),
+                roth_ira=self.accounts.roth_ira.get_value(),
+                roth_ira_change=self.accounts.roth_ira.get_yearly_change(),
+                taxable=self.accounts.taxable.get_value(),
+                taxable_change=self.accounts.taxable.get_yearly_change(),
+                trad_401k=self.accounts.trad_401k.get_value(),
+                trad_401k_change=self.accounts.trad_401k.get_yearly_change(),
+                trad_401k_rmd=trad_401k_rmd,
+                trad_ira=self.accounts.trad_ira.get_value(),
+                trad_ira_change=self.accounts.trad_ira.get_yearly_change(),
+                trad_ira_rmd=trad_ira_rmd,
+                roth_conversion=conversion_amount,
+                income=self.get_income(),
+                spending=self.get_spending(),
+                dependents=self.get_num_dependents(),
+                state=self.get_current_state(),
+                federal_income_tax=federal_income_tax,
+                fica_tax=fica_tax,
+                ltcg_tax=ltcg_taxes,
+                state_tax=state_tax,
+                penalties=penalty_fees,
+                total_taxes=self.get_total_taxes(),
+            )
+
+        if collector is not None:
+            now = time.perf_counter()
+            collector.count("table_rows")
+            collector.add_time("table_rows", now - phase_start)
+            collector.count("years")
+            collector.add_time("years", now - year_start)
+
+            #
+            # How many iterations each search took this year, if it ran.
+            #
+            counters = collector.get_counters()
+            contribution_iterations = (
+                counters.get("contribution_bisection_iterations", 0)
+                - contribution_iterations
+            )
+            if contribution_iterations:
+                collector.observe("contribution_bisection_iterations",
+                                  contribution_iterations)
+            withdrawal_iterations = (
+                counters.get("withdrawal_bisection_iterations", 0)
+                - withdrawal_iterations
+            )
+            if withdrawal_iterations:
+                collector.observe("withdrawal_bisection_iterations",
+                                  withdrawal_iterations)
 
     def increment_year(self):
         """
@@ -1275,6 +1269,34 @@ class Simulation:
         self.accounts.trad_401k.increment()
         self.accounts.trad_ira.increment()
 
+    def set_rate_of_return(self, rate_of_return):
+        """
+        Change the rate of return of every account. This takes effect the next
+        time interest is applied, so it can be used to give every year its own
+        rate of return.
+        """
+        self.accounts.hsa.rate_of_return = rate_of_return
+        self.accounts.taxable.rate_of_return = rate_of_return
+        self.accounts.roth_401k.rate_of_return = rate_of_return
+        self.accounts.roth_ira.rate_of_return = rate_of_return
+        self.accounts.trad_401k.rate_of_return = rate_of_return
+        self.accounts.trad_ira.rate_of_return = rate_of_return
+
+    def simulate_until(self, age):
+        """
+        This will simulate until we reach the given age or we can no longer
+        simulate, whichever comes first. Afterwards, simulate() will pick up
+        where this left off. This is useful for checkpointing a simulation with
+        copy.deepcopy(), because every year before the given age can be shared.
+        """
+        while self.get_current_age() < age and not self.stop_simulation():
+            self.outcomes[self.get_current_age()] = (
+                self.get_total_assets_after_death(),
+                self.get_needed_to_continue()
+            )
+            self.simulate_year()
+            self.increment_year()
+
     def simulate(self):
         """
         This will simulate until we can no longer simulate.
@@ -1282,6 +1304,9 @@ class Simulation:
         while not self.stop_simulation():
             self.simulate_year()
             self.increment_year()
+        if stats.collector is not None:
+            stats.collector.count("simulations")
+        progress.count()
 
         #
         # Once we are finished, we are dead or ran out of money. In either case,
@@ -1289,12 +1314,57 @@ class Simulation:
         #
         self.total_taxes += self.get_death_tax()
 
+    def simulate_every_age_of_death(self):
+        """
+        This simulates until the age of death, like simulate(), but it also
+        records what we would have left if we had died at each age along the
+        way. Because nothing in a year depends on when we die, this gives the
+        same answers as running a separate simulation for every age of death.
+
+        It returns a dictionary that maps the age of death to a tuple of total
+        assets after death and the amount that was needed to continue. If we
+        run out of money, every later age of death has the same outcome. Ages
+        already simulated by simulate_until() are included too.
+        """
+        outcomes = dict(self.outcomes)
+        while True:
+            outcomes[self.get_current_age()] = (
+                self.get_total_assets_after_death(),
+                self.get_needed_to_continue()
+            )
+            if self.stop_simulation():
+                break
+            self.simulate_year()
+            self.increment_year()
+
+        if stats.collector is not None:
+            stats.collector.count("simulations")
+        progress.count()
+
+        last_outcome = outcomes[self.get_current_age()]
+        for age in range(self.get_current_age() + 1, self.age_of_death + 1):
+            outcomes[age] = last_outcome
+
+        self.total_taxes += self.get_death_tax()
+        return outcomes
+
+    def stats(self):
+        """
+        The stats this simulation records into, or None if they are off. They
+        are shared by every simulation in this process (see stats.Stats), so
+        they are not just this simulation's.
+        """
+        return stats.collector
+
     def get_params_table(self):
         return self.params_table
 
     def get_math_table(self):
         return self.table
 
+    def get_ledger(self):
+        return self.ledger
+
     def get_summary_table(self):
         """
         This function creates a summary of your financial life.
@@ -1322,9 +1392,166 @@ class Simulation:
         return summary_table
 
 
-def main():
+def get_simulation_params(args, **kwargs):
     """
-    This function parses user input and runs the simulation.
+    Get the parameters for a simulation from the parsed command line arguments.
+    Any keyword arguments will override the arguments, which is useful for
+    variables that we are searching for, like the Roth conversion amount.
+    """
+    params = {
+        name: getattr(args, name)
+        for name in inspect.signature(Simulation).parameters
+        if hasattr(args, name)
+    }
+    params["mega_backdoor_roth"] = args.do_mega_backdoor_roth
+    params["dependents"] = args.add_dependent
+    params.setdefault("roth_conversion_amount", 0)
+    params.update(kwargs)
+    return params
+
+
+def create_simulation(args, **kwargs):
+    """
+    Create a simulation from the parsed command line arguments. Like
+    get_simulation_params(), keyword arguments override the arguments.
+    """
+    return Simulation(**get_simulation_params(args, **kwargs))
+
+
+def simulate_to_death(simulation):
+    """
+    Run the simulation and return the total assets after death. This is what we
+    normally want to maximize.
+    """
+    simulation.simulate()
+    return simulation.get_total_assets_after_death()
+
+
+def find_best_roth_conversion_amount(args, objective=simulate_to_death,
+                                     callback=None, checkpoint=None,
+                                     deadline=None, best=None, coarse_factor=None,
+                                     **kwargs):
+    """
+    Find the yearly Roth conversion amount that maximizes the objective. We
+    start at zero and go up by the Roth conversion unit until there is no
+    traditional money left at death.
+
+    Roth conversions only happen after retirement, so every year before then is
+    the same regardless of the amount. Those years are simulated once, and each
+    amount starts from a copy of the simulation at retirement. If a checkpoint is
+    given, it is used instead of creating a new simulation from the arguments.
+
+    With a deadline (see optimize.Deadline) or a coarse_factor, we go up by
+    coarse_factor (by default, 16) units at a time instead, then narrow in on
+    the best amount until time runs out. This assumes there is one peak, but
+    takes far fewer simulations. If a BestSoFar is given, it always holds the
+    best amount found so far, so the caller has an answer even if this is
+    interrupted.
+
+    This returns the best amount and the simulation that used it.
+    """
+    if stats.collector is not None:
+        stats.collector.count("scenarios")
+
+    #
+    # If memory is measured, this whole search is one sweep.
+    #
+    with memory.measure("sweep", sites=True):
+        if checkpoint is None:
+            checkpoint = create_simulation(args, **kwargs)
+        else:
+            checkpoint = copy.deepcopy(checkpoint)
+        checkpoint.simulate_until(checkpoint.get_age_of_retirement())
+        if best is None:
+            best = optimize.BestSoFar()
+
+        #
+        # If we never get to do a Roth conversion (e.g. we die or run out of
+        # money before we retire), the amount makes no difference. The same is
+        # true if a bracket or ceiling decides how much to convert.
+        #
+        can_convert = (
+            not checkpoint.stop_simulation()
+            and checkpoint.do_roth_conversion()
+            and not checkpoint.has_roth_conversion_ceiling()
+        )
+
+        def evaluate(roth_conversion_amount):
+            if callback:
+                callback(roth_conversion_amount)
+            with memory.measure("simulation"):
+                simulation = copy.deepcopy(checkpoint)
+                simulation.roth_conversion_amount = roth_conversion_amount
+                return objective(simulation), simulation
+
+        def has_traditional_money(simulation):
+            traditional_money = (
+                simulation.accounts.trad_401k.get_value()
+                + simulation.accounts.trad_ira.get_value()
+            )
+            return round(traditional_money, 2) != 0
+
+        if deadline is None and coarse_factor is None:
+            most_assets = 0
+            roth_conversion_amount = 0
+            best_roth_conversion_amount = 0
+            best_simulation = None
+
+            while True:
+                assets, simulation = evaluate(roth_conversion_amount)
+
+                if round(assets, 2) >= round(most_assets, 2):
+                    best_roth_conversion_amount = roth_conversion_amount
+                    most_assets = assets
+                    best_simulation = simulation
+                    best.set(roth_conversion_amount, assets, simulation)
+                elif best_simulation is None:
+                    best_simulation = simulation
+                    best.set(roth_conversion_amount, assets, simulation)
+
+                if not has_traditional_money(simulation):
+                    break
+                if not can_convert:
+                    break
+                roth_conversion_amount += args.roth_conversion_unit
+
+            best.set_error(0)
+            return best_roth_conversion_amount, best_simulation
+
+        #
+        # The coarse pass. The first amount is always tried, so there is an
+        # answer even with no time at all.
+        #
+        if deadline is None:
+            deadline = optimize.Deadline()
+        step = args.roth_conversion_unit * (coarse_factor or 16)
+        roth_conversion_amount = 0
+        while True:
+            assets, simulation = evaluate(roth_conversion_amount)
+            best.update(roth_conversion_amount, assets, simulation)
+            if not has_traditional_money(simulation) or not can_convert:
+                break
+            if deadline.has_expired():
+                return best.get_value(), best.get_simulation()
+            roth_conversion_amount += step
+
+        if not can_convert:
+            best.set_error(0)
+            return best.get_value(), best.get_simulation()
+
+        def update(roth_conversion_amount):
+            assets, simulation = evaluate(roth_conversion_amount)
+            best.update(roth_conversion_amount, assets, simulation)
+
+        optimize.refine(update, best, 0, roth_conversion_amount, step,
+                        args.roth_conversion_unit, deadline)
+        return best.get_value(), best.get_simulation()
+
+
+def create_parser():
+    """
+    This creates the command line arguments for the simulation. Other utilities
+    can use this to accept the same arguments.
     """
     parser = argparse.ArgumentParser(
         description="Wealth Simulator",
@@ -1563,6 +1790,13 @@ def main():
         type=float,
         default=30000
     )
+    parser.add_argument(
+        "--retirement-spending",
+        help="How much do you spend each year after you retire? Defaults to --spending.",
+        required=False,
+        type=float,
+        default=None
+    )
     parser.add_argument(
         "--add-dependent",
         help="Your age when dependent is to be added. This option can be used multiple times.",
@@ -1585,6 +1819,122 @@ def main():
         type=float,
         default=1000
     )
+    parser.add_argument(
+        "--roth-conversion-bracket",
+        help=(
+            "Instead of searching for the best Roth conversion amount, convert"
+            " enough each year to fill the federal tax bracket with this rate."
+            " The top bracket has no limit, so it is not a choice."
+        ),
+        metavar="RATE",
+        required=False,
+        type=float,
+        choices=[rate for _, _, rate in federal_taxes.FederalIncomeTax_2021.brackets['single'][:-1]],
+        default=None
+    )
+    parser.add_argument(
+        "--roth-conversion-ceiling",
+        help=(
+            "Instead of searching for the best Roth conversion amount, convert"
+            " enough each year to bring your income up to this amount (e.g. an"
+            " IRMAA threshold)."
+        ),
+        metavar="INCOME",
+        required=False,
+        type=float,
+        default=None
+    )
+    parser.add_argument(
+        "--optimize-roth-conversion-schedule",
+        help=(
+            "Find the best Roth conversion amount for every year, rather than"
+            " one amount for all of them."
+        ),
+        action="store_true"
+    )
+    parser.add_argument(
+        "--optimize-years-to-wait",
+        help=(
+            "Find the number of years of Roth contributions that leaves the"
+            " most behind, rather than using --years-to-wait."
+        ),
+        action="store_true"
+    )
+    parser.add_argument(
+        "--time-budget",
+        help=(
+            "Search for at most this many seconds, starting coarse and"
+            " refining, and show how far off the answer could be."
+        ),
+        required=False,
+        type=float,
+        default=None
+    )
+    parser.add_argument(
+        "--life-table",
+        help=(
+            "Instead of a fixed age of death, use a period life table (CSV with"
+            " age and qx columns) to calculate the expected estate."
+        ),
+        metavar="FILE",
+        required=False,
+        default=None
+    )
+    parser.add_argument(
+        "--solve",
+        help=(
+            "Instead of using the given value, find the best value for this"
+            " variable that never runs out of money."
+        ),
+        required=False,
+        choices=optimize.solvers.keys(),
+        default=None
+    )
+    parser.add_argument(
+        "--solve-tolerance",
+        help="How close to the best value does the solution need to be?",
+        required=False,
+        type=float,
+        default=100
+    )
+    parser.add_argument(
+        "--min-estate",
+        help="When solving, how much do you want to leave behind after taxes?",
+        required=False,
+        type=float,
+        default=0
+    )
+    parser.add_argument(
+        "--success-rate",
+        help=(
+            "When solving, use a Monte Carlo simulation and require this"
+            " fraction of paths to never run out of money. (0.0 - 1.0)"
+        ),
+        required=False,
+        type=float,
+        default=None
+    )
+    parser.add_argument(
+        "--paths",
+        help="How many paths should the Monte Carlo simulation use?",
+        required=False,
+        type=int,
+        default=100
+    )
+    parser.add_argument(
+        "--volatility",
+        help="What is the standard deviation of the yearly rate of return?",
+        required=False,
+        type=float,
+        default=0.12
+    )
+    parser.add_argument(
+        "--seed",
+        help="What seed should the Monte Carlo simulation use?",
+        required=False,
+        type=int,
+        default=0
+    )
     parser.add_argument(
         "--show-params",
         help="Show the parameters table.",
@@ -1600,122 +1950,222 @@ def main():
         help="Show the summary table.",
         action="store_true"
     )
+    cache.add_arguments(parser)
+    stats.add_arguments(parser)
+    profiling.add_arguments(parser)
+    tracing.add_arguments(parser)
+    memory.add_arguments(parser)
+    metrics.add_arguments(parser)
+
+    return parser
 
+
+def main():
+    """
+    This function parses user input and runs the simulation.
+    """
+    parser = create_parser()
+    ledger.add_arguments(parser)
     args = parser.parse_args()
+    if args.output_every_simulation and not args.output:
+        parser.error("--output-every-simulation only works with --output")
+    output_format = args.output and ledger.get_format(args.output, args.format)
+    if output_format == "arrow" and ledger.pyarrow is None:
+        parser.error("--format=arrow needs pyarrow (pip install pyarrow)")
+    if args.stats:
+        stats.enable()
+    profiling.start(args)
+    tracing.start(args)
+    if args.memory_report:
+        memory.start()
+    metrics.start(args, "sim")
+
+    if args.life_table:
+        life_table = mortality.load_life_table(args.life_table)
+        args.age_of_death = mortality.get_max_age_of_death(life_table)
+        probabilities = mortality.get_death_probabilities(
+            life_table, args.current_age
+        )
 
     #
-    # Calculate the most efficient Roth conversion amount.
+    # The ledgers are written as soon as each simulation is finished, so
+    # writing every simulation of a search doesn't keep them around.
     #
-    most_assets = 0
-    roth_conversion_amount = 0
-    best_roth_conversion_amount = 0
+    output = None
+    simulations = 0
+    if args.output:
+        output = ledger.open_output(
+            args.output, output_format, {"simulation": int, "best": bool}
+        )
+
+    def write_ledger(simulation, best):
+        nonlocal simulations
+        output.write(simulation.get_ledger(), simulation=simulations, best=best)
+        simulations += 1
+
+    def get_assets_after_death(simulation):
+        """
+        This is what we are trying to maximize. With a life table, we do not
+        know when we will die, so maximize the expected value instead.
+        """
+        if not args.life_table:
+            simulation.simulate()
+            assets = simulation.get_total_assets_after_death()
+        else:
+            outcomes = simulation.simulate_every_age_of_death()
+            assets = mortality.get_expected_outcome(outcomes, probabilities)[0]
+        if args.output_every_simulation:
+            write_ledger(simulation, False)
+        return assets
 
     try:
-        #
-        # TODO: Use concurrent.futures to make this faster.
-        #
-        with Live(transient=True, refresh_per_second=144) as live:
-            while True:
-                simulation = Simulation(
-                    args.starting_balance_hsa,
-                    args.starting_balance_taxable,
-                    args.starting_balance_trad_401k,
-                    args.starting_balance_trad_ira,
-                    args.starting_balance_roth_401k,
-                    args.starting_balance_roth_ira,
-                    args.rate_of_return,
-                    args.years_to_wait,
-                    args.current_age,
-                    args.age_of_retirement,
-                    args.age_to_start_rmds,
-                    args.age_of_death,
-                    roth_conversion_amount, # this is our variable
-                    args.income,
-                    args.yearly_income_raise,
-                    args.max_income,
-                    args.age_of_marriage,
-                    args.spending,
-                    args.contribution_limit_hsa,
-                    args.contribution_catch_up_amount_hsa,
-                    args.contribution_catch_up_age_hsa,
-                    args.contribution_limit_401k,
-                    args.contribution_limit_401k_total,
-                    args.contribution_catch_up_amount_401k,
-                    args.contribution_catch_up_age_401k,
-                    args.contribution_limit_ira,
-                    args.contribution_catch_up_amount_ira,
-                    args.contribution_catch_up_age_ira,
-                    args.do_mega_backdoor_roth,
-                    args.work_state,
-                    args.retirement_state,
-                    args.add_dependent,
-                    args.public_safety_employee,
-                    args.employer_match_401k,
-                    args.max_contribution_percentage_401k,
-                    args.employer_contribution_hsa
+        if args.solve:
+            with progress.Reporter() as reporter:
+                solution = optimize.solve(
+                    args,
+                    args.solve,
+                    callback=lambda lo, hi: reporter.update(
+                        "Solving for {}: {:,} - {:,}", args.solve, lo, hi
+                    )
                 )
+            if solution is None:
+                Console().print(f"There is no {args.solve} that works. :fire:")
+                return
+            setattr(args, optimize.solved_arguments[args.solve], solution)
+    except KeyboardInterrupt:
+        return
 
-                live.update("Simulating with Roth conversion: "
-                            f"{roth_conversion_amount:,.2f}")
-                simulation.simulate()
+    #
+    # Calculate the most efficient Roth conversion amount, or amounts.
+    #
+    # TODO: Use concurrent.futures to make this faster.
+    #
+    # If there is a Roth conversion bracket or ceiling, there is nothing to
+    # search for; each year's amount is calculated from that year's income and
+    # the search below stops after the first simulation.
+    #
+    # The searches keep track of the best answer so far. If they run out of
+    # time, or the user presses Ctrl-C, we go with that.
+    #
+    has_roth_conversion_ceiling = (
+        args.roth_conversion_bracket is not None
+        or args.roth_conversion_ceiling is not None
+    )
+    use_schedule = (
+        args.optimize_roth_conversion_schedule
+        and not has_roth_conversion_ceiling
+    )
+    deadline = optimize.Deadline(args.time_budget)
+    best_years_to_wait = optimize.BestSoFar()
+    best = optimize.BestSoFar()
+    stopped_early = False
 
-                if round(simulation.get_total_assets_after_death(), 2) >= round(most_assets, 2):
-                    best_roth_conversion_amount = roth_conversion_amount
-                    most_assets = simulation.get_total_assets_after_death()
+    #
+    # The best single Roth conversion amount is kept in a cache on disk, so the
+    # same scenario doesn't need to be searched again. Schedules, searches for
+    # the years to wait, and anything on a time budget are not cached.
+    #
+    result_cache = None
+    cached = None
+    if not (use_schedule or args.optimize_years_to_wait
+            or args.time_budget is not None):
+        result_cache = cache.from_args(args)
+    if result_cache is not None:
+        cache_key = cache.get_scenario_key(
+            get_simulation_params(args),
+            search="best-roth-conversion-amount",
+            roth_conversion_unit=args.roth_conversion_unit,
+            life_table=cache.get_file_hash(args.life_table)
+        )
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            best.set(cached["roth_conversion_amount"], cached["estate"])
+            best.set_error(0)
 
-                traditional_money = (
-                    simulation.accounts.trad_401k.get_value()
-                    + simulation.accounts.trad_ira.get_value()
+    try:
+        with progress.Reporter() as reporter:
+            if args.optimize_years_to_wait:
+                optimize.find_best_years_to_wait(
+                    args,
+                    objective=get_assets_after_death,
+                    deadline=deadline,
+                    best=best_years_to_wait,
+                    callback=lambda years: reporter.update(
+                        "Simulating with {} years to wait", years
+                    )
                 )
-                if round(traditional_money, 2) == 0:
-                    break
-                roth_conversion_amount += args.roth_conversion_unit
+                args.years_to_wait = best_years_to_wait.get_value()
+            if use_schedule:
+                optimize.optimize_roth_conversion_schedule(
+                    args,
+                    objective=get_assets_after_death,
+                    deadline=deadline,
+                    best=best,
+                    callback=lambda age, step: reporter.update(
+                        "Adjusting Roth conversion at {} by {:,.2f}", age, step
+                    )
+                )
+            elif not args.optimize_years_to_wait and cached is None:
+                find_best_roth_conversion_amount(
+                    args,
+                    objective=get_assets_after_death,
+                    deadline=None if args.time_budget is None else deadline,
+                    best=best,
+                    callback=lambda amount: reporter.update(
+                        "Simulating with Roth conversion: {:,.2f}", amount
+                    )
+                )
+    except KeyboardInterrupt:
+        stopped_early = True
+        if best_years_to_wait.has_value():
+            args.years_to_wait = best_years_to_wait.get_value()
 
+    best_roth_conversion_amount = 0
+    roth_conversion_schedule = None
+    if use_schedule and best.has_value():
+        roth_conversion_schedule = best.get_value()
+    elif not use_schedule and best.has_value():
+        best_roth_conversion_amount = best.get_value()
+    elif best_years_to_wait.has_value():
+        #
+        # Searching for the years to wait also found the best Roth conversion
+        # amount for them.
+        #
+        best = best_years_to_wait.get_detail()
+        best_roth_conversion_amount = best.get_value()
+    else:
+        return
+
+    try:
         #
         # Now that we know all of the variables, run the simulation.
         #
-        simulation = Simulation(
-            args.starting_balance_hsa,
-            args.starting_balance_taxable,
-            args.starting_balance_trad_401k,
-            args.starting_balance_trad_ira,
-            args.starting_balance_roth_401k,
-            args.starting_balance_roth_ira,
-            args.rate_of_return,
-            args.years_to_wait,
-            args.current_age,
-            args.age_of_retirement,
-            args.age_to_start_rmds,
-            args.age_of_death,
-            best_roth_conversion_amount,
-            args.income,
-            args.yearly_income_raise,
-            args.max_income,
-            args.age_of_marriage,
-            args.spending,
-            args.contribution_limit_hsa,
-            args.contribution_catch_up_amount_hsa,
-            args.contribution_catch_up_age_hsa,
-            args.contribution_limit_401k,
-            args.contribution_limit_401k_total,
-            args.contribution_catch_up_amount_401k,
-            args.contribution_catch_up_age_401k,
-            args.contribution_limit_ira,
-            args.contribution_catch_up_amount_ira,
-            args.contribution_catch_up_age_ira,
-            args.do_mega_backdoor_roth,
-            args.work_state,
-            args.retirement_state,
-            args.add_dependent,
-            args.public_safety_employee,
-            args.employer_match_401k,
-            args.max_contribution_percentage_401k,
-            args.employer_contribution_hsa
+        simulation = create_simulation(
+            args,
+            roth_conversion_amount=best_roth_conversion_amount,
+            roth_conversion_schedule=roth_conversion_schedule
         )
-        simulation.simulate()
+        if args.life_table:
+            outcomes = simulation.simulate_every_age_of_death()
+        else:
+            simulation.simulate()
     except KeyboardInterrupt:
         return
 
+    if output is not None:
+        write_ledger(simulation, True)
+        output.close()
+
+    if result_cache is not None:
+        if cached is None and not stopped_early:
+            result_cache.put(
+                cache_key,
+                simulation.get_total_assets_after_death(),
+                simulation.get_total_taxes(),
+                best_roth_conversion_amount
+            )
+        result_cache.close()
+
     #
     # Print stuff to the console if the user wants it.
     #
@@ -1733,6 +2183,43 @@ def main():
     if not any([args.show_params, args.show_math, args.show_summary]):
         console.print(simulation.get_math_table())
 
+    if args.life_table:
+        console.print(mortality.get_lifespan_table(outcomes, probabilities))
+
+    if roth_conversion_schedule is not None:
+        console.print(optimize.get_roth_conversion_schedule_table(
+            roth_conversion_schedule
+        ))
+
+    if args.solve:
+        console.print(f"Solved for {args.solve}: "
+                      f"[underline]{solution:,}[/underline]")
+
+    if stopped_early:
+        console.print("Stopped early, so this is the best found so far.")
+    if stopped_early or args.time_budget is not None:
+        for name, result, units in (("Years to wait", best_years_to_wait, "years"),
+                                    ("Roth conversion", best, "dollars")):
+            if not result.has_value():
+                continue
+            if result.get_step() is not None:
+                if result.get_step():
+                    console.print(f"{name} is approximate; the search stopped"
+                                  f" while trying steps of {result.get_step():,.0f}"
+                                  f" {units}.")
+            elif result.get_error() is None:
+                console.print(f"{name} is approximate; the search stopped"
+                              " before it could tell how far off it is.")
+            elif result.get_error():
+                console.print(f"{name} is approximate, within "
+                              f"{result.get_error():,.0f} {units} of the best.")
+
+    if args.stats:
+        console.print(stats.get_stats_table(simulation.stats()))
+    if args.memory_report:
+        console.print(memory.get_report_table(memory.report))
+        console.print(memory.get_sites_table(memory.report, "sweep"))
+
     if simulation.get_needed_to_continue():
         console.print(":fire::fire::fire: Please enter "
                       f"[underline]{simulation.get_needed_to_continue():,.2f}[/underline]"
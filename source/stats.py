@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import time
+
+from rich.table import Table
+
+#
+# The stats that simulations record into, or None when they are off. When they
+# are off, a simulation only has to check this once per phase of a year.
+#
+collector = None
+
+
+class Stats:
+    """
+    This counts how many times things happen in a simulation, like iterations
+    of the contribution and withdrawal binary searches or calls to each tax
+    function, and how long the phases of a year take. A histogram counts how
+    many times each value was seen, like how many iterations a search took in
+    each year.
+
+    Every simulation in a process records into the same stats, the collector
+    above, at the time it simulates. A search copies a simulation at retirement
+    and tries every Roth conversion amount on a copy, so this way the years
+    before retirement are only counted once, and copies sent to other processes
+    record into that process's stats.
+    """
+    def __init__(self, counters=None, timers=None, histograms=None):
+        self.counters = dict(counters or {})
+        self.timers = dict(timers or {})
+        self.histograms = {
+            name: dict(values) for name, values in (histograms or {}).items()
+        }
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_time(self, name, seconds):
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    def observe(self, name, value, amount=1):
+        histogram = self.histograms.setdefault(name, {})
+        histogram[value] = histogram.get(value, 0) + amount
+
+    def get_counters(self):
+        return self.counters
+
+    def get_timers(self):
+        return self.timers
+
+    def get_histograms(self):
+        return self.histograms
+
+    def merge(self, other):
+        """
+        Add another's counts and times to these, like the stats from a worker.
+        """
+        for name, amount in other.get_counters().items():
+            self.count(name, amount)
+        for name, seconds in other.get_timers().items():
+            self.add_time(name, seconds)
+        for name, values in other.get_histograms().items():
+            for value, amount in values.items():
+                self.observe(name, value, amount)
+
+    def to_dict(self):
+        return {
+            "counters": self.counters,
+            "timers": self.timers,
+            "histograms": self.histograms,
+        }
+
+
+def enable():
+    """
+    Turn stats on for every simulation in this process.
+    """
+    global collector
+    if collector is None:
+        collector = Stats()
+    return collector
+
+
+def disable():
+    global collector
+    collector = None
+
+
+class Collected:
+    """
+    This wraps a worker function so it records stats of its own, and returns
+    them with its result. It can be pickled as long as the function can. The
+    time spent in it is the worker's busy time.
+    """
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, *args):
+        global collector
+        previous = collector
+        collector = Stats()
+        start = time.perf_counter()
+        try:
+            result = self.function(*args)
+            collector.add_time("worker_busy", time.perf_counter() - start)
+            return result, collector.to_dict()
+        finally:
+            collector = previous
+
+
+def wrap(function):
+    """
+    If stats are on, wrap a function that is about to be sent to a worker (see
+    unwrap()). Otherwise, this is the same function, so it costs nothing.
+    """
+    return function if collector is None else Collected(function)
+
+
+def unwrap(result):
+    """
+    Take the stats out of the result of a wrapped function and add them to
+    ours, then return the real result.
+    """
+    if collector is None:
+        return result
+    result, values = result
+    collector.merge(Stats(**values))
+    return result
+
+
+def add_arguments(parser):
+    """
+    Both sim.py and graph.py accept these.
+    """
+    parser.add_argument(
+        "--stats",
+        help=(
+            "Count bisection iterations, tax calculations, and dry-run"
+            " withdrawals, time each part of a year, and show them at the end."
+            " Results from the cache aren't simulated, so they aren't counted."
+        ),
+        action="store_true"
+    )
+
+
+def get_stats_table(stats):
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Counter")
+    table.add_column("Count", justify="right")
+    for name, amount in sorted(stats.get_counters().items()):
+        table.add_row(name, f"{amount:,}")
+    table.add_section()
+    for name, seconds in sorted(stats.get_timers().items()):
+        table.add_row(f"{name} (seconds)", f"{seconds:,.3f}")
+    return table
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+
+import itertools
+import json
+import os
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def get_sidecar_path(path):
+    """
+    The axes and fields of a store are kept in a small JSON file next to it.
+    """
+    return f"{path}.json"
+
+
+def create_store(path, axes, fields, metadata=None, dtype="float64"):
+    """
+    Create a store for every point on a grid. The axes are a list of (name,
+    values) pairs, and every point has the same fields. Every value starts as
+    NaN, which means it hasn't been calculated yet. The metadata can be anything
+    that can be written as JSON, like the arguments the grid was made with.
+
+    This returns the store, open for writing.
+    """
+    axes = [(name, [float(value) for value in values]) for name, values in axes]
+    for name, values in axes:
+        assert values, f"axis {name} has no values"
+        assert values == sorted(set(values)), f"axis {name} must be increasing"
+    shape = tuple(len(values) for _, values in axes) + (len(fields),)
+
+    array = np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+    array[:] = np.nan
+    array.flush()
+    del array
+
+    with open(get_sidecar_path(path), "w") as f:
+        json.dump({
+            "axes": [{"name": name, "values": values} for name, values in axes],
+            "fields": list(fields),
+            "dtype": dtype,
+            "metadata": metadata or {},
+        }, f, indent=2)
+    return ResultStore(path, mode="r+")
+
+
+class ResultStore:
+    """
+    This holds results for every point on an N-dimensional grid, in a file
+    that numpy memory maps. Only the parts of the file that are read get loaded,
+    so a grid can be much bigger than memory. Workers in other processes can
+    open the same store and write their results straight into it by index, and
+    different points never share bytes.
+    """
+    def __init__(self, path, mode="r"):
+        with open(get_sidecar_path(path)) as f:
+            sidecar = json.load(f)
+        self.path = path
+        self.axis_names = [axis["name"] for axis in sidecar["axes"]]
+        self.axes = [np.array(axis["values"]) for axis in sidecar["axes"]]
+        self.fields = sidecar["fields"]
+        self.metadata = sidecar["metadata"]
+        shape = tuple(len(axis) for axis in self.axes) + (len(self.fields),)
+        self.mode = mode
+        self.array = np.memmap(path, dtype=sidecar["dtype"], mode=mode, shape=shape)
+
+    def get_path(self):
+        return self.path
+
+    def get_axis_names(self):
+        return self.axis_names
+
+    def get_axis(self, name):
+        return self.axes[self.axis_names.index(name)]
+
+    def get_fields(self):
+        return self.fields
+
+    def get_shape(self):
+        return self.array.shape[:-1]
+
+    def get_metadata(self):
+        return self.metadata
+
+    def get_point(self, index):
+        """
+        The axis values at an index.
+        """
+        return {
+            name: float(axis[i])
+            for name, axis, i in zip(self.axis_names, self.axes, index)
+        }
+
+    def get_index(self, **point):
+        """
+        The index of a point on the grid. Every axis must be given, and every
+        value must be on the grid.
+        """
+        index = []
+        for name, axis in zip(self.axis_names, self.axes):
+            matches = np.flatnonzero(np.isclose(axis, point[name]))
+            assert len(matches) == 1, f"{name}={point[name]} is not on the grid"
+            index.append(int(matches[0]))
+        return tuple(index)
+
+    def write(self, index, **values):
+        """
+        Write the fields for one point. Fields that aren't given are left
+        alone.
+        """
+        for field, value in values.items():
+            self.array[index + (self.fields.index(field),)] = value
+
+    def flush(self):
+        self.array.flush()
+
+    def read(self, field, **selection):
+        """
+        Read a slice of one field. Every axis that is given is fixed at that
+        value, and the result has the axes that are left, in order. Only that
+        slice is read from disk.
+        """
+        key = []
+        for name, axis in zip(self.axis_names, self.axes):
+            if name in selection:
+                matches = np.flatnonzero(np.isclose(axis, selection[name]))
+                assert len(matches) == 1, f"{name}={selection[name]} is not on the grid"
+                key.append(int(matches[0]))
+            else:
+                key.append(slice(None))
+        key.append(self.fields.index(field))
+        return np.asarray(self.array[tuple(key)])
+
+    def get_missing(self):
+        """
+        Every index that hasn't been written yet. A point counts as written
+        once its first field is.
+        """
+        missing = np.isnan(self.array[..., 0])
+        return [tuple(int(i) for i in index) for index in np.argwhere(missing)]
+
+    def interpolate(self, field, **point):
+        """
+        Multilinear interpolation of a field at any point inside the grid.
+        Points past the edge of the grid are clamped to it. Only the corners of
+        the cell around the point are read, so this is fast no matter how big
+        the grid is. If any of them haven't been written, this is NaN.
+        """
+        lower = []
+        weights = []
+        for name, axis in zip(self.axis_names, self.axes):
+            value = min(max(point[name], axis[0]), axis[-1])
+            if len(axis) == 1:
+                lower.append(0)
+                weights.append(0.0)
+                continue
+            i = int(np.clip(np.searchsorted(axis, value) - 1, 0, len(axis) - 2))
+            lower.append(i)
+            weights.append((value - axis[i]) / (axis[i + 1] - axis[i]))
+
+        column = self.fields.index(field)
+        result = 0.0
+        for corner in itertools.product((0, 1), repeat=len(self.axes)):
+            weight = 1.0
+            for offset, w in zip(corner, weights):
+                weight *= w if offset else 1 - w
+            if weight == 0:
+                continue
+            index = tuple(i + offset for i, offset in zip(lower, corner))
+            result += weight * float(self.array[index + (column,)])
+        return result
+
+    def get_nearest_distance(self, **point):
+        """
+        How far a point is from the nearest point on the grid, in units of grid
+        cells. On a grid point, this is zero. In the middle of a cell, it is
+        half the square root of the number of axes. Past the edge of the grid,
+        it keeps growing.
+        """
+        distance = 0.0
+        for name, axis in zip(self.axis_names, self.axes):
+            value = point[name]
+            i = int(np.abs(axis - value).argmin())
+            if len(axis) == 1:
+                spacing = max(abs(axis[0]), 1.0)
+            elif i == len(axis) - 1 or (i > 0 and value < axis[i]):
+                spacing = axis[i] - axis[i - 1]
+            else:
+                spacing = axis[i + 1] - axis[i]
+            distance += ((value - axis[i]) / spacing) ** 2
+        return distance ** 0.5
+
+    def close(self):
+        if self.mode != "r":
+            self.array.flush()
+        del self.array
+
+
+def exists(path):
+    return os.path.exists(path) and os.path.exists(get_sidecar_path(path))
+
+
+class SharedArray:
+    """
+    This is a numpy array in a block of shared memory. The process that creates
+    it owns it. Workers attach to it with its handle, which is small and cheap
+    to send, and read or write the array in place instead of sending it
+    through a pipe. Every array from get_array() must be gone before close().
+    """
+    def __init__(self, memory, shape, dtype, owner):
+        self.memory = memory
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.owner = owner
+
+    def get_array(self):
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self.memory.buf)
+
+    def get_handle(self):
+        return self.memory.name, self.shape, self.dtype
+
+    def close(self):
+        """
+        Detach from the shared memory. If this process owns it, it is freed.
+        """
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def create_shared_array(shape, dtype="float64"):
+    """
+    Create a shared array full of NaN, so it is clear what hasn't been written.
+    """
+    size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+    shared = SharedArray(
+        shared_memory.SharedMemory(create=True, size=size), shape, dtype, True
+    )
+    array = shared.get_array()
+    array[...] = np.nan
+    del array
+    return shared
+
+
+def attach_shared_array(handle):
+    """
+    Attach to a shared array from its handle, in a worker process.
+    """
+    name, shape, dtype = handle
+    return SharedArray(shared_memory.SharedMemory(name=name), shape, dtype, False)
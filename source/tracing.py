@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+import atexit
+import json
+import os
+import random
+
+#
+# The tracer of this process, or None when tracing is off.
+#
+tracer = None
+
+
+class Tracer:
+    """
+    This writes every iteration of the contribution and withdrawal binary
+    searches in simulate_year() to a JSON lines file, one record per line:
+
+        {"pid": 12, "year": 3, "age": 61, "loop": "withdrawal", "i": 0,
+         "lo": 0, "hi": 950000.0, "candidate": 0, "result": -31000.0}
+
+    The year is a count of the years this process has traced, so every record
+    with the same pid and year is from the same simulated year. Each traced
+    year ends with a record with "loop": "end", how many iterations each loop
+    took, and how much was needed to continue. If a year never ends, because
+    an assertion fired in the middle of it, its records are still written,
+    followed by a record with "loop": "unfinished".
+
+    With a sample rate less than one, only that fraction of years are traced,
+    picked at random, so tracing can be left on for big sweeps. Every process
+    appends to the same file, and a year is written all at once, so the
+    records of different processes don't get mixed up within a year.
+    """
+    def __init__(self, path, sample_rate=1.0, truncate=False):
+        assert 0 <= sample_rate <= 1, "the sample rate must be between 0 and 1"
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+        if truncate:
+            flags |= os.O_TRUNC
+        self.path = path
+        self.sample_rate = sample_rate
+        self.fd = os.open(path, flags, 0o644)
+        self.pid = os.getpid()
+        self.random = random.Random()
+        self.years = 0
+        self.age = None
+        self.iterations = {}
+        self.records = []
+
+    def get_path(self):
+        return self.path
+
+    def get_sample_rate(self):
+        return self.sample_rate
+
+    def write(self, **record):
+        self.records.append(json.dumps(
+            {"pid": self.pid, "year": self.years, "age": self.age, **record},
+            separators=(",", ":")
+        ))
+
+    def start_year(self, age):
+        """
+        Decide whether to trace this year. This returns False if it isn't
+        sampled.
+        """
+        if self.records:
+            self.write(loop="unfinished")
+            self.flush()
+        if self.sample_rate < 1 and self.random.random() >= self.sample_rate:
+            return False
+        self.years += 1
+        self.age = age
+        self.iterations = {}
+        return True
+
+    def record(self, loop, lo, hi, candidate, result):
+        """
+        Record an iteration of a binary search: the bounds, the amount we
+        tried, and how much money was left over (or needed) with it.
+        """
+        i = self.iterations.get(loop, 0)
+        self.iterations[loop] = i + 1
+        self.write(loop=loop, i=i, lo=lo, hi=hi, candidate=candidate, result=result)
+
+    def end_year(self, needed_to_continue):
+        self.write(loop="end", iterations=self.iterations,
+                   needed_to_continue=needed_to_continue)
+        self.flush()
+
+    def flush(self):
+        if self.records:
+            os.write(self.fd, ("\n".join(self.records) + "\n").encode())
+            self.records = []
+
+    def close(self):
+        if self.records:
+            self.write(loop="unfinished")
+        self.flush()
+        os.close(self.fd)
+
+
+class Traced:
+    """
+    This wraps a worker function so the worker traces into the same file. It
+    can be pickled as long as the function can.
+    """
+    def __init__(self, function, path, sample_rate):
+        self.function = function
+        self.path = path
+        self.sample_rate = sample_rate
+
+    def __call__(self, *args):
+        global tracer
+        if tracer is None or tracer.pid != os.getpid():
+            tracer = Tracer(self.path, self.sample_rate)
+        try:
+            return self.function(*args)
+        finally:
+            if tracer.records:
+                tracer.write(loop="unfinished")
+                tracer.flush()
+
+
+def start(args):
+    """
+    Start tracing if the command line asked for it.
+    """
+    global tracer
+    if not args.trace:
+        return
+    tracer = Tracer(args.trace, args.trace_sample, truncate=True)
+    atexit.register(tracer.close)
+
+
+def wrap(function):
+    """
+    If we are tracing, wrap a function that is about to be sent to a worker
+    (see Traced). Otherwise, this is the same function.
+    """
+    if tracer is None:
+        return function
+    return Traced(function, tracer.get_path(), tracer.get_sample_rate())
+
+
+def add_arguments(parser):
+    """
+    Both sim.py and graph.py accept these.
+    """
+    parser.add_argument(
+        "--trace",
+        help=(
+            "Write every iteration of the contribution and withdrawal binary"
+            " searches to this JSON lines file, including from workers."
+        ),
+        required=False,
+        metavar="FILE",
+        default=None
+    )
+    parser.add_argument(
+        "--trace-sample",
+        help="With --trace, only trace this fraction of years, picked at random.",
+        required=False,
+        type=float,
+        default=1.0
+    )
@@ -0,0 +1,726 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import copy
+import sys
+
+import numpy as np
+
+from rich.console import Console
+from rich.table import Table
+
+import federal_taxes
+import optimize
+import progress
+import sim
+import state_taxes
+import store
+import ult
+
+#
+# Running out of money is much worse than leaving less behind. Every dollar we
+# are short costs this many dollars of estate.
+#
+INFEASIBLE_PENALTY = 10
+
+
+################################################################################
+# Vectorized Taxes
+################################################################################
+
+def get_bracket_arrays(brackets):
+    """
+    Turn a list of (minimum, base tax, rate) brackets into arrays.
+    """
+    minimums, base_taxes, tax_rates = zip(*brackets)
+    return np.array(minimums), np.array(base_taxes), np.array(tax_rates)
+
+
+def calculate_bracket_tax(income, brackets):
+    """
+    This is the same as looking up the bracket that the income falls in and
+    adding the base tax for that bracket, but for arrays of income.
+    """
+    minimums, base_taxes, tax_rates = brackets
+    index = np.clip(np.searchsorted(minimums, income) - 1, 0, None)
+    return np.where(
+        income > 0,
+        base_taxes[index] + (income - minimums[index]) * tax_rates[index],
+        0
+    )
+
+
+def calculate_federal_income_tax(agi, married):
+    """
+    A vectorized calculate_federal_income_tax() without LTCG.
+    """
+    key = 'married' if married else 'single'
+    income_to_tax = np.maximum(agi - federal_taxes.get_standard_deduction(married), 0)
+    return calculate_bracket_tax(
+        income_to_tax,
+        get_bracket_arrays(federal_taxes.FederalIncomeTax_2021.brackets[key])
+    )
+
+
+def calculate_ltcg_tax(agi, ltcg, married):
+    """
+    A vectorized calculate_federal_income_tax() with just_ltcg. Gains are
+    stacked on top of income, so each LTCG bracket taxes the part of the gains
+    that falls inside of it.
+    """
+    brackets = (
+        federal_taxes.married_ltcg_brackets if married
+        else federal_taxes.single_ltcg_brackets
+    )
+    taxes = 0
+    bottom = 0
+    for tax_rate, rate_limit in brackets:
+        top = min(bottom + rate_limit, sys.float_info.max)
+        overlap = (
+            np.minimum(agi + ltcg, top)
+            - np.maximum(agi, bottom)
+        )
+        taxes = taxes + tax_rate * np.maximum(overlap, 0)
+        bottom = top
+    return taxes
+
+
+def calculate_state_tax(agi, married, state, dependents=0):
+    """
+    A vectorized calculate_state_tax().
+    """
+    if state_taxes.states[state] is None:
+        return np.zeros_like(agi)
+
+    key = 'married' if married else 'single'
+    state_class = state_taxes.states[state]
+    taxable_income = agi - state_class.deduction[key]
+    credits = 0
+
+    multiplier = 2 if married else 1
+    exemptions = [
+        (state_class.exemption['personal'], multiplier),
+        (state_class.exemption['dependent'], dependents),
+    ]
+    for exemption, count in exemptions:
+        if isinstance(exemption, state_taxes.Credit):
+            credits += exemption.value * count
+        else:
+            taxable_income = taxable_income - exemption * count
+
+    taxes = calculate_bracket_tax(
+        taxable_income,
+        get_bracket_arrays(state_class.brackets[key])
+    )
+    return np.where(taxable_income > 0, np.maximum(taxes - credits, 0), 0)
+
+
+################################################################################
+# Model
+################################################################################
+
+class Year:
+    """
+    Everything about a year of retirement that does not depend on how much is
+    in each account. These come from the simulation, so the model uses the same
+    ages, rules, and tax brackets.
+    """
+    def __init__(self, simulation, basis_ratio):
+        age = simulation.get_current_age()
+        self.age = age
+        self.married = simulation.is_married()
+        self.state = simulation.get_current_state()
+        self.dependents = simulation.get_num_dependents()
+        self.spending = simulation.get_spending()
+        self.rate_of_return = simulation.accounts.taxable.rate_of_return
+        self.basis_ratio = basis_ratio
+        self.rmd_factor = ult.withdrawal_factors[age] if simulation.must_take_rmds() else None
+        self.penalty_free = {
+            'can_make_401k_withdrawal_penalty_free':
+                simulation.can_make_401k_withdrawal_penalty_free(),
+            'can_make_ira_withdrawal_penalty_free':
+                simulation.can_make_ira_withdrawal_penalty_free(),
+            'can_make_hsa_withdrawal_penalty_free':
+                simulation.can_make_hsa_withdrawal_penalty_free(),
+        }
+        self.trad_penalty = 0 if self.can_make_401k_withdrawal_penalty_free() else 0.10
+        self.roth_penalty = 0.10 if simulation.roth_gains_are_taxable() else 0
+        self.can_convert = simulation.do_roth_conversion()
+        self.standard_deduction = federal_taxes.get_standard_deduction(self.married)
+        self.zero_tax_ltcg_income = federal_taxes.zero_tax_ltcg_income(self.married)
+
+    def can_make_401k_withdrawal_penalty_free(self):
+        return self.penalty_free['can_make_401k_withdrawal_penalty_free']
+
+    def can_make_ira_withdrawal_penalty_free(self):
+        return self.penalty_free['can_make_ira_withdrawal_penalty_free']
+
+    def can_make_hsa_withdrawal_penalty_free(self):
+        return self.penalty_free['can_make_hsa_withdrawal_penalty_free']
+
+    def get_standard_deduction(self):
+        return self.standard_deduction
+
+    def get_zero_tax_ltcg_income(self):
+        return self.zero_tax_ltcg_income
+
+    def get_rmd(self, trad):
+        if self.rmd_factor is None:
+            return np.zeros_like(trad)
+        return trad / self.rmd_factor
+
+    def get_taxes(self, trad_withdrawal, taxable_withdrawal):
+        """
+        Taxes and penalties for the given withdrawals.
+        """
+        gains = taxable_withdrawal * (1 - self.basis_ratio)
+        return (
+            calculate_federal_income_tax(trad_withdrawal, self.married)
+            + calculate_ltcg_tax(trad_withdrawal, gains, self.married)
+            + calculate_state_tax(
+                trad_withdrawal, self.married, self.state, self.dependents
+            )
+            + trad_withdrawal * self.trad_penalty
+        )
+
+    def step(self, trad, taxable, roth, trad_withdrawal, taxable_withdrawal,
+             taxes=None):
+        """
+        Simulate the year for arrays of balances and withdrawals. The Roth
+        accounts cover whatever the withdrawals do not. Extra traditional money
+        is converted to Roth when we are allowed to, and anything else goes
+        into the taxable account, just like the simulation.
+
+        This returns the balances for next year and how much we are short.
+        """
+        if taxes is None:
+            taxes = self.get_taxes(trad_withdrawal, taxable_withdrawal)
+        short = self.spending + taxes - trad_withdrawal - taxable_withdrawal
+        roth_withdrawal = np.maximum(short, 0) / (1 - self.roth_penalty)
+        surplus = np.maximum(-short, 0)
+        conversion = np.minimum(surplus, trad_withdrawal) if self.can_convert else 0
+        deposit = surplus - conversion
+        shortfall = np.maximum(roth_withdrawal - roth, 0)
+        return (
+            (trad - trad_withdrawal) * self.rate_of_return,
+            (taxable - taxable_withdrawal + deposit) * self.rate_of_return,
+            np.maximum(roth - roth_withdrawal + conversion, 0) * self.rate_of_return,
+            shortfall,
+        )
+
+    def get_trad_withdrawals(self, trad, fractions):
+        """
+        The traditional withdrawals to consider. Besides fractions of the
+        balance, it is worth trying the exact amounts that fill each federal
+        tax bracket, because that is where the answer usually is.
+        """
+        key = 'married' if self.married else 'single'
+        brackets = federal_taxes.FederalIncomeTax_2021.brackets[key]
+        amounts = [self.standard_deduction] + [
+            minimum + self.standard_deduction for minimum, _, _ in brackets[1:]
+        ]
+        trad = np.asarray(trad, dtype=float)[..., None]
+        rmd = self.get_rmd(trad)
+        candidates = np.concatenate([
+            rmd + fractions * (trad - rmd),
+            np.broadcast_to(np.array(amounts, dtype=float), trad.shape[:-1] + (len(amounts),)),
+        ], axis=-1)
+        return np.clip(candidates, rmd, trad)
+
+    def get_taxable_withdrawals(self, taxable, fractions):
+        """
+        The taxable withdrawals to consider. Besides fractions of the balance,
+        try multiples of a year's spending.
+        """
+        taxable = np.asarray(taxable, dtype=float)[..., None]
+        amounts = self.spending * np.array([0.25, 0.5, 0.75, 1.0, 1.5, 2.0])
+        candidates = np.concatenate([
+            fractions * taxable,
+            np.broadcast_to(amounts, taxable.shape[:-1] + (len(amounts),)),
+        ], axis=-1)
+        return np.minimum(candidates, taxable)
+
+
+class Balance:
+    """
+    This is just enough of an account for the withdrawal policy.
+    """
+    def __init__(self, value):
+        self.value = value
+
+    def get_value(self):
+        return self.value
+
+    def get_contributions(self):
+        return 0
+
+
+class PolicyYear:
+    """
+    This lets the simulation's withdrawal policy run on a year of the model.
+    The model combines the 401k and IRA, so the policy sees all traditional
+    money in the 401k. Roth and HSA withdrawals are left to the model, which
+    uses Roth to cover whatever else is needed.
+    """
+    def __init__(self, year, trad, taxable):
+        self.year = year
+        self.accounts = {
+            'trad_401k': Balance(trad),
+            'taxable': Balance(taxable),
+        }
+
+    def __getattr__(self, name):
+        return getattr(self.year, name)
+
+    def get_account(self, account_name):
+        return self.accounts.get(account_name)
+
+
+def get_axis(maximum, size):
+    """
+    Grid points are closer together near zero, where taxes change the most.
+    """
+    return np.linspace(0, 1, size) ** 2 * max(maximum, 1)
+
+
+def interpolate(axes, values, trad, taxable, roth):
+    """
+    Multilinear interpolation of the value function. Points past the end of
+    the grid are extrapolated from the last two grid points.
+    """
+    weights = []
+    indexes = []
+    for axis, points in zip(axes, (trad, taxable, roth)):
+        index = np.clip(np.searchsorted(axis, points) - 1, 0, len(axis) - 2)
+        weight = (points - axis[index]) / (axis[index + 1] - axis[index])
+        indexes.append(index)
+        weights.append(weight)
+
+    result = 0
+    for corner in range(8):
+        value = values[
+            indexes[0] + (corner >> 2 & 1),
+            indexes[1] + (corner >> 1 & 1),
+            indexes[2] + (corner & 1),
+        ]
+        for dimension, weight in enumerate(weights):
+            if corner >> (2 - dimension) & 1:
+                value = value * weight
+            else:
+                value = value * (1 - weight)
+        result = result + value
+    return result
+
+
+def get_best_withdrawals(year, next_axes, next_values, trad, taxable, roth,
+                         fractions):
+    """
+    For a traditional balance and arrays of taxable and Roth balances, try
+    every combination of withdrawals and keep the best. This returns the value
+    of each state and the withdrawals that got there.
+    """
+    trad_withdrawals = year.get_trad_withdrawals(trad, fractions)
+    taxable_withdrawals = year.get_taxable_withdrawals(taxable, fractions)
+
+    #
+    # Taxes only depend on the withdrawals, not the Roth balance, so they are
+    # calculated once and shared. The shape is (taxable, roth, trad, taxable).
+    #
+    trad_withdrawal = trad_withdrawals[None, None, :, None]
+    taxable_withdrawal = taxable_withdrawals[:, None, None, :]
+    taxes = year.get_taxes(trad_withdrawal, taxable_withdrawal)
+    next_trad, next_taxable, next_roth, shortfall = year.step(
+        trad,
+        taxable[:, None, None, None],
+        roth[None, :, None, None],
+        trad_withdrawal,
+        taxable_withdrawal,
+        taxes
+    )
+    values = (
+        interpolate(next_axes, next_values, next_trad, next_taxable, next_roth)
+        - INFEASIBLE_PENALTY * shortfall
+    )
+
+    values = values.reshape(values.shape[:2] + (-1,))
+    best = values.argmax(axis=-1)
+    best_values = np.take_along_axis(values, best[..., None], axis=-1)[..., 0]
+    best_trad = trad_withdrawals[best // taxable_withdrawals.shape[-1]]
+    best_taxable = np.take_along_axis(
+        taxable_withdrawals[:, None, :],
+        (best % taxable_withdrawals.shape[-1])[..., None],
+        axis=-1
+    )[..., 0]
+    return best_values, best_trad, best_taxable
+
+
+def solve_grid_slice(arguments):
+    """
+    Solve one traditional balance of the grid. This runs in a worker process.
+    Every year's values live in one shared array, so this reads next year's
+    values and writes its slice of this year's in place.
+    """
+    year, axes, next_axes, handle, index, trad_index, fractions = arguments
+    shared = store.attach_shared_array(handle)
+    try:
+        values = shared.get_array()
+        values[index, trad_index], _, _ = get_best_withdrawals(
+            year, next_axes, values[index + 1],
+            axes[0][trad_index], axes[1], axes[2],
+            fractions
+        )
+        del values
+    finally:
+        shared.close()
+
+
+class WithdrawalOrderOptimizer:
+    """
+    This finds the best way to split each year's withdrawals between the
+    traditional, taxable, and Roth accounts after retirement with dynamic
+    programming. Starting at death and working backwards, the best estate is
+    calculated for every point of a (traditional, taxable, Roth) grid.
+
+    To keep the grid small, the 401k and IRA are combined, as are the Roth 401k
+    and Roth IRA. The HSA is left alone. The taxable account's basis is not part
+    of the grid; since withdrawals do not change the ratio of basis to value,
+    it only shrinks as the account grows.
+    """
+    def __init__(self, checkpoint, grid_size=24, decision_size=24, workers=None):
+        self.checkpoint = checkpoint
+        self.grid_size = grid_size
+        self.fractions = np.linspace(0, 1, decision_size) ** 2
+        self.workers = workers
+        self.years = []
+        self.axes = []
+        self.values = []
+
+        #
+        # Walk through the ages once to get the rules for each year.
+        #
+        accounts = checkpoint.accounts
+        simulation = copy.deepcopy(checkpoint)
+        basis_ratio = 1
+        if accounts.taxable.get_value():
+            basis_ratio = 1 - accounts.taxable.get_gains_ratio()
+        growth = 1
+        while simulation.is_alive():
+            self.years.append(Year(simulation, basis_ratio))
+            self.axes.append(self.get_axes(growth))
+            basis_ratio /= accounts.taxable.rate_of_return
+            growth *= accounts.taxable.rate_of_return
+            simulation.increment_year()
+        self.axes.append(self.get_axes(growth))
+        self.death = simulation
+
+    def get_axes(self, growth):
+        """
+        The grid for a year covers everything we could have by then, given how
+        much we start with and how much it could grow.
+        """
+        trad, taxable, roth, _ = self.get_balances(self.checkpoint)
+        total = trad + taxable + roth
+        return (
+            get_axis(trad * growth, self.grid_size),
+            get_axis(total * growth, self.grid_size),
+            get_axis(total * growth, self.grid_size),
+        )
+
+    @staticmethod
+    def get_balances(simulation):
+        accounts = simulation.accounts
+        return (
+            accounts.trad_401k.get_value() + accounts.trad_ira.get_value(),
+            accounts.taxable.get_value(),
+            accounts.roth_401k.get_value() + accounts.roth_ira.get_value(),
+            accounts.hsa.get_value(),
+        )
+
+    def get_assets_after_death(self, trad, taxable, roth):
+        """
+        This is the same as get_total_assets_after_death() in the simulation.
+        """
+        _, _, _, hsa = self.get_balances(self.checkpoint)
+        hsa *= self.checkpoint.accounts.hsa.rate_of_return ** len(self.years)
+        heir_age = self.death.get_current_age() - 30
+        taxes_for_heir = np.vectorize(
+            lambda value: federal_taxes.calculate_minimum_remaining_tax_for_heir(value, heir_age)
+        )(trad)
+        total = trad + taxable + roth + hsa
+        estate_tax = np.vectorize(federal_taxes.calculate_estate_tax)(total)
+        return total - taxes_for_heir - estate_tax
+
+    def solve(self, callback=None):
+        """
+        Calculate the best estate for every grid point of every year.
+        """
+        trad, taxable, roth = self.axes[-1]
+        shared = store.create_shared_array(
+            (len(self.years) + 1, self.grid_size, self.grid_size, self.grid_size)
+        )
+        values = shared.get_array()
+        values[-1] = self.get_assets_after_death(
+            trad[:, None, None], taxable[None, :, None], roth[None, None, :]
+        )
+
+        if self.workers == 1:
+            executor = optimize.SerialExecutor()
+        else:
+            executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        try:
+            for index in reversed(range(len(self.years))):
+                if callback:
+                    callback(self.years[index].age)
+                list(executor.map(solve_grid_slice, [
+                    (
+                        self.years[index],
+                        self.axes[index],
+                        self.axes[index + 1],
+                        shared.get_handle(),
+                        index,
+                        trad_index,
+                        self.fractions,
+                    )
+                    for trad_index in range(self.grid_size)
+                ]))
+            self.values = list(values.copy())
+        finally:
+            if self.workers != 1:
+                executor.shutdown()
+            del values
+            shared.close()
+
+    def get_optimal_path(self):
+        """
+        Starting from the balances at retirement, follow the best withdrawals
+        each year. The balances between grid points are exact, so this is the
+        estate the optimal order actually leaves behind in the model.
+
+        The grid is only an approximation, so this estate is not the same as
+        the one the grid promised for the first year's best withdrawals. That
+        is returned too, and the difference between the two is the grid error.
+        """
+        trad, taxable, roth, _ = self.get_balances(self.checkpoint)
+        path = []
+        grid_estate = None
+        for index, year in enumerate(self.years):
+            values, trad_withdrawal, taxable_withdrawal = get_best_withdrawals(
+                year, self.axes[index + 1], self.values[index + 1],
+                trad, np.array([taxable]), np.array([roth]),
+                self.fractions
+            )
+            if grid_estate is None:
+                grid_estate = float(values[0, 0])
+            trad_withdrawal = float(trad_withdrawal[0, 0])
+            taxable_withdrawal = float(taxable_withdrawal[0, 0])
+            path.append((year.age, trad_withdrawal, taxable_withdrawal))
+            trad, taxable, roth, shortfall = (
+                float(value) for value in year.step(
+                    trad, taxable, roth, trad_withdrawal, taxable_withdrawal
+                )
+            )
+            if shortfall:
+                return path, None, grid_estate
+        return path, float(self.get_assets_after_death(trad, taxable, roth)), grid_estate
+
+    def get_hand_coded_withdrawals(self, year, trad, taxable,
+                                   roth_conversion_amount):
+        """
+        This follows the simulation's withdrawal policy for one year of the
+        model: first the RMDs and Roth conversion, then the steps of the
+        policy. Roth covers whatever is left. It returns the traditional and
+        taxable withdrawals.
+        """
+        withdrawal_policy = self.checkpoint.withdrawal_policy
+        rmd = float(year.get_rmd(trad))
+        conversion = min(roth_conversion_amount, trad - rmd) if year.can_convert else 0
+        policy_year = PolicyYear(year, trad, taxable)
+        steps = withdrawal_policy.get_steps(policy_year)
+
+        def get_withdrawals(total_withdrawal):
+            buckets = withdrawal_policy.get_empty_buckets()
+            buckets["trad_401k"] = rmd + conversion
+            withdrawal_policy.run(
+                steps, policy_year, rmd + conversion + total_withdrawal, buckets
+            )
+            return buckets["trad_401k"], buckets["taxable"]
+
+        def get_result(total_withdrawal):
+            trad_withdrawal, taxable_withdrawal = get_withdrawals(total_withdrawal)
+            taxes = float(year.get_taxes(trad_withdrawal, taxable_withdrawal))
+            return trad_withdrawal + taxable_withdrawal - conversion - year.spending - taxes
+
+        #
+        # Like the simulation, bisect the withdrawal until it covers our
+        # spending and taxes.
+        #
+        minimum_withdrawal = 0
+        maximum_withdrawal = trad + taxable
+        total_withdrawal = 0
+        if get_result(maximum_withdrawal) < 0:
+            total_withdrawal = maximum_withdrawal
+        elif get_result(0) < 0:
+            for _ in range(64):
+                total_withdrawal = (minimum_withdrawal + maximum_withdrawal)/2
+                if get_result(total_withdrawal) < 0:
+                    minimum_withdrawal = total_withdrawal
+                else:
+                    maximum_withdrawal = total_withdrawal
+            total_withdrawal = maximum_withdrawal
+        return get_withdrawals(total_withdrawal)
+
+    def get_hand_coded_path(self, roth_conversion_amount):
+        """
+        This follows the simulation's withdrawal policy every year, using the
+        same model as the optimal order so that the two can be compared. The
+        model is simpler than the simulation (see WithdrawalOrderOptimizer), so
+        the estate it ends with is close to the simulation's, but not the same.
+        """
+        trad, taxable, roth, _ = self.get_balances(self.checkpoint)
+        path = []
+        for year in self.years:
+            trad_withdrawal, taxable_withdrawal = self.get_hand_coded_withdrawals(
+                year, trad, taxable, roth_conversion_amount
+            )
+            path.append((year.age, trad_withdrawal, taxable_withdrawal))
+            trad, taxable, roth, shortfall = (
+                float(value) for value in year.step(
+                    trad, taxable, roth, trad_withdrawal, taxable_withdrawal
+                )
+            )
+            if shortfall:
+                return path, None
+        return path, float(self.get_assets_after_death(trad, taxable, roth))
+
+
+def get_policy_table(hand_coded_path, optimal_path):
+    """
+    Show how the withdrawals differ each year.
+    """
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Age", justify="right")
+    table.add_column("Hand-Coded Trad", justify="right")
+    table.add_column("Hand-Coded Taxable", justify="right")
+    table.add_column("Optimal Trad", justify="right")
+    table.add_column("Optimal Taxable", justify="right")
+    for (age, trad, taxable), (_, best_trad, best_taxable) in zip(
+        hand_coded_path, optimal_path
+    ):
+        table.add_row(
+            f"{age}",
+            f"{trad:,.2f}",
+            f"{taxable:,.2f}",
+            f"{best_trad:,.2f}",
+            f"{best_taxable:,.2f}",
+        )
+    return table
+
+
+def get_summary_table(simulated, hand_coded, optimal, grid):
+    """
+    Compare the estate from the simulation, the hand-coded order, and the
+    optimal order. The grid's own estimate of the optimal estate shows how far
+    off the grid is, so a negative amount left on the table can be told apart
+    from grid error.
+    """
+    def format_estate(value):
+        return f"{value:,.2f}" if value is not None else "[red]Ran out of money[/red]"
+
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Withdrawal Order")
+    table.add_column("Assets After Taxes", justify="right")
+    table.add_row("Hand-Coded (Simulation)", format_estate(simulated))
+    table.add_row("Hand-Coded (Model)", format_estate(hand_coded))
+    table.add_row("Optimal (Model)", format_estate(optimal))
+    if grid is not None:
+        table.add_row("Optimal (Grid)", f"{grid:,.2f}")
+    table.add_section()
+    if hand_coded is not None and optimal is not None:
+        table.add_row("Left on the Table", f"[bold]{optimal - hand_coded:,.2f}[/bold]")
+    if grid is not None and optimal is not None:
+        table.add_row("Grid Error", f"{grid - optimal:,.2f}")
+    return table
+
+
+def main():
+    parser = sim.create_parser()
+    parser.description = "Find the best withdrawal order after retirement"
+    parser.add_argument(
+        "--grid-size",
+        help="How many points should each account have in the grid?",
+        required=False,
+        type=int,
+        default=24
+    )
+    parser.add_argument(
+        "--decision-size",
+        help="How many fractions of each account should be tried as withdrawals?",
+        required=False,
+        type=int,
+        default=24
+    )
+    parser.add_argument(
+        "--workers",
+        help="How many processes should solve the grid? (default: all cores)",
+        required=False,
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        "--show-policy",
+        help="Show the withdrawals for each year.",
+        action="store_true"
+    )
+    args = parser.parse_args()
+
+    console = Console()
+    try:
+        with progress.Reporter() as reporter:
+            roth_conversion_amount, simulation = sim.find_best_roth_conversion_amount(
+                args,
+                callback=lambda amount: reporter.update(
+                    "Simulating with Roth conversion: {:,.2f}", amount
+                )
+            )
+            checkpoint = sim.create_simulation(
+                args, roth_conversion_amount=roth_conversion_amount
+            )
+            checkpoint.simulate_until(checkpoint.get_age_of_retirement())
+
+        if checkpoint.stop_simulation():
+            console.print("There are no withdrawals to optimize. :fire:")
+            return
+
+        optimizer = WithdrawalOrderOptimizer(
+            checkpoint,
+            grid_size=args.grid_size,
+            decision_size=args.decision_size,
+            workers=args.workers
+        )
+        with progress.Reporter("Solving:", total=len(optimizer.years)) as reporter:
+            #
+            # The years are solved from death backwards, and the callback comes
+            # before each one, so the years after this one are done.
+            #
+            def callback(age):
+                reporter.update("Solving withdrawals at {}:", age)
+                reporter.completed = optimizer.years[-1].age - age
+            optimizer.solve(callback=callback)
+            hand_coded_path, hand_coded = optimizer.get_hand_coded_path(
+                roth_conversion_amount
+            )
+            optimal_path, optimal, grid = optimizer.get_optimal_path()
+    except KeyboardInterrupt:
+        return
+
+    simulated = None
+    if not simulation.get_needed_to_continue():
+        simulated = simulation.get_total_assets_after_death()
+
+    if args.show_policy:
+        console.print(get_policy_table(hand_coded_path, optimal_path))
+    console.print(get_summary_table(simulated, hand_coded, optimal, grid))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+import memory
+import profiling
+import stats
+import tracing
+
+
+def wrap(function):
+    """
+    Wrap a function that is about to be sent to a worker process, so that the
+    stats, memory report, trace, and profile from the worker make it back to
+    us, for whichever of them are on. When none are, this is the same function.
+    """
+    return stats.wrap(memory.wrap(tracing.wrap(profiling.wrap(function))))
+
+
+def unwrap(result):
+    """
+    Take the result of a wrapped function apart, keeping what it collected, and
+    return the real result.
+    """
+    return memory.unwrap(stats.unwrap(result))
+
+
+def map(executor, function, *iterables):
+    """
+    Like executor.map(), but with the function wrapped (see wrap()).
+    """
+    return (
+        unwrap(result)
+        for result in executor.map(wrap(function), *iterables)
+    )